@@ -1,8 +1,123 @@
 # Class to handle the Redis cache connection and operations for the WishList
 import json
+import time
+import uuid
+from collections import Counter
 
-from core.models import WishListUser
 from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from api.pydantic_models import WishListModel
+from api.rate_limiting import get_limit
+from core.models import WishListUser
+from simplewishlist.db_router import pin_wishlist_to_primary
+
+
+# Increment the version of the wishlist and append the change to the log in one atomic call
+# When the log gets too long, the oldest changes are compacted and the floor keeps the last compacted version:
+# the log is complete only for the versions above the floor
+RECORD_WISHLIST_CHANGE_SCRIPT = """
+local version_key, changes_key, floor_key = KEYS[1], KEYS[2], KEYS[3]
+local initial_version, max_length, timeout, action, data = ARGV[1], tonumber(ARGV[2]), ARGV[3], ARGV[4], ARGV[5]
+
+if redis.call('EXISTS', version_key) == 0 then
+    redis.call('SET', version_key, initial_version)
+end
+local version = redis.call('INCR', version_key)
+
+if redis.call('EXISTS', changes_key) == 0 then
+    redis.call('SET', floor_key, version - 1)
+end
+redis.call('XADD', changes_key, version .. '-0', 'action', action, 'data', data)
+
+local excess = redis.call('XLEN', changes_key) - max_length
+if excess > 0 then
+    local compacted = redis.call('XRANGE', changes_key, '-', '+', 'COUNT', excess)
+    for _, entry in ipairs(compacted) do
+        redis.call('XDEL', changes_key, entry[1])
+    end
+    redis.call('SET', floor_key, string.match(compacted[#compacted][1], '^%d+'))
+end
+
+redis.call('EXPIRE', changes_key, timeout)
+redis.call('EXPIRE', floor_key, timeout)
+return version
+"""
+
+
+# Count a new connection of the user in the room and return the connected users, in one atomic call
+ADD_CONNECTED_USER_SCRIPT = """
+local counts_key, order_key = KEYS[1], KEYS[2]
+local name, timeout = ARGV[1], ARGV[2]
+
+if redis.call('HINCRBY', counts_key, name, 1) == 1 then
+    redis.call('RPUSH', order_key, name)
+end
+
+redis.call('EXPIRE', counts_key, timeout)
+redis.call('EXPIRE', order_key, timeout)
+return redis.call('LRANGE', order_key, 0, -1)
+"""
+
+# Uncount a connection of the user, the user leaves the room with its last connection
+# The room is deleted once empty
+REMOVE_CONNECTED_USER_SCRIPT = """
+local counts_key, order_key = KEYS[1], KEYS[2]
+local name, timeout = ARGV[1], ARGV[2]
+
+if redis.call('HEXISTS', counts_key, name) == 1 then
+    if redis.call('HINCRBY', counts_key, name, -1) <= 0 then
+        redis.call('HDEL', counts_key, name)
+        redis.call('LREM', order_key, 0, name)
+    end
+end
+
+if redis.call('HLEN', counts_key) == 0 then
+    redis.call('DEL', counts_key, order_key)
+    return {}
+end
+
+redis.call('EXPIRE', counts_key, timeout)
+redis.call('EXPIRE', order_key, timeout)
+return redis.call('LRANGE', order_key, 0, -1)
+"""
+
+# Take tokens from several buckets at once, only if all of them have enough tokens (see api.rate_limiting)
+# A bucket is a hash with its tokens and the time they were counted, refilled at rate tokens per second up to burst
+# Return "0" when the tokens were taken, the seconds before they are available otherwise
+ACQUIRE_RATE_LIMIT_TOKENS_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local available, costs = {}, {}
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[i * 3 - 2]), tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local tokens = burst
+    if bucket[1] then
+        tokens = math.min(burst, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+    end
+    available[i], costs[i] = tokens, cost
+    if tokens < cost then
+        retry_after = math.max(retry_after, (cost - tokens) / rate)
+    end
+end
+
+if retry_after > 0 then
+    return tostring(retry_after)
+end
+
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[i * 3 - 2]), tonumber(ARGV[i * 3 - 1])
+    redis.call('HSET', key, 'tokens', tostring(available[i] - costs[i]), 'updated_at', tostring(now))
+    -- Full again by then, the same as a new bucket
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return '0'
+"""
 
 
 class RedisForWishList:
@@ -10,38 +125,203 @@ class RedisForWishList:
 
     def __init__(self):
         self.timeout = 60 * 60 * 24  # 24 hours
+        self.snapshot_timeout = 60 * 60  # 1 hour
+        self.changes_timeout = 60 * 60 * 24 * 7  # 7 days
+        self.changes_max_length = 1000
+
+    # PRESENCE
+    @staticmethod
+    def connected_users_key(room_group_name: str) -> str:
+        # Number of open connections (tabs, devices...) of each connected user
+        return f"{room_group_name}_connected_users"
+
+    @staticmethod
+    def connected_users_order_key(room_group_name: str) -> str:
+        # Connected users in the order they joined the room
+        return f"{room_group_name}_connected_users_order"
+
+    def _run_presence_script(self, script: str, room_group_name: str, current_user: WishListUser) -> list:
+        connection = get_redis_connection("default")
+        presence_script = connection.register_script(script)
+        room_connected_users = presence_script(
+            keys=[
+                cache.make_key(self.connected_users_key(room_group_name)),
+                cache.make_key(self.connected_users_order_key(room_group_name)),
+            ],
+            args=[current_user.name, self.timeout],
+        )
+        return [name.decode() for name in room_connected_users]
 
     def get_currently_connected_users(self, room_group_name: str, current_user: WishListUser) -> list:
         """
         Get the list of currently connected users in the group via Redis
-        Save the user in the group if it is not already in it
+        Save the user in the group if it is not already in it, each connection of the user is counted
         Usernames are unique, so no need to check for duplicates
         """
-        if not cache.get(room_group_name):
-            # If the room does not exist, we create it and add the user
-            room_connected_users = [current_user.name]
-            cache.set(room_group_name, json.dumps(room_connected_users), timeout=self.timeout)
-        else:
-            # If the room exists, we add the user to the list when it is not already in it
-            room_connected_users = json.loads(cache.get(room_group_name))
-            if current_user.name not in room_connected_users:
-                room_connected_users.append(current_user.name)
-                cache.set(room_group_name, json.dumps(room_connected_users), timeout=self.timeout)
-
-        return room_connected_users
+        return self._run_presence_script(ADD_CONNECTED_USER_SCRIPT, room_group_name, current_user)
 
     def remove_user_from_connected_users(self, room_group_name: str, current_user: WishListUser) -> list:
-        """Remove the user from the connected users in the group"""
-        room_connected_users = []
-        if cache.get(room_group_name):
-            # Get the list of connected users and remove the current user
-            room_connected_users = json.loads(cache.get(room_group_name))
-            room_connected_users.remove(current_user.name)
-            if not room_connected_users:
-                # If the room is empty, we delete it
-                cache.delete(room_group_name)
-            else:
-                # If the room is not empty, we update the list of connected users
-                cache.set(room_group_name, json.dumps(room_connected_users), timeout=self.timeout)
-
-        return room_connected_users
+        """
+        Remove a connection of the user from the group
+        The user leaves the list of connected users once all its connections are closed
+        """
+        return self._run_presence_script(REMOVE_CONNECTED_USER_SCRIPT, room_group_name, current_user)
+
+    # RATE LIMITS
+    @staticmethod
+    def rate_limit_key(key: str, message_type: str) -> str:
+        return f"rate_limit_{key}_{message_type}"
+
+    def acquire_rate_limit_tokens(self, key: str, costs: Counter, limits: dict) -> float:
+        """
+        Take the tokens of a message from the buckets of the key shared by all the processes, as RateLimiter.acquire
+
+        Returns:
+            float: 0 when the tokens were taken, the seconds before they are available otherwise
+        """
+        keys, args = [], []
+        for message_type, tokens in costs.items():
+            limit = get_limit(limits, message_type)
+            keys.append(cache.make_key(self.rate_limit_key(key, message_type)))
+            args.extend([limit["rate"], limit["burst"], tokens])
+
+        connection = get_redis_connection("default")
+        acquire_tokens = connection.register_script(ACQUIRE_RATE_LIMIT_TOKENS_SCRIPT)
+        return float(acquire_tokens(keys=keys, args=args))
+
+    # WISHLIST VERSION
+    @staticmethod
+    def wishlist_version_key(wishlist_id: uuid.UUID | str) -> str:
+        return f"wishlist_version_{wishlist_id}"
+
+    @staticmethod
+    def _initial_wishlist_version() -> int:
+        """
+        A version starts from the current timestamp in milliseconds,
+        so that it never goes backwards if the key is lost (eviction, flush...)
+        """
+        return time.time_ns() // 1_000_000
+
+    def get_wishlist_version(self, wishlist_id: uuid.UUID | str, create: bool = True) -> int | None:
+        """
+        Get the current version of the wishlist, the version is created if it does not exist yet (unless create=False)
+        Return None when the cache backend can not store it (e.g. dummy cache)
+        """
+        key = self.wishlist_version_key(wishlist_id)
+        version = cache.get(key)
+        if version is None and create:
+            cache.add(key, self._initial_wishlist_version(), timeout=None)
+            version = cache.get(key)
+        return version
+
+    # WISHLIST SNAPSHOTS
+    @staticmethod
+    def wishlist_snapshot_key(wishlist_id: uuid.UUID, version: int, user_id: uuid.UUID) -> str:
+        # The snapshot depends on who is looking at it (own suggested wishes are hidden, current user first)
+        return f"wishlist_snapshot_{wishlist_id}_{version}_{user_id}"
+
+    def get_wishlist_snapshot(self, wishlist_id: uuid.UUID, version: int, user_id: uuid.UUID) -> WishListModel | None:
+        """Get the wishlist data materialized for this version and this user"""
+        return cache.get(self.wishlist_snapshot_key(wishlist_id, version, user_id))
+
+    def set_wishlist_snapshot(
+        self, wishlist_id: uuid.UUID, version: int, user_id: uuid.UUID, snapshot: WishListModel
+    ) -> None:
+        """Save the wishlist data materialized for this version and this user"""
+        cache.set(self.wishlist_snapshot_key(wishlist_id, version, user_id), snapshot, timeout=self.snapshot_timeout)
+
+    # WISHLIST CHANGES
+    @staticmethod
+    def wishlist_changes_key(wishlist_id: uuid.UUID) -> str:
+        return f"wishlist_changes_{wishlist_id}"
+
+    @staticmethod
+    def wishlist_changes_floor_key(wishlist_id: uuid.UUID) -> str:
+        return f"wishlist_changes_floor_{wishlist_id}"
+
+    def record_wishlist_change(self, wishlist_id: uuid.UUID, action: str, data: dict | None = None) -> int:
+        """
+        Bump the version of the wishlist and append the change to the log of the wishlist
+        Should be called once the change is committed
+
+        Returns:
+            int: The version of the wishlist including this change
+        """
+        # Pinned before the new version is visible, so no snapshot of this version is built from a late replica
+        pin_wishlist_to_primary(wishlist_id)
+
+        connection = get_redis_connection("default")
+        record_change = connection.register_script(RECORD_WISHLIST_CHANGE_SCRIPT)
+        return record_change(
+            keys=[
+                cache.make_key(self.wishlist_version_key(wishlist_id)),
+                cache.make_key(self.wishlist_changes_key(wishlist_id)),
+                cache.make_key(self.wishlist_changes_floor_key(wishlist_id)),
+            ],
+            args=[
+                self._initial_wishlist_version(),
+                self.changes_max_length,
+                self.changes_timeout,
+                action,
+                json.dumps(data),
+            ],
+        )
+
+    def record_wishlist_resync(self, wishlist_id: uuid.UUID) -> None:
+        """
+        Record a change that can not be replayed as a wish change (users, settings...)
+        Clients that missed it need to load the whole wishlist again
+        The change is recorded once the current transaction is committed
+        """
+        transaction.on_commit(lambda: self.record_wishlist_change(wishlist_id, action="resync"))
+
+    def get_wishlist_changes(self, wishlist_id: uuid.UUID, since: int) -> list[dict] | None:
+        """
+        Get the changes of the wishlist recorded after the given version, in order
+
+        Returns:
+            list: The changes as dicts with the version, the action and the data
+            None: If the log is not complete after this version (compacted, expired...)
+        """
+        connection = get_redis_connection("default")
+        with connection.pipeline(transaction=False) as pipeline:
+            pipeline.get(cache.make_key(self.wishlist_changes_floor_key(wishlist_id)))
+            pipeline.xrange(cache.make_key(self.wishlist_changes_key(wishlist_id)), min=f"({max(since, 0)}-0", max="+")
+            floor, entries = pipeline.execute()
+
+        if floor is None or since < int(floor):
+            return None
+
+        return [
+            {
+                "version": int(entry_id.split(b"-")[0]),
+                "action": fields[b"action"].decode(),
+                "data": json.loads(fields[b"data"]),
+            }
+            for entry_id, fields in entries
+        ]
+
+    def get_replayable_wishlist_changes(
+        self, wishlist_id: uuid.UUID, since: int
+    ) -> tuple[int | None, list[dict] | None]:
+        """
+        Get the current version of the wishlist and the wish changes recorded after the given version
+
+        Returns:
+            tuple: The version and the changes, in order.
+            The changes are None when they can not be replayed (compacted log, users or settings changes...):
+            the whole wishlist has to be loaded again
+        """
+        version = self.get_wishlist_version(wishlist_id)
+        if version is None or since > version:
+            return version, None
+
+        changes = self.get_wishlist_changes(wishlist_id, since)
+        if changes is None or any(change["action"] == "resync" for change in changes):
+            return version, None
+
+        # Changes recorded after the version was read are part of the answer
+        if changes:
+            version = max(version, changes[-1]["version"])
+
+        return version, changes
@@ -1,6 +1,9 @@
+from django.db import IntegrityError, transaction
 from django.http import HttpRequest
 from ninja import Router
 
+from api.RedisForWishList import RedisForWishList
+from api.authentication_cache import authentication_cache
 from api.pydantic_models import (
     ErrorMessage,
     WishlistInitModel,
@@ -10,15 +13,19 @@ from api.pydantic_models import (
     WishlistUsersResponse,
     WishlistUserSelectionModel,
     UserAuthenticationModel,
+    WishlistChangesModel,
 )
-from api.utils import get_wishlist_data
+from api.utils import get_wishlist_data, get_wishlist_changes
 from core.models import WishList, WishListUser
 from core.pydantic_models import WishListUserFromModel, WishListSettingHandleUsersData
+from simplewishlist.db_router import pin_wishlist_to_primary, replica_reads
 
 router = Router()
+redis = RedisForWishList()
 
 
 @router.get("/wishlist", response={200: WishListModel}, by_alias=True)
+@replica_reads(lambda request: request.auth.wishlist_id)
 def get_wishlist(request: HttpRequest):
     """
     Get the wishlist for the current user.
@@ -35,8 +42,28 @@ def get_wishlist(request: HttpRequest):
     return 200, data
 
 
+@router.get("/wishlist/changes", response={200: WishlistChangesModel}, by_alias=True)
+def get_wishlist_changes_since(request: HttpRequest, since: int):
+    """
+    Get the changes of the wishlist since a given version, to catch up after a reconnection.
+
+    Args:
+        request (HttpRequest): The HTTP request object containing the current user.
+        since (int): The last version of the wishlist known by the client.
+
+    Returns:
+        WishlistChangesModel: The wish changes after this version,
+        or the whole wishlist if these changes are not available anymore.
+    """
+    current_user = request.auth
+    data = get_wishlist_changes(current_user, since)
+
+    return 200, data
+
+
 # WISHLIST
 @router.get("/wishlist/settings", response={200: WishListSettingsData}, by_alias=True)
+@replica_reads(lambda request: request.auth.wishlist_id)
 def get_wishlist_settings(request: HttpRequest):
     """
     Get the wishlist settings for the current user.
@@ -74,22 +101,21 @@ def create_wishlist(request: HttpRequest, payload: WishlistInitModel):
     if len(payload.other_users_names) == 1 and len(payload.other_users_names[0]) == 0:
         return 400, ErrorMessage(error={"message": "At least one user must be added to the wishlist"})
 
-    # Create the wishlist
-    wishlist = WishList.objects.create(
-        wishlist_name=payload.wishlist_name,
-        is_surprise_mode_enabled=payload.surprise_mode_enabled,
-        show_users=payload.allow_see_assigned,
-    )
+    # Create the wishlist and its users at once, a failure must not leave a wishlist without all its users
+    with transaction.atomic():
+        wishlist = WishList.objects.create(
+            wishlist_name=payload.wishlist_name,
+            is_surprise_mode_enabled=payload.surprise_mode_enabled,
+            show_users=payload.allow_see_assigned,
+        )
 
-    # Add users
-    created_users = []
-    if other_users_names := payload.other_users_names:
-        for user_name in other_users_names:
-            created_user = WishListUser.objects.create(
-                name=user_name,
-                wishlist=wishlist,
-            )
-            created_users.append(created_user)
+        # Add users
+        created_users = WishListUser.objects.bulk_create(
+            [WishListUser(name=user_name, wishlist=wishlist) for user_name in payload.other_users_names or []]
+        )
+
+    # The users choose their name right after the creation, before the replica may have the wishlist
+    pin_wishlist_to_primary(wishlist.id)
 
     # Convert users to response format with wishlist_id
     user_responses = []
@@ -123,6 +149,8 @@ def update_wishlist(request: HttpRequest, payload: WishListSettingsData):
     wishlist.is_surprise_mode_enabled = payload.surprise_mode_enabled
     wishlist.show_users = payload.allow_see_assigned
     wishlist.save()
+    redis.record_wishlist_resync(wishlist.id)
+    authentication_cache.invalidate_wishlist_users(wishlist.id)
 
     return WishListSettingsData(
         wishlist_name=wishlist.wishlist_name,
@@ -132,6 +160,7 @@ def update_wishlist(request: HttpRequest, payload: WishListSettingsData):
 
 
 @router.get("/wishlist/users", response={200: WishListSettingHandleUsersData}, by_alias=True)
+@replica_reads(lambda request: request.auth.wishlist_id)
 def get_wishlist_users(request: HttpRequest):
     """
      Get all the users of the wishlist for the current user.
@@ -183,7 +212,9 @@ def deactivate_user(request: HttpRequest, user_id: str):
     try:
         user = wishlist.wishlist_users.get(id=user_id)
         user.is_active = False
-        user.save()
+        user.save(update_fields=["is_active"])
+        redis.record_wishlist_resync(wishlist.id)
+        authentication_cache.invalidate_users([user.id])
         return 200, user
     except WishListUser.DoesNotExist:
         return 404, {"error": {"message": "User not found"}}
@@ -216,7 +247,9 @@ def activate_user(request: HttpRequest, user_id: str):
     try:
         user = wishlist.wishlist_users.get(id=user_id)
         user.is_active = True
-        user.save()
+        user.save(update_fields=["is_active"])
+        redis.record_wishlist_resync(wishlist.id)
+        authentication_cache.invalidate_users([user.id])
         return 200, user
     except WishListUser.DoesNotExist:
         return 404, {"error": {"message": "User not found"}}
@@ -244,11 +277,15 @@ def add_new_user_to_wishlist(request: HttpRequest, payload: WishListUserCreate):
     """
     current_user = request.auth
 
-    if payload.name in current_user.wishlist.get_users().values_list("name", flat=True):
+    wishlist = current_user.wishlist
+    try:
+        # The names are unique in a wishlist (wishlistuser_unique_name)
+        with transaction.atomic():
+            created_user = WishListUser.objects.create(**payload.dict(), wishlist=wishlist)
+    except IntegrityError:
         return 400, {"error": {"message": "User already exists in the wishlist"}}
 
-    wishlist = current_user.wishlist
-    created_user = WishListUser.objects.create(**payload.dict(), wishlist=wishlist)
+    redis.record_wishlist_resync(wishlist.id)
     return 201, created_user
 
 
@@ -273,20 +310,23 @@ def update_user_in_wishlist(request: HttpRequest, user_id: str, payload: WishLis
     Raises:
         SimpleWishlistValidationError: If there is a validation error during the update of the user.
     """
-    current_user = request.auth
-
-    # Check if the user exists in the wishlist but exclude the user being updated, as the user can keep the same name
-    if payload.name in current_user.wishlist.get_users(exclude_users_ids=[user_id]).values_list("name", flat=True):
-        return 400, {"error": {"message": "User already exists in the wishlist"}}
-
     try:
         user = WishListUser.objects.get(id=user_id)
-        user.name = payload.name
-        user.save()
-        return 200, user
     except WishListUser.DoesNotExist:
         return 404, {"error": {"message": "User not found"}}
 
+    user.name = payload.name
+    try:
+        # The names are unique in a wishlist (wishlistuser_unique_name), the user can keep the same name
+        with transaction.atomic():
+            user.save(update_fields=["name"])
+    except IntegrityError:
+        return 400, {"error": {"message": "User already exists in the wishlist"}}
+
+    redis.record_wishlist_resync(user.wishlist_id)
+    authentication_cache.invalidate_users([user.id])
+    return 200, user
+
 
 # NEW ENDPOINTS FOR WISHLIST-BASED USER SELECTION
 
@@ -297,6 +337,7 @@ def update_user_in_wishlist(request: HttpRequest, user_id: str, payload: WishLis
     auth=None,
     by_alias=True,
 )
+@replica_reads(lambda request, wishlist_id: wishlist_id)
 def get_wishlist_users_for_selection(request: HttpRequest, wishlist_id: str):
     """
     Get users for a wishlist to allow user selection.
@@ -0,0 +1,133 @@
+# Two-tier cache of the authenticated users: process-local first, then Redis, then the database
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from core.models import WishListUser
+
+
+class LocalTTLCache:
+    """Least recently used entries of the process, each entry expires after the timeout (in seconds)"""
+
+    def __init__(self, max_size: int, timeout: float):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        if self.max_size <= 0 or self.timeout <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class AuthenticationCache:
+    """
+    Cache the user of each bearer token (the token is the id of the user) with its wishlist,
+    so that authenticating a request does not query the database
+
+    The entries are deleted when the user or its wishlist change, and the version of the user changes in Redis:
+    the local and the Redis entries are stored with the version read before loading the user, and used only while
+    it is still the version in Redis, so a deactivation is seen at once by every process, even when it is committed
+    between the loading of the user and its caching.
+    """
+
+    def __init__(self):
+        self.timeout = settings.AUTH_CACHE_TIMEOUT
+        self.local_cache = LocalTTLCache(
+            max_size=settings.AUTH_CACHE_LOCAL_MAX_SIZE, timeout=settings.AUTH_CACHE_LOCAL_TIMEOUT
+        )
+
+    @staticmethod
+    def authenticated_user_key(user_id: uuid.UUID | str) -> str:
+        return f"authenticated_user_{user_id}"
+
+    @staticmethod
+    def authenticated_user_version_key(user_id: uuid.UUID | str) -> str:
+        # Changed by every invalidation of the user, None until the first one
+        return f"authenticated_user_version_{user_id}"
+
+    def get_user(self, user_id: uuid.UUID) -> WishListUser:
+        """
+        Get the user with its wishlist
+        Raise Http404 if the user does not exist
+        """
+        key = self.authenticated_user_key(user_id)
+        version_key = self.authenticated_user_version_key(user_id)
+
+        # A local entry is used only while the version of the user in Redis is the one it was cached with
+        local_entry = self.local_cache.get(key)
+        if local_entry is not None:
+            version, user = local_entry
+            if cache.get(version_key) == version:
+                # Copied, so that concurrent requests never share (and modify) the same instance
+                return copy.deepcopy(user)
+
+        # The version is read with the entry: a change committed afterwards gives another version
+        cached = cache.get_many([version_key, key])
+        version, entry = cached.get(version_key), cached.get(key)
+        if entry is not None and entry[0] == version:
+            user = entry[1]
+        else:
+            user = get_object_or_404(WishListUser.objects.select_related("wishlist"), id=user_id)
+            cache.set(key, (version, user), timeout=self.timeout)
+
+        self.local_cache.set(key, (version, copy.deepcopy(user)))
+        return user
+
+    def invalidate_users(self, user_ids: Iterable[uuid.UUID | str]) -> None:
+        """Delete the cached users and change their version once the current transaction is committed"""
+        user_ids = list(user_ids)
+        transaction.on_commit(lambda: self._delete(user_ids))
+
+    def invalidate_wishlist_users(self, wishlist_id: uuid.UUID) -> None:
+        """Delete the cached users of the wishlist, when the wishlist itself changes"""
+        user_ids = WishListUser.objects.filter(wishlist_id=wishlist_id).values_list("id", flat=True)
+        self.invalidate_users(list(user_ids))
+
+    def _delete(self, user_ids: list[uuid.UUID | str]) -> None:
+        keys = [self.authenticated_user_key(user_id) for user_id in user_ids]
+        self.local_cache.delete_many(keys)
+        cache.delete_many(keys)
+        # Changed once the entries are deleted: a process reading the new version can not read the old entry anymore
+        # Kept longer than the entries, an entry cached with the previous version never sees that version again
+        version = uuid.uuid4().hex
+        cache.set_many(
+            {self.authenticated_user_version_key(user_id): version for user_id in user_ids}, self.timeout * 2
+        )
+
+
+authentication_cache = AuthenticationCache()
@@ -0,0 +1,118 @@
+# Coalescing of the wish updates broadcast to the wishlist rooms
+import asyncio
+import logging
+from collections import Counter
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Send a message to the room: (type, action, data, user_token, seq)
+SendGroupMessage = Callable[..., Awaitable[None]]
+
+
+def get_updated_wish_id(change: dict) -> str:
+    if change["action"] == "delete_wish":
+        return change["data"]["wishId"]
+    return change["data"]["wish"]["id"]
+
+
+class RoomBuffer:
+    """Updates of a room waiting to be sent, the latest one of each wish"""
+
+    def __init__(self, send_group_message: SendGroupMessage, first_update_at: float):
+        self.send_group_message = send_group_message
+        self.first_update_at = first_update_at
+        self.updates = {}
+        self.flush_handle = None
+
+
+class BroadcastCoalescer:
+    """
+    Merge the updates of the same wish sent to a room within a window, and send them in one message
+
+    The window restarts with every update of the room (window_ms), but the first update waiting is never delayed
+    more than max_delay_ms, so a room that keeps changing still receives its updates.
+    Only the updates sent by the consumers of this process are merged.
+    """
+
+    def __init__(self):
+        self.rooms: dict[str, RoomBuffer] = {}
+        self._flush_tasks = set()
+        # updates: updates received, messages: group messages sent instead
+        self.metrics = Counter()
+
+    def add(
+        self,
+        room_group_name: str,
+        change: dict,
+        user_token: str,
+        send_group_message: SendGroupMessage,
+        window_ms: int,
+        max_delay_ms: int,
+    ) -> None:
+        """Keep the change (action, data, seq) until the window of the room is over"""
+        loop = asyncio.get_running_loop()
+        room = self.rooms.get(room_group_name)
+        if room is None:
+            room = self.rooms[room_group_name] = RoomBuffer(send_group_message, first_update_at=loop.time())
+
+        wish_id = get_updated_wish_id(change)
+        update = {**change, "userToken": user_token}
+        previous_update = room.updates.get(wish_id)
+        if previous_update and previous_update["action"] == "create_wish" and change["action"] != "delete_wish":
+            # The members have not received the wish yet, they receive it created with its latest data
+            update["action"] = "create_wish"
+        room.updates[wish_id] = update
+        # The latest sender sends the message
+        room.send_group_message = send_group_message
+        self.metrics["updates"] += 1
+
+        if room.flush_handle is not None:
+            room.flush_handle.cancel()
+        flush_at = min(loop.time() + window_ms / 1000, room.first_update_at + max_delay_ms / 1000)
+        room.flush_handle = loop.call_at(flush_at, self._schedule_flush, room_group_name)
+
+    def _schedule_flush(self, room_group_name: str) -> None:
+        task = asyncio.ensure_future(self.flush(room_group_name))
+        # Keep a reference to the task until it is done
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # The updates of the room are lost, its members get them on their next reconnection
+            self.metrics["failed_flushes"] += 1
+            logger.error("Could not send the coalesced updates", exc_info=task.exception())
+
+    async def flush(self, room_group_name: str) -> None:
+        """Send the updates of the room: as usual if there is only one, in one updated_wishes message otherwise"""
+        room = self.rooms.pop(room_group_name, None)
+        if room is None:
+            return
+        if room.flush_handle is not None:
+            room.flush_handle.cancel()
+
+        updates = list(room.updates.values())
+        self.metrics["messages"] += 1
+        if len(updates) == 1:
+            update = updates[0]
+            await room.send_group_message(
+                "updated_wish", update["action"], update["data"], user_token=update["userToken"], seq=update["seq"]
+            )
+        else:
+            await room.send_group_message("updated_wishes", "coalesced", updates, user_token=updates[-1]["userToken"])
+
+    def get_metrics(self) -> dict:
+        """Number of updates received, of messages sent, of messages saved by the coalescing, and of failed sends"""
+        # Each room waiting sends one more message
+        return {
+            "updates": self.metrics["updates"],
+            "messages": self.metrics["messages"],
+            "messages_saved": self.metrics["updates"] - self.metrics["messages"] - len(self.rooms),
+            "pending_rooms": len(self.rooms),
+            "failed_flushes": self.metrics["failed_flushes"],
+        }
+
+
+broadcast_coalescer = BroadcastCoalescer()
@@ -1,136 +1,321 @@
-from asgiref.sync import async_to_sync
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import SyncToAsync, sync_to_async
 from channels.exceptions import StopConsumer
-from channels.generic.websocket import JsonWebsocketConsumer
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from django.db import close_old_connections, transaction
 from django.shortcuts import get_object_or_404
+from redis.exceptions import RedisError
 
 from api.RedisForWishList import RedisForWishList
+from api.coalescing import broadcast_coalescer
 from api.exceptions import SimpleWishlistValidationError
+from api.rate_limiting import (
+    RateLimiter,
+    format_retry_after,
+    get_message_costs,
+    get_over_burst,
+    rate_limit_metrics,
+    wishlist_rate_limiter,
+)
 from api.pydantic_models import (
     WishModelUpdate,
     WebhookPayloadModel,
     WishModel,
     WishModelUpdateAssignUser,
-    WishListWishModel,
     UserWishDataModel,
     UserDeletedWishDataModel,
 )
-from api.utils import do_update_wish
+from api.utils import do_update_wish, do_assign_wish, build_wish_model, get_wishlist_data_and_version
 from core.models import WishListUser, Wish
 
+# Bounded pool of threads running the database work of all the consumers of the process
+# (channels' database_sync_to_async runs everything on a single thread)
+db_executor = ThreadPoolExecutor(max_workers=settings.WEBSOCKET_DB_THREADS, thread_name_prefix="wishlist-db")
+
+
+class DatabaseExecutorSyncToAsync(SyncToAsync):
+    """
+    Run the function in the database executor and clean up the obsolete connections of the thread when it exits
+    Same as channels' DatabaseSyncToAsync, but the connections always belong to the executor threads
+    """
+
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False, executor=db_executor)
+
+    def thread_handler(self, loop, *args, **kwargs):
+        close_old_connections()
+        try:
+            return super().thread_handler(loop, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+database_sync_to_async = DatabaseExecutorSyncToAsync
+
+# Close code of the connections whose client fell behind: the client reconnects with its last sequence number
+RESYNC_CLOSE_CODE = 4000
+
+# Frames dropped and connections evicted because their client did not read them fast enough, in this process
+outbound_metrics = Counter()
+
 
-class WishlistConsumer(JsonWebsocketConsumer):
+def get_outbound_metrics() -> dict:
+    """Number of connections evicted for falling behind, and of frames they did not receive"""
+    return {"evicted": outbound_metrics["evicted"], "dropped": outbound_metrics["dropped"]}
+
+
+class WishlistConsumer(AsyncJsonWebsocketConsumer):
     current_user = None
     wishlist = None
     room_group_name = None
     redis = RedisForWishList()
-
-    def connect(self):
+    # Frames waiting to be written to the socket by the writer task, and whether the client fell behind
+    outbound_queue = None
+    outbound_writer = None
+    evicted = False
+    # Buckets of the messages sent by the client
+    rate_limiter = None
+
+    async def connect(self):
         """On connect, we get the user from the URL and join the group with the wishlist id"""
         # If the user is not found, we close the connection
         try:
-            self.current_user = WishListUser.objects.get(pk=self.scope["url_route"]["kwargs"]["wishlist_user"])
+            self.current_user = await database_sync_to_async(WishListUser.objects.select_related("wishlist").get)(
+                pk=self.scope["url_route"]["kwargs"]["wishlist_user"]
+            )
 
             self.wishlist = self.current_user.wishlist
 
             self.room_group_name = f"wishlist_{self.wishlist.id}"
+            self.rate_limiter = RateLimiter()
 
             # Join room group
-            async_to_sync(self.channel_layer.group_add)(self.room_group_name, self.channel_name)
+            await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+
+            await self.accept("authorization")
 
-            self.accept("authorization")
+            query = parse_qs(self.scope.get("query_string", b"").decode())
+            if query.get("snapshot") == ["1"]:
+                # The client gets the whole wishlist as the first message, instead of loading it from the API
+                await self.send_snapshot()
+            elif "last_seq" in query:
+                # A reconnecting client gets the wish changes it missed since the last sequence number it received
+                await self.replay_changes(query["last_seq"][0])
 
             # Alert the group that a new user has connected
-            room_connected_users = self.redis.get_currently_connected_users(self.room_group_name, self.current_user)
-            self.send_group_message(
+            room_connected_users = await sync_to_async(
+                self.redis.get_currently_connected_users, thread_sensitive=False
+            )(self.room_group_name, self.current_user)
+            await self.send_group_message(
                 "new_group_member_connection",
                 "new_group_member_connection",
                 room_connected_users,
             )
 
         except WishListUser.DoesNotExist:
-            self.close(reason="User not found")
+            await self.close(reason="User not found")
+
+    async def send_snapshot(self):
+        """
+        Send the wishlist as get_wishlist would, with its version as sequence number
+        The group was joined before building the snapshot: the changes sent to the group afterwards may already be
+        in the snapshot, clients ignore the sequence numbers they already have
+        """
+        version, data = await database_sync_to_async(get_wishlist_data_and_version)(self.current_user)
+        await self.send_individual_message(
+            {"type": "wishlist_snapshot", "data": data.model_dump(by_alias=True, mode="json"), "seq": version}
+        )
 
-    def disconnect(self, close_code):
+    async def replay_changes(self, last_seq: str):
+        """
+        Send the changes recorded after last_seq, as they were sent to the group
+        When they can not be replayed (too old, users or settings changes...) send "resync": the client has to load
+        the whole wishlist again. The group was joined before reading the changes: a change can be received twice,
+        clients ignore the sequence numbers they already have
+        """
+        try:
+            version, changes = await sync_to_async(self.redis.get_replayable_wishlist_changes, thread_sensitive=False)(
+                self.wishlist.id, int(last_seq)
+            )
+        except ValueError:
+            version, changes = None, None
+
+        if changes is None:
+            await self.send_individual_message({"type": "resync", "seq": version})
+            return
+
+        for change in changes:
+            await self.send_individual_message(
+                {
+                    "type": "updated_wish",
+                    "data": change["data"],
+                    "userToken": None,
+                    "action": change["action"],
+                    "seq": change["version"],
+                }
+            )
+
+    async def disconnect(self, close_code):
         """On disconnect, we leave the group"""
+        if self.current_user is None:
+            # The connection was refused
+            raise StopConsumer()
+
         # Handle user disconnection follow up
-        room_connected_users = self.redis.remove_user_from_connected_users(self.room_group_name, self.current_user)
+        room_connected_users = await sync_to_async(self.redis.remove_user_from_connected_users, thread_sensitive=False)(
+            self.room_group_name, self.current_user
+        )
 
         # Send the updated list of connected users to the group
-        self.send_group_message(
+        await self.send_group_message(
             "group_member_disconnected",
             "group_member_disconnected",
             room_connected_users,
         )
 
+        if self.outbound_writer is not None:
+            self.outbound_writer.cancel()
+
         # Leave room group
-        async_to_sync(self.channel_layer.group_discard)(self.room_group_name, self.channel_name)
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
         raise StopConsumer()
 
-    def receive_json(self, content: dict, **kwargs):
+    async def receive_json(self, content: dict, **kwargs):
         """Receive a message from the group and process it"""
         try:
             # Validate the payload
             payload = WebhookPayloadModel.model_validate(content)
 
+            retry_after = await self.acquire_rate_limit_tokens(payload)
+            if retry_after:
+                await self.send_individual_message(
+                    {
+                        "type": "error_message",
+                        "data": f"Too many messages, try again in {format_retry_after(retry_after)} seconds",
+                    }
+                )
+                return
+
             match payload.type:
                 case "update_wish":
-                    self.update_wish(payload)
+                    await self.update_wish(payload)
                 case "create_wish":
-                    self.create_wish(payload)
+                    await self.create_wish(payload)
                 case "delete_wish":
-                    self.delete_wish(payload)
+                    await self.delete_wish(payload)
+                case "batch":
+                    await self.batch(payload)
                 case _:
-                    self.send_individual_message({"type": "error_message", "data": "Invalid action"})
+                    await self.send_individual_message({"type": "error_message", "data": "Invalid action"})
 
         except SimpleWishlistValidationError as e:
-            self.send_individual_message({"type": "error_message", "data": str(e)})
+            await self.send_individual_message({"type": "error_message", "data": str(e)})
         except Exception as e:
-            self.send_individual_message({"type": "error_message", "data": str(e)})
+            await self.send_individual_message({"type": "error_message", "data": str(e)})
+
+    async def acquire_rate_limit_tokens(self, payload: WebhookPayloadModel) -> float:
+        """
+        Take the tokens of the message from the buckets of the connection and of the wishlist
+        Return 0 when the message can be processed, the seconds before it can be otherwise
+        Raise a SimpleWishlistValidationError when it costs more than a burst, it could never be processed
+        """
+        if not settings.WEBSOCKET_RATE_LIMITING:
+            return 0
+
+        operation_types = [operation.type for operation in payload.operations or []]
+        costs = get_message_costs(payload.type, operation_types)
+
+        # Waiting would not help a message bigger than the burst: it is refused without taking any token
+        over_burst = get_over_burst(
+            costs, settings.WEBSOCKET_CONNECTION_RATE_LIMITS, settings.WEBSOCKET_WISHLIST_RATE_LIMITS
+        )
+        if over_burst:
+            rate_limit_metrics["over_burst"] += 1
+            raise SimpleWishlistValidationError(
+                "Too many operations in the batch, at most "
+                + ", ".join(f"{burst} {message_type}" for message_type, burst in over_burst.items())
+            )
+
+        # The tokens of the connection are taken only if the wishlist has enough tokens too
+        retry_after = self.rate_limiter.get_retry_after(
+            self.channel_name, costs, settings.WEBSOCKET_CONNECTION_RATE_LIMITS
+        )
+        if retry_after:
+            rate_limit_metrics["connection"] += 1
+            return retry_after
+
+        wishlist_key = str(self.wishlist.id)
+        if settings.WEBSOCKET_GLOBAL_RATE_LIMITS:
+            try:
+                retry_after = await sync_to_async(self.redis.acquire_rate_limit_tokens, thread_sensitive=False)(
+                    wishlist_key, costs, settings.WEBSOCKET_WISHLIST_RATE_LIMITS
+                )
+            except RedisError:
+                # Limited by this process only while Redis is unavailable
+                retry_after = wishlist_rate_limiter.acquire(
+                    wishlist_key, costs, settings.WEBSOCKET_WISHLIST_RATE_LIMITS
+                )
+        else:
+            retry_after = wishlist_rate_limiter.acquire(wishlist_key, costs, settings.WEBSOCKET_WISHLIST_RATE_LIMITS)
+        if retry_after:
+            rate_limit_metrics["wishlist"] += 1
+            return retry_after
 
-    def update_wish(self, payload: WebhookPayloadModel):
+        return self.rate_limiter.acquire(self.channel_name, costs, settings.WEBSOCKET_CONNECTION_RATE_LIMITS)
+
+    async def update_wish(self, payload: WebhookPayloadModel):
         """Assign a wish to a user and send the updated wishes to the group"""
+        change = await database_sync_to_async(self._update_wish)(payload)
+
+        # Send the updated wishes to the groups
+        await self._send_updated_wish(change)
+
+    def _update_wish(self, payload: WebhookPayloadModel) -> dict:
+        """Update the wish in the database and return the change to send to the group"""
         # We need to check if the only field is the assigned_user, meaning that we are changing the assigned user
         changing_assigned_user = list(payload.post_values.keys()) == ["assignedUser"]
         if changing_assigned_user:
             # If the only field is the assigned_user, we can use the WishModelUpdateAssignUser
             wish_payload = WishModelUpdateAssignUser.model_validate(payload.post_values)
+            # The check and the write are done at once, if someone else took the wish first this raises an error
+            updated_wish = do_assign_wish(self.current_user, payload.object_id, wish_payload)
         else:
             wish_payload = WishModelUpdate.model_validate(payload.post_values)
-
-        # Update the wish => if the assigned_user is changing, we need to keep the None values
-        updated_wish = do_update_wish(
-            self.current_user, payload.object_id, wish_payload, exclude_unset=not changing_assigned_user
-        )
+            updated_wish = do_update_wish(self.current_user, payload.object_id, wish_payload)
 
         # When we un-assign a deleted wish, this is a permanent deletion
-        # and the wish was completely deleted during do_update_wish
-        if changing_assigned_user and updated_wish.deleted:
-            # Prepare data in case the wish was deleted
-            deleted_wish_data = {
-                "wish_id": payload.object_id,
-                "wish_user_name": updated_wish.wishlist_user.name,
-                "assigned_user": None,
-            }
-            # Try to update, if the object no longer exists, it will return None
-            try:
-                updated_wish = updated_wish.refresh_from_db()
-            except Wish.DoesNotExist:
-                self._send_updated_wish(
-                    wish=None,  # handle delete cases with just the wish_id (it will be displayed as deleted)
-                    action="delete_wish",
-                    deleted_wish_data=deleted_wish_data,
-                )
-                return
+        # and the wish was completely deleted during do_assign_wish
+        if changing_assigned_user and updated_wish.deleted and updated_wish.assigned_user is None:
+            return self._prepare_updated_wish(
+                wish=None,  # handle delete cases with just the wish_id (it will be displayed as deleted)
+                action="delete_wish",
+                deleted_wish_data={
+                    "wish_id": payload.object_id,
+                    "wish_user_name": updated_wish.wishlist_user.name,
+                    "assigned_user": None,
+                },
+            )
 
         action = "update_wish"
         if wish_payload.dict()["assigned_user"] is not None:
             action = "change_wish_assigned_user"
 
-        # Send the updated wishes to the groups
-        self._send_updated_wish(wish=updated_wish, action=action)
+        return self._prepare_updated_wish(wish=updated_wish, action=action)
 
-    def create_wish(self, payload: WebhookPayloadModel):
+    async def create_wish(self, payload: WebhookPayloadModel):
         """Create a wish and send the updated wishes to the group"""
+        change = await database_sync_to_async(self._create_wish)(payload)
+
+        # Send the updated wishes to the groups
+        await self._send_updated_wish(change)
+
+    def _create_wish(self, payload: WebhookPayloadModel) -> dict:
+        """Create the wish in the database and return the change to send to the group"""
         wish_payload = WishModel.model_validate(payload.post_values)
 
         # Determine if this is a suggested wish
@@ -149,11 +334,17 @@ class WishlistConsumer(JsonWebsocketConsumer):
 
         created_wish = Wish.objects.create(**wish_data)
 
-        # Send the updated wishes to the groups
-        self._send_updated_wish(wish=created_wish, action="create_wish")
+        return self._prepare_updated_wish(wish=created_wish, action="create_wish")
 
-    def delete_wish(self, payload: WebhookPayloadModel):
+    async def delete_wish(self, payload: WebhookPayloadModel):
         """Delete a wish and send the updated wishes to the group"""
+        change = await database_sync_to_async(self._delete_wish)(payload)
+
+        # Send the updated wishes to the groups
+        await self._send_updated_wish(change)
+
+    def _delete_wish(self, payload: WebhookPayloadModel) -> dict:
+        """Delete the wish in the database and return the change to send to the group"""
         instance = get_object_or_404(Wish, pk=payload.object_id)
         wish_user_name = instance.wishlist_user.name
         assigned_user = instance.assigned_user.name if instance.assigned_user else None
@@ -164,15 +355,67 @@ class WishlistConsumer(JsonWebsocketConsumer):
 
         instance.mark_deleted()
 
-        # Send the updated wishes to the groups
-        self._send_updated_wish(
+        return self._prepare_updated_wish(
             wish=None,  # handle delete cases with just the wish_id (it will be displayed as deleted)
             action="delete_wish",
             deleted_wish_data=deleted_wish_data,
         )
 
-    def _send_updated_wish(self, wish: Wish | None, action: str = "update_wish", deleted_wish_data: dict = None):
-        """Send the updated wishes to the group"""
+    async def batch(self, payload: WebhookPayloadModel):
+        """Apply several operations at once and send all the updated wishes to the group in one message"""
+        updated_wishes = await database_sync_to_async(self._batch)(payload)
+
+        # The older updates of the room still waiting to be coalesced are sent first, so that none of them
+        # overwrites the batch on the members
+        await broadcast_coalescer.flush(self.room_group_name)
+
+        # Send the updated wishes to the groups
+        await self.send_group_message("updated_wishes", "batch", updated_wishes)
+
+    def _batch(self, payload: WebhookPayloadModel) -> list[dict]:
+        """
+        Apply the operations of the batch in one transaction: if one of them fails, none is applied
+        Return the change of each operation, in order
+        """
+        # Validate all the operations before touching the database
+        for operation in payload.operations:
+            self._validate_operation(operation)
+
+        updated_wishes = []
+        with transaction.atomic():
+            for operation in payload.operations:
+                match operation.type:
+                    case "update_wish":
+                        updated_wishes.append(self._update_wish(operation))
+                    case "create_wish":
+                        updated_wishes.append(self._create_wish(operation))
+                    case "delete_wish":
+                        updated_wishes.append(self._delete_wish(operation))
+
+        return updated_wishes
+
+    @staticmethod
+    def _validate_operation(operation: WebhookPayloadModel) -> None:
+        """Validate the values of an operation, as its handler would"""
+        match operation.type:
+            case "update_wish":
+                if list(operation.post_values.keys()) == ["assignedUser"]:
+                    WishModelUpdateAssignUser.model_validate(operation.post_values)
+                else:
+                    WishModelUpdate.model_validate(operation.post_values)
+            case "create_wish":
+                WishModel.model_validate(operation.post_values)
+
+        if operation.type != "create_wish" and operation.object_id is None:
+            raise SimpleWishlistValidationError(model="Wish", field="objectId", message="objectId is required")
+
+    def _prepare_updated_wish(
+        self, wish: Wish | None, action: str = "update_wish", deleted_wish_data: dict = None
+    ) -> dict:
+        """
+        Serialize the updated wish for the group and keep the change in the wishlist change log
+        Return the change: its action, its data and its sequence number in the room (the version of the wishlist)
+        """
         if action == "delete_wish":
             user_wish_data = UserDeletedWishDataModel(
                 user=deleted_wish_data["wish_user_name"],
@@ -180,45 +423,119 @@ class WishlistConsumer(JsonWebsocketConsumer):
                 assigned_user=deleted_wish_data["assigned_user"],
             )
         else:
-            wish_data = WishListWishModel(
-                name=wish.name,
-                price=wish.price or None,
-                description=wish.description or None,
-                url=wish.url or None,
-                id=wish.id,
-                assigned_user=wish.assigned_user.name if wish.assigned_user else None,
-                deleted=wish.deleted,
-                suggested_by=wish.suggested_by.name if wish.suggested_by else None,
-            )
+            wish_data = build_wish_model(wish)
             user_wish_data = UserWishDataModel(user=wish.wishlist_user.name, wish=wish_data)
 
         user_wish_data_dumped = user_wish_data.model_dump(by_alias=True, mode="json")
 
-        self.send_group_message("updated_wish", action, user_wish_data_dumped)
+        change = {"action": action, "data": user_wish_data_dumped, "seq": None}
+
+        def record_change():
+            # Keep the change so that clients can catch up after a reconnection, once it is committed
+            change["seq"] = self.redis.record_wishlist_change(self.wishlist.id, action, user_wish_data_dumped)
+
+        transaction.on_commit(record_change)
+
+        return change
+
+    async def _send_updated_wish(self, change: dict):
+        """Send the updated wishes to the group, merged with the next updates of the room when coalescing"""
+        if settings.WEBSOCKET_COALESCING_WINDOW_MS > 0:
+            broadcast_coalescer.add(
+                self.room_group_name,
+                change,
+                self.current_user.name,
+                self.send_group_message,
+                window_ms=settings.WEBSOCKET_COALESCING_WINDOW_MS,
+                max_delay_ms=settings.WEBSOCKET_COALESCING_MAX_DELAY_MS,
+            )
+        else:
+            await self.send_group_message("updated_wish", change["action"], change["data"], seq=change["seq"])
 
     # RESPONSES
-    def send_group_message(self, type: str, action: str, data: dict | list | str):
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """
+        Queue the frame for the writer task of the connection: a client that stops reading its socket does not stop
+        the consumer from receiving the group messages, so they do not pile up in the channel layer for the whole group
+        When WEBSOCKET_OUTBOUND_QUEUE_SIZE frames are already waiting, the client is evicted
+        """
+        if self.evicted:
+            return
+        if self.outbound_queue is None:
+            self.outbound_queue = asyncio.Queue(maxsize=settings.WEBSOCKET_OUTBOUND_QUEUE_SIZE)
+            self.outbound_writer = asyncio.ensure_future(self.write_outbound_frames())
+
+        try:
+            self.outbound_queue.put_nowait((text_data, bytes_data, close))
+        except asyncio.QueueFull:
+            await self.evict()
+
+    async def write_outbound_frames(self):
+        """Write the queued frames to the socket, waiting for the client to read them"""
+        while True:
+            text_data, bytes_data, close = await self.outbound_queue.get()
+            try:
+                await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+            except Exception:
+                # The connection is gone, the consumer gets the disconnection
+                return
+
+    async def evict(self):
+        """
+        Close the connection of a client that fell behind with RESYNC_CLOSE_CODE, dropping the frames it did not get
+        It reconnects with the last sequence number it received, and gets the missed changes or a resync
+        """
+        self.evicted = True
+        outbound_metrics["evicted"] += 1
+        # The frames waiting and the one that did not fit
+        outbound_metrics["dropped"] += self.outbound_queue.qsize() + 1
+        self.outbound_writer.cancel()
+
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.close(code=RESYNC_CLOSE_CODE, reason="resync")
+
+    async def send_group_message(
+        self, type: str, action: str, data: dict | list | str, user_token: str = None, seq: int = None
+    ):
         """
         Send a message to the group with the given type and data
         The type is the name of the method to call in the consumer
+        The user token is the name of the user at the origin of the message, the current user by default
+        The sequence number orders the wish changes of the room, clients send the last one they got when reconnecting
         """
-        async_to_sync(self.channel_layer.group_send)(
-            self.room_group_name,
-            {"type": type, "data": data, "userToken": self.current_user.name, "action": action},
-        )
+        message = {"type": type, "data": data, "userToken": user_token or self.current_user.name, "action": action}
+        if seq is not None:
+            message["seq"] = seq
+        if settings.WEBSOCKET_PRE_ENCODED_BROADCASTS:
+            # Encode the message once here, the consumers of the group forward the text as is
+            message = {"type": type, "text": await self.encode_json(message)}
+
+        await self.channel_layer.group_send(self.room_group_name, message)
 
-    def send_individual_message(self, content: dict):
+    async def send_individual_message(self, content: dict):
         # Use to send a message to the individual user and not the group
-        self.send_json(content=content)
+        # Through send, not send_json: the frame waits in the outbound queue like the others
+        await self.send(text_data=await self.encode_json(content))
+
+    async def send_group_event(self, content: dict):
+        """Forward a message received from the group to the user"""
+        if "text" in content:
+            # Already encoded by the sender
+            await self.send(text_data=content["text"])
+        else:
+            await self.send_individual_message(content)
+
+    async def updated_wish(self, content: dict):
+        await self.send_group_event(content)
 
-    def updated_wish(self, content: dict):
-        self.send_individual_message(content)
+    async def updated_wishes(self, content: dict):
+        await self.send_group_event(content)
 
-    def error_message(self, content: dict):
-        self.send_individual_message(content)
+    async def error_message(self, content: dict):
+        await self.send_individual_message(content)
 
-    def new_group_member_connection(self, content: dict):
-        self.send_individual_message(content)
+    async def new_group_member_connection(self, content: dict):
+        await self.send_group_event(content)
 
-    def group_member_disconnected(self, content: dict):
-        self.send_individual_message(content)
+    async def group_member_disconnected(self, content: dict):
+        await self.send_group_event(content)
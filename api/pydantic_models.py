@@ -1,14 +1,30 @@
 import collections
-from typing import Any, Optional
+import uuid
+from typing import Annotated, Any, Optional
 
 from ninja import Schema
 from ninja.schema import DjangoGetter
-from pydantic import UUID4, model_validator, AnyUrl, field_validator, field_serializer
+from pydantic import AfterValidator, model_validator, AnyUrl, field_validator, field_serializer
 from pydantic.alias_generators import to_camel
 from pydantic_core import PydanticCustomError
 from pydantic_core.core_schema import ValidationInfo
 
 
+# Websocket operations that can be sent together in a batch
+BATCH_OPERATION_TYPES = ("create_wish", "update_wish", "delete_wish")
+BATCH_MAX_OPERATIONS = 100
+
+
+def validate_id_version(value: uuid.UUID) -> uuid.UUID:
+    if value.version not in (4, 7):
+        raise PydanticCustomError("uuid_version", "UUID version 4 or 7 expected")
+    return value
+
+
+# The ids of the rows: UUIDv4 for the rows created before UUIDv7 became the default
+ModelUUID = Annotated[uuid.UUID, AfterValidator(validate_id_version)]
+
+
 class BaseSchema(Schema):
     class Config(Schema.Config):
         populate_by_name = True
@@ -41,7 +57,7 @@ class WishListWishModel(BaseSchema):
     price: Optional[str] = None
     url: Optional[AnyUrl] = None
     description: Optional[str] = None
-    id: Optional[UUID4] = None
+    id: Optional[ModelUUID] = None
     assigned_user: Optional[str] = None
     suggested_by: Optional[str] = None
 
@@ -60,7 +76,7 @@ class WishModel(BaseSchema):
     price: Optional[str] = None
     url: Optional[AnyUrl] = None
     description: Optional[str] = None
-    suggested_for_user_id: Optional[UUID4] = None
+    suggested_for_user_id: Optional[ModelUUID] = None
 
     @field_validator("url", mode="before")
     @classmethod
@@ -130,12 +146,12 @@ class UserWishDataModel(BaseSchema):
 
 class UserDeletedWishDataModel(BaseSchema):
     user: str
-    wish_id: UUID4
+    wish_id: ModelUUID
     assigned_user: Optional[str] = None
 
 
 class WishListModel(BaseSchema):
-    wishlist_id: UUID4
+    wishlist_id: ModelUUID
     name: str
     surprise_mode_enabled: bool
     allow_see_assigned: bool
@@ -143,6 +159,25 @@ class WishListModel(BaseSchema):
     user_wishes: list[WishListUserModel]
 
 
+class WishlistChangeModel(BaseSchema):
+    """A change of the wishlist, as it was sent to the websocket group"""
+
+    version: int
+    action: str
+    data: UserWishDataModel | UserDeletedWishDataModel
+
+
+class WishlistChangesModel(BaseSchema):
+    """
+    The changes of the wishlist since a given version
+    When the changes are not available anymore, the whole wishlist is sent instead
+    """
+
+    version: int
+    changes: list[WishlistChangeModel] = []
+    snapshot: Optional[WishListModel] = None
+
+
 class WishListSettingsData(BaseSchema):
     wishlist_name: str
     surprise_mode_enabled: bool
@@ -166,17 +201,41 @@ class ErrorMessage(Schema):
 
 class WebhookPayloadModel(BaseSchema):
     type: str
-    currentUser: UUID4
+    currentUser: ModelUUID
     post_values: Optional[dict] = {}
-    object_id: Optional[UUID4] = None
+    object_id: Optional[ModelUUID] = None
+    # For the batch type, the operations applied together
+    operations: Optional[list["WebhookPayloadModel"]] = None
 
     # todo validate if post_values is not None, then objectId should not be None
 
+    @model_validator(mode="after")
+    def batch_operations_validate(self):
+        if self.type != "batch":
+            return self
+
+        if not self.operations:
+            raise PydanticCustomError("empty_batch", "A batch needs at least one operation")
+        if len(self.operations) > BATCH_MAX_OPERATIONS:
+            raise PydanticCustomError(
+                "batch_too_long",
+                "A batch can not have more than {max_operations} operations",
+                dict(max_operations=BATCH_MAX_OPERATIONS),
+            )
+        invalid_types = [operation.type for operation in self.operations if operation.type not in BATCH_OPERATION_TYPES]
+        if invalid_types:
+            raise PydanticCustomError(
+                "invalid_batch_operation",
+                "Invalid batch operations: {invalid_types}",
+                dict(invalid_types=", ".join(invalid_types)),
+            )
+        return self
+
 
 class WishlistUserSelectionModel(BaseSchema):
     """Model for a user that can be selected for a wishlist"""
 
-    id: UUID4
+    id: ModelUUID
     name: str
     is_active: bool
 
@@ -184,7 +243,7 @@ class WishlistUserSelectionModel(BaseSchema):
 class WishlistUsersResponse(BaseSchema):
     """Response model for getting users of a wishlist"""
 
-    wishlist_id: UUID4
+    wishlist_id: ModelUUID
     wishlist_name: str
     users: list[WishlistUserSelectionModel]
 
@@ -192,4 +251,4 @@ class WishlistUsersResponse(BaseSchema):
 class UserAuthenticationModel(BaseSchema):
     """Model for user authentication with wishlist"""
 
-    user_id: UUID4
+    user_id: ModelUUID
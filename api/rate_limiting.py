@@ -0,0 +1,122 @@
+# Token buckets limiting the messages sent by the websocket clients, per connection and per wishlist
+import math
+import time
+from collections import Counter
+
+# Idle buckets are forgotten at most once every this many seconds
+FORGET_IDLE_BUCKETS_INTERVAL = 60
+
+# Messages refused, by limit (connection, wishlist, over_burst)
+rate_limit_metrics = Counter()
+
+
+def get_rate_limit_metrics() -> dict:
+    """Number of messages refused because of the limit of their connection, of their wishlist, and of their size"""
+    return {
+        "connection": rate_limit_metrics["connection"],
+        "wishlist": rate_limit_metrics["wishlist"],
+        "over_burst": rate_limit_metrics["over_burst"],
+    }
+
+
+def get_message_costs(message_type: str, operation_types: list[str] | None = None) -> Counter:
+    """Tokens taken by a message, by type: a batch costs its operations"""
+    if message_type == "batch":
+        return Counter(operation_types or [])
+    return Counter([message_type])
+
+
+def get_limit(limits: dict, message_type: str) -> dict:
+    """Rate (tokens per second) and burst of the message type, the "default" ones for the other types"""
+    return limits.get(message_type, limits["default"])
+
+
+def get_over_burst(costs: Counter, *limits: dict) -> dict[str, float]:
+    """Smallest burst of the types costing more tokens than it: the message can never pass, it has to be refused"""
+    over_burst = {}
+    for message_type, tokens in costs.items():
+        burst = min(get_limit(type_limits, message_type)["burst"] for type_limits in limits)
+        if tokens > burst:
+            over_burst[message_type] = burst
+    return over_burst
+
+
+class TokenBucket:
+    """Up to burst tokens, refilled at rate tokens per second"""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_retry_after(self, tokens: float) -> float:
+        """Seconds before the tokens are available, 0 when they are (never for more than the burst, see get_over_burst)"""
+        missing = tokens - self.tokens
+        return missing / self.rate if missing > 0 else 0
+
+    def is_full(self) -> bool:
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """
+    Buckets of tokens by key (connection, wishlist...) and message type
+    A message passes only if the buckets of all its types have enough tokens, it then takes them from all of them
+    """
+
+    def __init__(self):
+        self.buckets: dict[tuple[str, str], TokenBucket] = {}
+        self.next_forget_at = time.monotonic() + FORGET_IDLE_BUCKETS_INTERVAL
+
+    def get_buckets(self, key: str, costs: Counter, limits: dict, now: float) -> list[tuple[TokenBucket, int]]:
+        buckets = []
+        for message_type, tokens in costs.items():
+            bucket = self.buckets.get((key, message_type))
+            if bucket is None:
+                limit = get_limit(limits, message_type)
+                bucket = self.buckets[(key, message_type)] = TokenBucket(limit["rate"], limit["burst"], now)
+            bucket.refill(now)
+            buckets.append((bucket, tokens))
+        return buckets
+
+    def get_retry_after(self, key: str, costs: Counter, limits: dict) -> float:
+        """Seconds before the message can pass, 0 when it can pass now"""
+        buckets = self.get_buckets(key, costs, limits, time.monotonic())
+        return max((bucket.get_retry_after(tokens) for bucket, tokens in buckets), default=0)
+
+    def acquire(self, key: str, costs: Counter, limits: dict) -> float:
+        """Take the tokens of the message if it can pass, return 0 then, the seconds before it can pass otherwise"""
+        now = time.monotonic()
+        self._forget_idle_buckets(now)
+
+        buckets = self.get_buckets(key, costs, limits, now)
+        retry_after = max((bucket.get_retry_after(tokens) for bucket, tokens in buckets), default=0)
+        if retry_after == 0:
+            for bucket, tokens in buckets:
+                bucket.tokens -= tokens
+        return retry_after
+
+    def _forget_idle_buckets(self, now: float) -> None:
+        """A full bucket is the same as a new one: no need to keep it"""
+        if now < self.next_forget_at:
+            return
+        self.next_forget_at = now + FORGET_IDLE_BUCKETS_INTERVAL
+
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.is_full():
+                del self.buckets[key]
+
+
+def format_retry_after(retry_after: float) -> str:
+    """Seconds to wait, rounded up to the tenth"""
+    return f"{math.ceil(retry_after * 10) / 10:.1f}"
+
+
+# Limits of the wishlists, shared by the consumers of the process
+wishlist_rate_limiter = RateLimiter()
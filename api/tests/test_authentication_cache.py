@@ -0,0 +1,166 @@
+import json
+import time
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.test import RequestFactory, override_settings
+from django.test.client import Client
+from django.urls import reverse
+
+from api.authentication_cache import AuthenticationCache, LocalTTLCache, authentication_cache
+from api.tests.utils import TEST_REDIS_CACHES, SimpleWishlistBaseTestCase
+from core.models import WishListUser
+
+
+@override_settings(CACHES=TEST_REDIS_CACHES)
+class TestAuthenticationCache(SimpleWishlistBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        authentication_cache.local_cache.clear()
+
+    def test_authentication_is_cached(self):
+        """Test that the user and its wishlist are only loaded once from the database."""
+        url = reverse("api-1.0.0:get_wishlist_settings")
+        # The user and the wishlist are loaded with one query
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(cached_response.json(), response.json())
+
+        # Without the local entry, the user comes from Redis
+        authentication_cache.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(authentication_cache.get_user(self.user.id), self.user)
+
+    def test_unknown_user(self):
+        """Test that an unknown token is still rejected, and not cached."""
+        client = Client(headers={"Authorization": f"bearer {str(uuid4())}"})
+        response = client.get(reverse("api-1.0.0:get_wishlist_settings"))
+        self.assertEqual(response.status_code, 404)
+
+        with self.assertRaises(Http404):
+            authentication_cache.get_user(uuid4())
+
+    def test_deactivate_and_activate_user_invalidate_the_cache(self):
+        """Test that the deactivation and the activation of a user are seen at once."""
+        self.assertTrue(authentication_cache.get_user(self.second_user.id).is_active)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("api-1.0.0:deactivate_user", kwargs={"user_id": str(self.second_user.id)}))
+        self.assertFalse(authentication_cache.get_user(self.second_user.id).is_active)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("api-1.0.0:activate_user", kwargs={"user_id": str(self.second_user.id)}))
+        self.assertTrue(authentication_cache.get_user(self.second_user.id).is_active)
+
+    def test_invalidation_by_another_process(self):
+        """Test that the local entry of a process is not used once another process invalidated the user."""
+        self.assertTrue(authentication_cache.get_user(self.second_user.id).is_active)
+
+        other_process_cache = AuthenticationCache()
+        with self.captureOnCommitCallbacks(execute=True):
+            WishListUser.objects.filter(id=self.second_user.id).update(is_active=False)
+            other_process_cache.invalidate_users([self.second_user.id])
+
+        self.assertFalse(authentication_cache.get_user(self.second_user.id).is_active)
+        # Then cached again, with the new version
+        with self.assertNumQueries(0):
+            self.assertFalse(authentication_cache.get_user(self.second_user.id).is_active)
+
+    def test_invalidation_while_loading_the_user(self):
+        """Test that a user loaded before an invalidation is not served once it is committed."""
+        load_user = get_object_or_404
+
+        def load_then_deactivate(*args, **kwargs):
+            user = load_user(*args, **kwargs)
+            # Committed by another request between the loading of the user and its caching
+            WishListUser.objects.filter(id=self.second_user.id).update(is_active=False)
+            authentication_cache._delete([self.second_user.id])
+            return user
+
+        with patch("api.authentication_cache.get_object_or_404", side_effect=load_then_deactivate):
+            self.assertTrue(authentication_cache.get_user(self.second_user.id).is_active)
+
+        self.assertFalse(authentication_cache.get_user(self.second_user.id).is_active)
+        authentication_cache.local_cache.clear()
+        self.assertFalse(authentication_cache.get_user(self.second_user.id).is_active)
+
+    def test_local_entries_are_copied(self):
+        """Test that a change of the returned user does not change the cached one."""
+        authentication_cache.get_user(self.second_user.id).name = "Changed"
+        authentication_cache.get_user(self.second_user.id).wishlist.wishlist_name = "Changed"
+
+        user = authentication_cache.get_user(self.second_user.id)
+        self.assertEqual(user.name, self.second_user.name)
+        self.assertEqual(user.wishlist.wishlist_name, self.wishlist.wishlist_name)
+
+    def test_update_user_invalidates_the_cache(self):
+        """Test that a renamed user is not served from the cache."""
+        authentication_cache.get_user(self.second_user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("api-1.0.0:update_user_in_wishlist", kwargs={"user_id": str(self.second_user.id)}),
+                data=json.dumps({"name": "Alicia"}),
+                content_type="application/json",
+            )
+
+        self.assertEqual(authentication_cache.get_user(self.second_user.id).name, "Alicia")
+
+    def test_update_wishlist_invalidates_the_cache_of_every_user(self):
+        """Test that the users of the wishlist are served with the updated wishlist."""
+        client = Client(headers={"Authorization": f"bearer {str(self.second_user.id)}"})
+        client.get(reverse("api-1.0.0:get_wishlist_settings"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("api-1.0.0:update_wishlist"),
+                data=json.dumps({"wishlistName": "New name", "surpriseModeEnabled": True, "allowSeeAssigned": False}),
+                content_type="application/json",
+            )
+
+        response = client.get(reverse("api-1.0.0:get_wishlist_settings"))
+        self.assertEqual(response.json()["wishlistName"], "New name")
+
+    def test_admin_edit_invalidates_the_cache(self):
+        """Test that the users edited in the admin are not served from the cache."""
+        authentication_cache.get_user(self.second_user.id)
+        user = WishListUser.objects.get(id=self.second_user.id)
+        user.is_active = False
+
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site.get_model_admin(WishListUser).save_model(RequestFactory().post("/"), user, None, True)
+
+        self.assertFalse(authentication_cache.get_user(self.second_user.id).is_active)
+
+
+class TestLocalTTLCache(SimpleWishlistBaseTestCase):
+    def test_entries_expire(self):
+        """Test that the entries are not returned after the timeout."""
+        local_cache = LocalTTLCache(max_size=10, timeout=0.01)
+        local_cache.set("key", "value")
+        self.assertEqual(local_cache.get("key"), "value")
+
+        time.sleep(0.02)
+        self.assertIsNone(local_cache.get("key"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the cache does not grow above its max size."""
+        local_cache = LocalTTLCache(max_size=2, timeout=60)
+        local_cache.set("first", 1)
+        local_cache.set("second", 2)
+        # Using the first entry makes the second one the least recently used
+        local_cache.get("first")
+        local_cache.set("third", 3)
+
+        self.assertEqual(local_cache.get("first"), 1)
+        self.assertIsNone(local_cache.get("second"))
+        self.assertEqual(local_cache.get("third"), 3)
@@ -0,0 +1,95 @@
+import asyncio
+
+from channels.exceptions import ChannelFull
+from django.test import SimpleTestCase
+
+from simplewishlist.channel_layers import LocalChannelLayer
+
+
+class TestLocalChannelLayer(SimpleTestCase):
+    async def test_send_and_receive(self):
+        layer = LocalChannelLayer()
+        channel = await layer.new_channel()
+
+        message = {"type": "updated_wish", "text": "{}"}
+        await layer.send(channel, message)
+        received = await layer.receive(channel)
+
+        self.assertEqual(received, message)
+        # Not the same dict: the receiver can not change the message of the others
+        self.assertIsNot(received, message)
+        # Nothing kept for the channel once it is empty
+        self.assertEqual(layer.get_metrics()["channels"], 0)
+
+    async def test_message_must_be_a_dict(self):
+        layer = LocalChannelLayer()
+        channel = await layer.new_channel()
+
+        with self.assertRaises(TypeError):
+            await layer.send(channel, "message")
+        with self.assertRaises(TypeError):
+            await layer.group_send("wishlist_1", ["message"])
+
+    async def test_group_send(self):
+        layer = LocalChannelLayer()
+        first_channel, second_channel = await layer.new_channel(), await layer.new_channel()
+        await layer.group_add("wishlist_1", first_channel)
+        await layer.group_add("wishlist_1", second_channel)
+        await layer.group_add("wishlist_2", second_channel)
+
+        await layer.group_send("wishlist_1", {"type": "updated_wish"})
+        await layer.group_discard("wishlist_1", second_channel)
+        await layer.group_send("wishlist_1", {"type": "updated_wishes"})
+
+        self.assertEqual((await layer.receive(first_channel))["type"], "updated_wish")
+        self.assertEqual((await layer.receive(first_channel))["type"], "updated_wishes")
+        self.assertEqual((await layer.receive(second_channel))["type"], "updated_wish")
+        # Still in the other group
+        self.assertEqual(layer.channel_groups[second_channel], {"wishlist_2"})
+
+    async def test_capacity(self):
+        """Test that a full channel misses the group messages, without blocking the other members."""
+        layer = LocalChannelLayer(capacity=2, channel_capacity={"slow*": 1})
+        slow_channel, channel = await layer.new_channel("slow"), await layer.new_channel()
+        await layer.group_add("wishlist_1", slow_channel)
+        await layer.group_add("wishlist_1", channel)
+
+        for i in range(3):
+            await layer.group_send("wishlist_1", {"type": "updated_wish", "n": i})
+        with self.assertRaises(ChannelFull):
+            await layer.send(channel, {"type": "updated_wish"})
+
+        self.assertEqual((await layer.receive(slow_channel))["n"], 0)
+        self.assertEqual([(await layer.receive(channel))["n"] for _ in range(2)], [0, 1])
+        self.assertEqual(layer.get_metrics()["dropped"], 3 + 1)
+
+    async def test_expiry(self):
+        """Test that the expired messages are not received, and their channel stays in its groups."""
+        layer = LocalChannelLayer(expiry=0.01)
+        channel, slow_channel = await layer.new_channel(), await layer.new_channel()
+        await layer.group_add("wishlist_1", channel)
+        await layer.group_add("wishlist_1", slow_channel)
+
+        await layer.group_send("wishlist_1", {"type": "updated_wish", "n": 1})
+        await asyncio.sleep(0.02)
+        # The slow channel does not receive anything until the next message, the other one waits for it
+        receive = asyncio.ensure_future(layer.receive(channel))
+        await asyncio.sleep(0)
+        await layer.group_send("wishlist_1", {"type": "updated_wish", "n": 2})
+
+        self.assertEqual((await receive)["n"], 2)
+        self.assertEqual((await layer.receive(slow_channel))["n"], 2)
+        self.assertEqual(list(layer.groups["wishlist_1"]), [channel, slow_channel])
+        self.assertEqual(layer.get_metrics()["expired"], 2)
+        self.assertEqual(layer.get_metrics()["channels"], 0)
+
+    async def test_group_expiry(self):
+        layer = LocalChannelLayer(expiry=0, group_expiry=0.01)
+        channel = await layer.new_channel()
+        await layer.group_add("wishlist_1", channel)
+
+        await asyncio.sleep(0.02)
+        await layer.group_send("wishlist_1", {"type": "updated_wish"})
+
+        self.assertEqual(layer.get_metrics()["groups"], 0)
+        self.assertEqual(layer.get_metrics()["channels"], 0)
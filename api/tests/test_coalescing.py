@@ -0,0 +1,99 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from api.coalescing import BroadcastCoalescer
+
+
+def wish_update(wish_id: str, name: str) -> dict:
+    return {"user": "Bob", "wish": {"id": wish_id, "name": name}}
+
+
+class TestBroadcastCoalescer(SimpleTestCase):
+    def setUp(self):
+        self.coalescer = BroadcastCoalescer()
+        self.sent = []
+
+    async def send_group_message(self, type: str, action: str, data, user_token: str, seq: int = None):
+        self.sent.append((asyncio.get_running_loop().time(), type, action, data, user_token))
+
+    def add(self, action: str, data: dict, window_ms: int = 20, max_delay_ms: int = 1000, sender: str = "Bob"):
+        change = {"action": action, "data": data, "seq": None}
+        self.coalescer.add(
+            "room", change, sender, self.send_group_message, window_ms=window_ms, max_delay_ms=max_delay_ms
+        )
+
+    async def test_updates_of_the_same_wish_are_merged(self):
+        """Test that only the latest update of a wish is sent, as a usual updated_wish message."""
+        self.add("update_wish", wish_update("1", "First name"))
+        self.add("update_wish", wish_update("1", "Second name"))
+        self.add("change_wish_assigned_user", wish_update("1", "Third name"), sender="Alice")
+
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(len(self.sent), 1)
+        _, type, action, data, user_token = self.sent[0]
+        self.assertEqual(
+            (type, action, data, user_token),
+            ("updated_wish", "change_wish_assigned_user", wish_update("1", "Third name"), "Alice"),
+        )
+        self.assertEqual(
+            self.coalescer.get_metrics(),
+            {"updates": 3, "messages": 1, "messages_saved": 2, "pending_rooms": 0, "failed_flushes": 0},
+        )
+
+    async def test_updates_of_several_wishes_are_sent_together(self):
+        """Test that the updates of different wishes are sent in one updated_wishes message, in order."""
+        self.add("create_wish", wish_update("1", "Created"))
+        self.add("update_wish", wish_update("2", "Updated"))
+        # Still a creation for the members of the room
+        self.add("update_wish", wish_update("1", "Created and updated"))
+        self.add("delete_wish", {"user": "Bob", "wishId": "3", "assignedUser": None})
+
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(len(self.sent), 1)
+        _, type, action, data, _ = self.sent[0]
+        self.assertEqual((type, action), ("updated_wishes", "coalesced"))
+        self.assertEqual(
+            [(update["action"], update["data"]) for update in data],
+            [
+                ("create_wish", wish_update("1", "Created and updated")),
+                ("update_wish", wish_update("2", "Updated")),
+                ("delete_wish", {"user": "Bob", "wishId": "3", "assignedUser": None}),
+            ],
+        )
+
+    async def test_max_delay(self):
+        """Test that a room updated continuously still receives its updates before the max delay."""
+        start = asyncio.get_running_loop().time()
+        for i in range(10):
+            self.add("update_wish", wish_update("1", f"Name {i}"), window_ms=30, max_delay_ms=60)
+            await asyncio.sleep(0.015)
+        await asyncio.sleep(0.1)
+
+        # Without the max delay, the window would have been restarted until the last update
+        self.assertGreaterEqual(len(self.sent), 2)
+        self.assertLess(self.sent[0][0] - start, 0.06 + 0.015)
+        # The last update is always sent
+        self.assertEqual(self.sent[-1][3], wish_update("1", "Name 9"))
+
+    async def test_failed_flush_is_logged(self):
+        """Test that an error while sending the updates is logged and counted, not lost with the task."""
+
+        async def failing_send_group_message(*args, **kwargs):
+            raise ConnectionError("Redis is down")
+
+        self.coalescer.add(
+            "room",
+            {"action": "update_wish", "data": wish_update("1", "Name"), "seq": None},
+            "Bob",
+            failing_send_group_message,
+            window_ms=10,
+            max_delay_ms=1000,
+        )
+        with self.assertLogs("api.coalescing", level="ERROR") as logs:
+            await asyncio.sleep(0.05)
+
+        self.assertIn("Redis is down", logs.output[0])
+        self.assertEqual(self.coalescer.get_metrics()["failed_flushes"], 1)
@@ -1,26 +1,32 @@
+import asyncio
+import json
 import random
+from unittest.mock import ANY, patch
 from uuid import UUID
 
 from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
 from channels.routing import URLRouter
 from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
 from django.test import TransactionTestCase, override_settings
 
+from api.RedisForWishList import RedisForWishList
+from api.consumers import RESYNC_CLOSE_CODE, get_outbound_metrics
 from api.routing import websocket_urlpatterns
+from api.rate_limiting import get_rate_limit_metrics
 from api.tests.factories import WishListFactory, WishListUserFactory, WishFactory
+from api.tests.utils import TEST_REDIS_CACHES
+from api.utils import get_wishlist_data
 from core.models import Wish
 
 
-@override_settings(
-    CACHES={
-        "default": {
-            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-        }
-    }
-)
+@override_settings(CACHES=TEST_REDIS_CACHES)
 class WishlistConsumerTest(TransactionTestCase):
     def setUp(self):
         super().setUp()
+        cache.clear()
         self.application = URLRouter(websocket_urlpatterns)
 
         self.wishlist = WishListFactory(wishlist_name="Test Wishlist")
@@ -36,6 +42,52 @@ class WishlistConsumerTest(TransactionTestCase):
 
         await communicator.disconnect()
 
+    async def test_group_message_is_forwarded_as_encoded_by_the_sender(self):
+        """Test that the members of the group receive the text encoded once by the sender."""
+        first_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await first_communicator.connect()
+        await first_communicator.receive_json_from()
+
+        second_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.second_user.id}/")
+        await second_communicator.connect()
+
+        expected = {
+            "type": "new_group_member_connection",
+            "data": ["Bob", "Alice"],
+            "userToken": "Alice",
+            "action": "new_group_member_connection",
+        }
+        first_response = await first_communicator.receive_output()
+        second_response = await second_communicator.receive_output()
+        self.assertEqual(json.loads(first_response["text"]), expected)
+        # Same text for every member
+        self.assertEqual(first_response["text"], second_response["text"])
+
+        await first_communicator.disconnect()
+        await second_communicator.disconnect()
+
+    @override_settings(WEBSOCKET_PRE_ENCODED_BROADCASTS=False)
+    async def test_group_message_is_encoded_by_each_member(self):
+        """Test that the group messages are the same when each member encodes them."""
+        first_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await first_communicator.connect()
+        await first_communicator.receive_json_from()
+
+        second_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.second_user.id}/")
+        await second_communicator.connect()
+
+        expected = {
+            "type": "new_group_member_connection",
+            "data": ["Bob", "Alice"],
+            "userToken": "Alice",
+            "action": "new_group_member_connection",
+        }
+        self.assertEqual(await first_communicator.receive_json_from(), expected)
+        self.assertEqual(await second_communicator.receive_json_from(), expected)
+
+        await first_communicator.disconnect()
+        await second_communicator.disconnect()
+
     async def test_rejects_unauthorized_user(self):
         """Test that the WishlistConsumer rejects an unauthorized user."""
         # Connect with a non-existing user
@@ -76,6 +128,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {
                     "user": "Bob",
                     "wish": {
@@ -121,7 +174,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "error_message",
-                "data": "value too long for type character varying(15)\n",
+                "data": "value too long for type character varying(15)",
             },
         )
 
@@ -155,6 +208,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {
                     "user": "Bob",
                     "wish": {
@@ -203,6 +257,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {
                     "user": "Alice",
                     "wish": {
@@ -299,6 +354,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {
                     "user": "Bob",
                     "wishId": str(wish.id),
@@ -335,6 +391,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {"user": "Bob", "wishId": str(wish.id), "assignedUser": None},
                 "userToken": "Bob",
                 "action": "delete_wish",
@@ -370,6 +427,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {"user": "Bob", "wishId": str(wish.id), "assignedUser": None},
                 "userToken": "Alice",
                 "action": "delete_wish",
@@ -411,6 +469,443 @@ class WishlistConsumerTest(TransactionTestCase):
 
         await communicator.disconnect()
 
+    async def test_batch(self):
+        """Test that the operations of a batch are applied and sent to the group in one message."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        # First message is the connection message
+        await communicator.receive_json_from()
+
+        wish_to_update = await sync_to_async(WishFactory)(wishlist_user=self.user, name="Old name")
+        wish_to_take = await sync_to_async(WishFactory)(wishlist_user=self.second_user)
+        await communicator.send_json_to(
+            {
+                "type": "batch",
+                "currentUser": str(self.user.id),
+                "operations": [
+                    {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "First"}},
+                    {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "Second"}},
+                    {
+                        "type": "update_wish",
+                        "currentUser": str(self.user.id),
+                        "post_values": {"name": "New name"},
+                        "objectId": str(wish_to_update.id),
+                    },
+                    {
+                        "type": "update_wish",
+                        "currentUser": str(self.user.id),
+                        "post_values": {"assignedUser": str(self.user.id)},
+                        "objectId": str(wish_to_take.id),
+                    },
+                ],
+            }
+        )
+        response = await communicator.receive_json_from()
+
+        self.assertEqual(response["type"], "updated_wishes")
+        self.assertEqual(response["action"], "batch")
+        self.assertEqual(response["userToken"], "Bob")
+        self.assertEqual(
+            [(update["action"], update["data"]["wish"]["name"]) for update in response["data"]],
+            [
+                ("create_wish", "First"),
+                ("create_wish", "Second"),
+                ("update_wish", "New name"),
+                ("change_wish_assigned_user", wish_to_take.name),
+            ],
+        )
+        self.assertEqual(response["data"][3]["data"]["wish"]["assignedUser"], "Bob")
+        # Only one message for the whole batch
+        self.assertTrue(await communicator.receive_nothing())
+
+        self.assertEqual(await sync_to_async(Wish.objects.filter(name__in=["First", "Second"]).count)(), 2)
+
+        await communicator.disconnect()
+
+    async def test_batch_is_applied_in_one_transaction(self):
+        """Test that nothing is applied when one of the operations of the batch fails."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        # First message is the connection message
+        await communicator.receive_json_from()
+
+        wish = await sync_to_async(WishFactory)(wishlist_user=self.second_user)
+        await communicator.send_json_to(
+            {
+                "type": "batch",
+                "currentUser": str(self.user.id),
+                "operations": [
+                    {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "First"}},
+                    # Only the owner can delete the wish
+                    {"type": "delete_wish", "currentUser": str(self.user.id), "objectId": str(wish.id)},
+                ],
+            }
+        )
+        response = await communicator.receive_json_from()
+
+        self.assertEqual(response, {"type": "error_message", "data": "Only the owner of the wish can delete it."})
+        self.assertFalse(await sync_to_async(Wish.objects.filter(name="First").exists)())
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+
+    async def test_batch_is_validated_before_being_applied(self):
+        """Test that the operations of the batch are all validated before any of them is applied."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        # First message is the connection message
+        await communicator.receive_json_from()
+
+        for operations in [
+            # No name for the second wish
+            [
+                {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "First"}},
+                {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"price": "10"}},
+            ],
+            # Batches can not be nested
+            [
+                {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "First"}},
+                {"type": "batch", "currentUser": str(self.user.id), "operations": []},
+            ],
+        ]:
+            await communicator.send_json_to(
+                {"type": "batch", "currentUser": str(self.user.id), "operations": operations}
+            )
+            response = await communicator.receive_json_from()
+            self.assertEqual(response["type"], "error_message")
+
+        self.assertFalse(await sync_to_async(Wish.objects.filter(name="First").exists)())
+
+        await communicator.disconnect()
+
+    @override_settings(WEBSOCKET_COALESCING_WINDOW_MS=50)
+    async def test_updates_are_coalesced(self):
+        """Test that the updates sent within the coalescing window are sent to the group in one message."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        # First message is the connection message
+        await communicator.receive_json_from()
+
+        wish = await sync_to_async(WishFactory)(wishlist_user=self.user, name="Old name")
+        for name in ["New name", "Newer name"]:
+            await communicator.send_json_to(
+                {
+                    "type": "update_wish",
+                    "currentUser": str(self.user.id),
+                    "post_values": {"name": name},
+                    "objectId": str(wish.id),
+                }
+            )
+        await communicator.send_json_to(
+            {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "Created"}}
+        )
+
+        response = await communicator.receive_json_from()
+
+        self.assertEqual(response["type"], "updated_wishes")
+        self.assertEqual(response["action"], "coalesced")
+        self.assertEqual(
+            [(update["action"], update["data"]["wish"]["name"], update["userToken"]) for update in response["data"]],
+            [("update_wish", "Newer name", "Bob"), ("create_wish", "Created", "Bob")],
+        )
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+
+    @override_settings(WEBSOCKET_COALESCING_WINDOW_MS=1000, WEBSOCKET_COALESCING_MAX_DELAY_MS=1000)
+    async def test_batch_is_sent_after_the_coalesced_updates(self):
+        """Test that an update waiting to be coalesced is sent before a batch changing the same wish."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        # First message is the connection message
+        await communicator.receive_json_from()
+
+        wish = await sync_to_async(WishFactory)(wishlist_user=self.user, name="Old name")
+        for message_type, name in [("update_wish", "New name"), ("batch", "Newer name")]:
+            operation = {
+                "type": "update_wish",
+                "currentUser": str(self.user.id),
+                "post_values": {"name": name},
+                "objectId": str(wish.id),
+            }
+            if message_type == "batch":
+                operation = {"type": "batch", "currentUser": str(self.user.id), "operations": [operation]}
+            await communicator.send_json_to(operation)
+
+        update = await communicator.receive_json_from()
+        batch = await communicator.receive_json_from()
+
+        self.assertEqual((update["type"], update["data"]["wish"]["name"]), ("updated_wish", "New name"))
+        self.assertEqual((batch["type"], batch["data"][0]["data"]["wish"]["name"]), ("updated_wishes", "Newer name"))
+        self.assertLess(update["seq"], batch["data"][0]["seq"])
+
+        await communicator.disconnect()
+
+    async def test_updated_wishes_carry_a_sequence_number(self):
+        """Test that the changes sent to the group are numbered with the version of the wishlist."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        # First message is the connection message
+        await communicator.receive_json_from()
+
+        seqs = []
+        for name in ["First", "Second"]:
+            await communicator.send_json_to(
+                {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": name}}
+            )
+            seqs.append((await communicator.receive_json_from())["seq"])
+
+        self.assertEqual(seqs[1], seqs[0] + 1)
+        version = await sync_to_async(RedisForWishList().get_wishlist_version)(self.wishlist.id)
+        self.assertEqual(seqs[1], version)
+
+        await communicator.disconnect()
+
+    async def test_reconnection_replays_missed_changes(self):
+        """Test that a client reconnecting with the last sequence number it got receives the changes it missed."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        # First message is the connection message
+        await communicator.receive_json_from()
+        await communicator.send_json_to(
+            {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "Seen"}}
+        )
+        last_seq = (await communicator.receive_json_from())["seq"]
+        await communicator.disconnect()
+
+        # Changes sent while Bob is away
+        other_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.second_user.id}/")
+        await other_communicator.connect()
+        await other_communicator.receive_json_from()
+        await other_communicator.send_json_to(
+            {"type": "create_wish", "currentUser": str(self.second_user.id), "post_values": {"name": "Missed"}}
+        )
+        missed = await other_communicator.receive_json_from()
+
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/?last_seq={last_seq}")
+        await communicator.connect()
+        response = await communicator.receive_json_from()
+
+        self.assertEqual(
+            response,
+            {
+                "type": "updated_wish",
+                "data": missed["data"],
+                "userToken": None,
+                "action": "create_wish",
+                "seq": missed["seq"],
+            },
+        )
+        # Then the connection message
+        self.assertEqual((await communicator.receive_json_from())["type"], "new_group_member_connection")
+
+        await communicator.disconnect()
+        await other_communicator.disconnect()
+
+    async def test_reconnection_resync(self):
+        """Test that a client is asked to reload the wishlist when the missed changes can not be replayed."""
+        version = await sync_to_async(RedisForWishList().get_wishlist_version)(self.wishlist.id)
+
+        for last_seq in [str(version - 1), "not a number"]:
+            communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/?last_seq={last_seq}")
+            await communicator.connect()
+            response = await communicator.receive_json_from()
+
+            # The change log does not go back to this version
+            self.assertEqual(response["type"], "resync")
+
+            await communicator.disconnect()
+
+    async def test_initial_snapshot(self):
+        """Test that a client asking for the snapshot receives the wishlist first, with its version."""
+        await sync_to_async(WishFactory)(name="Existing wish", wishlist_user=self.second_user)
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/?snapshot=1")
+        await communicator.connect()
+        response = await communicator.receive_json_from()
+
+        expected_data = await sync_to_async(
+            lambda: get_wishlist_data(self.user).model_dump(by_alias=True, mode="json")
+        )()
+        version = await sync_to_async(RedisForWishList().get_wishlist_version)(self.wishlist.id)
+        self.assertEqual(response, {"type": "wishlist_snapshot", "data": expected_data, "seq": version})
+        self.assertEqual(
+            [wish["name"] for user_wishes in response["data"]["userWishes"] for wish in user_wishes["wishes"]],
+            ["Existing wish"],
+        )
+        # Then the connection message
+        self.assertEqual((await communicator.receive_json_from())["type"], "new_group_member_connection")
+
+        # The next changes come after the snapshot
+        await communicator.send_json_to(
+            {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "New wish"}}
+        )
+        self.assertGreater((await communicator.receive_json_from())["seq"], response["seq"])
+
+        await communicator.disconnect()
+
+    @override_settings(WEBSOCKET_OUTBOUND_QUEUE_SIZE=3)
+    async def test_slow_client_is_evicted(self):
+        """Test that a client that stops reading is disconnected to resync, without holding back the others."""
+        send = AsyncWebsocketConsumer.send
+        never_read = asyncio.Event()
+
+        async def stalled_send(consumer, *args, **kwargs):
+            # Alice's socket does not take any frame anymore
+            if consumer.current_user.name == "Alice":
+                await never_read.wait()
+            await send(consumer, *args, **kwargs)
+
+        metrics = get_outbound_metrics()
+        with patch.object(AsyncWebsocketConsumer, "send", stalled_send):
+            communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+            await communicator.connect()
+            await communicator.receive_json_from()
+            slow_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.second_user.id}/")
+            await slow_communicator.connect()
+            # Alice's connection message
+            await communicator.receive_json_from()
+
+            for i in range(5):
+                await get_channel_layer().group_send(
+                    f"wishlist_{self.wishlist.id}", {"type": "updated_wish", "text": json.dumps({"n": i})}
+                )
+
+            self.assertEqual([(await communicator.receive_json_from())["n"] for _ in range(5)], list(range(5)))
+            self.assertEqual(
+                await slow_communicator.receive_output(),
+                {"type": "websocket.close", "code": RESYNC_CLOSE_CODE, "reason": "resync"},
+            )
+
+        new_metrics = get_outbound_metrics()
+        self.assertEqual(new_metrics["evicted"] - metrics["evicted"], 1)
+        # The 3 messages waiting behind the connection message being written, and the one that did not fit
+        self.assertEqual(new_metrics["dropped"] - metrics["dropped"], 3 + 1)
+
+        await communicator.disconnect()
+        await slow_communicator.disconnect()
+
+    @override_settings(WEBSOCKET_OUTBOUND_QUEUE_SIZE=3, WEBSOCKET_PRE_ENCODED_BROADCASTS=False)
+    async def test_slow_client_is_evicted_without_pre_encoded_broadcasts(self):
+        """Test that the messages encoded by every consumer also wait in the outbound queue."""
+        send = AsyncWebsocketConsumer.send
+        never_read = asyncio.Event()
+
+        async def stalled_send(consumer, *args, **kwargs):
+            if consumer.current_user.name == "Alice":
+                await never_read.wait()
+            await send(consumer, *args, **kwargs)
+
+        metrics = get_outbound_metrics()
+        with patch.object(AsyncWebsocketConsumer, "send", stalled_send):
+            communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+            await communicator.connect()
+            await communicator.receive_json_from()
+            slow_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.second_user.id}/")
+            await slow_communicator.connect()
+            await communicator.receive_json_from()
+
+            for i in range(5):
+                await get_channel_layer().group_send(f"wishlist_{self.wishlist.id}", {"type": "updated_wish", "n": i})
+
+            self.assertEqual([(await communicator.receive_json_from())["n"] for _ in range(5)], list(range(5)))
+            self.assertEqual(
+                await slow_communicator.receive_output(),
+                {"type": "websocket.close", "code": RESYNC_CLOSE_CODE, "reason": "resync"},
+            )
+
+        new_metrics = get_outbound_metrics()
+        self.assertEqual(new_metrics["evicted"] - metrics["evicted"], 1)
+        self.assertEqual(new_metrics["dropped"] - metrics["dropped"], 3 + 1)
+
+        await communicator.disconnect()
+        await slow_communicator.disconnect()
+
+    @override_settings(
+        WEBSOCKET_CONNECTION_RATE_LIMITS={
+            "create_wish": {"rate": 0.01, "burst": 2},
+            "default": {"rate": 5, "burst": 20},
+        },
+        WEBSOCKET_WISHLIST_RATE_LIMITS={"create_wish": {"rate": 0.01, "burst": 3}, "default": {"rate": 5, "burst": 20}},
+    )
+    async def test_rate_limits(self):
+        """Test that the messages over the budget of the connection or of the wishlist are refused."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        await communicator.receive_json_from()
+
+        responses = []
+        for name in ["First", "Second", "Third"]:
+            await communicator.send_json_to(
+                {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": name}}
+            )
+            responses.append(await communicator.receive_json_from())
+
+        self.assertEqual(
+            [response["type"] for response in responses], ["updated_wish", "updated_wish", "error_message"]
+        )
+        self.assertEqual(responses[2]["data"], "Too many messages, try again in 100.0 seconds")
+        # Other types have their own budget
+        await communicator.send_json_to({"type": "invalid_action", "currentUser": str(self.user.id)})
+        self.assertEqual((await communicator.receive_json_from())["data"], "Invalid action")
+
+        # Alice has her own budget, but only one create_wish is left for the wishlist
+        second_communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.second_user.id}/")
+        await second_communicator.connect()
+        await second_communicator.receive_json_from()
+        await communicator.receive_json_from()
+        for name in ["Fourth", "Fifth"]:
+            await second_communicator.send_json_to(
+                {"type": "create_wish", "currentUser": str(self.second_user.id), "post_values": {"name": name}}
+            )
+        # The error is sent to Alice directly, before the change sent through the group
+        responses = [await second_communicator.receive_json_from() for _ in range(2)]
+        self.assertEqual(sorted(response["type"] for response in responses), ["error_message", "updated_wish"])
+
+        self.assertEqual(await sync_to_async(Wish.objects.count)(), 3)
+
+        await communicator.disconnect()
+        await second_communicator.disconnect()
+
+    @override_settings(
+        WEBSOCKET_CONNECTION_RATE_LIMITS={
+            "create_wish": {"rate": 0.01, "burst": 2},
+            "default": {"rate": 5, "burst": 20},
+        },
+        WEBSOCKET_WISHLIST_RATE_LIMITS={"create_wish": {"rate": 0.01, "burst": 3}, "default": {"rate": 5, "burst": 20}},
+    )
+    async def test_batch_bigger_than_the_burst(self):
+        """Test that a batch costing more than the burst is refused, without taking any token."""
+        communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
+        await communicator.connect()
+        await communicator.receive_json_from()
+        metrics = get_rate_limit_metrics()
+
+        await communicator.send_json_to(
+            {
+                "type": "batch",
+                "currentUser": str(self.user.id),
+                "operations": [
+                    {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": name}}
+                    for name in ["First", "Second", "Third"]
+                ],
+            }
+        )
+
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {"type": "error_message", "data": "Too many operations in the batch, at most 2 create_wish"},
+        )
+        self.assertEqual(get_rate_limit_metrics()["over_burst"] - metrics["over_burst"], 1)
+        # The whole burst is still there
+        for name in ["Fourth", "Fifth"]:
+            await communicator.send_json_to(
+                {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": name}}
+            )
+            self.assertEqual((await communicator.receive_json_from())["type"], "updated_wish")
+        self.assertEqual(await sync_to_async(Wish.objects.count)(), 2)
+
+        await communicator.disconnect()
+
     async def test_invalid_action(self):
         """Test that the WishlistConsumer sends an error message when receiving an invalid action."""
         communicator = WebsocketCommunicator(self.application, f"/ws/wishlist/{self.user.id}/")
@@ -465,6 +960,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {
                     "user": "Alice",
                     "wish": {
@@ -653,6 +1149,7 @@ class WishlistConsumerTest(TransactionTestCase):
             response,
             {
                 "type": "updated_wish",
+                "seq": ANY,
                 "data": {
                     "user": "Alice",
                     "wish": {
@@ -0,0 +1,60 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import PropertyMock, patch
+
+from channels.layers import channel_layers
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from simplewishlist.database_pool import get_database_pool_metrics
+from simplewishlist.metrics import get_process_metrics
+
+
+class TestDatabasePoolMetrics(TestCase):
+    @unittest.skipUnless(connection.vendor == "postgresql", "The connections are pooled on PostgreSQL")
+    def test_metrics(self):
+        """Test that the connection of the test is seen in use."""
+        metrics = get_database_pool_metrics()
+
+        self.assertEqual(metrics["max_size"], settings.DATABASE_POOL_MAX_SIZE)
+        self.assertGreaterEqual(metrics["in_use"], 1)
+        self.assertEqual(metrics["saturation"], round(metrics["in_use"] / metrics["max_size"], 3))
+        self.assertEqual(metrics["timeouts"], 0)
+        self.assertEqual(get_process_metrics()["database_pools"]["default"]["max_size"], metrics["max_size"])
+
+    def test_no_pool(self):
+        with patch.object(type(connections["default"]), "pool", new_callable=PropertyMock, return_value=None):
+            self.assertIsNone(get_database_pool_metrics())
+            self.assertEqual(get_process_metrics()["database_pools"], {})
+
+    def test_backend_without_pool(self):
+        """Test that the backends without any pool (SQLite...) have no metrics."""
+        with patch("simplewishlist.database_pool.connections", {"default": SimpleNamespace()}):
+            self.assertIsNone(get_database_pool_metrics())
+
+    def test_metrics_view(self):
+        """Test that the staff users can read the metrics of the process."""
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 302)
+
+        staff_user = get_user_model().objects.create_user(username="operator", is_staff=True)
+        self.client.force_login(staff_user)
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("database_pools", response.json())
+        self.assertIn("failed_flushes", response.json()["websocket_coalescing"])
+        self.assertEqual(set(response.json()["websocket_outbound"]), {"evicted", "dropped"})
+        self.assertEqual(set(response.json()["websocket_rate_limits"]), {"connection", "wishlist", "over_burst"})
+
+    @override_settings(
+        CHANNEL_LAYERS={"default": {"BACKEND": "simplewishlist.channel_layers.LocalChannelLayer"}},
+    )
+    def test_metrics_of_the_local_channel_layer(self):
+        channel_layers.backends.pop("default", None)
+        self.addCleanup(channel_layers.backends.pop, "default", None)
+
+        self.assertEqual(get_process_metrics()["channel_layer"]["dropped"], 0)
@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+
+from api.RedisForWishList import RedisForWishList
+from api.tests.utils import TEST_REDIS_CACHES, SimpleWishlistBaseTestCase
+from core.models import WishList
+from simplewishlist.db_router import REPLICA_DATABASE, ReplicaRouter, read_from_replica
+
+
+@override_settings(CACHES=TEST_REDIS_CACHES)
+class TestReplicaRouter(SimpleWishlistBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.router = ReplicaRouter()
+        # The tests have no replica database
+        patcher = patch("simplewishlist.db_router.replica_is_configured", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_read_databases(self, url: str) -> list:
+        """Databases chosen by the router for the reads of the request"""
+        databases = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            database = db_for_read(router, model, **hints)
+            databases.append(database)
+            # The replica reads are made on the test database
+            return None if database == REPLICA_DATABASE else database
+
+        with patch.object(ReplicaRouter, "db_for_read", spy):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return databases
+
+    def test_reads_go_to_the_primary_by_default(self):
+        self.assertIsNone(self.router.db_for_read(WishList))
+        self.assertIsNone(self.router.db_for_write(WishList))
+
+    def test_reads_go_to_the_replica(self):
+        with read_from_replica(self.wishlist.id):
+            self.assertEqual(self.router.db_for_read(WishList), REPLICA_DATABASE)
+            # The writes still go to the primary
+            self.assertIsNone(self.router.db_for_write(WishList))
+
+        self.assertIsNone(self.router.db_for_read(WishList))
+
+    def test_read_only_endpoints_read_from_the_replica(self):
+        self.assertIn(REPLICA_DATABASE, self.get_read_databases(reverse("api-1.0.0:get_wishlist_users")))
+        self.assertIn(
+            REPLICA_DATABASE,
+            self.get_read_databases(
+                reverse("api-1.0.0:get_wishlist_users_for_selection", kwargs={"wishlist_id": self.wishlist.id})
+            ),
+        )
+
+    def test_changed_wishlist_sticks_to_the_primary(self):
+        """Test that the wishlist is read from the primary right after a change."""
+        RedisForWishList().record_wishlist_change(self.wishlist.id, "resync")
+
+        self.assertNotIn(REPLICA_DATABASE, self.get_read_databases(reverse("api-1.0.0:get_wishlist_users")))
+        with read_from_replica(self.wishlist.id):
+            self.assertIsNone(self.router.db_for_read(WishList))
+
+    def test_replica_is_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate(REPLICA_DATABASE, "core"))
+        self.assertIsNone(self.router.allow_migrate("default", "core"))
@@ -1,6 +1,8 @@
+from uuid import uuid1, uuid4
+
 from pydantic_core import ValidationError
 
-from api.pydantic_models import WishlistInitModel, WishModelUpdate
+from api.pydantic_models import BATCH_MAX_OPERATIONS, WebhookPayloadModel, WishlistInitModel, WishModelUpdate
 from api.tests.utils import SimpleWishlistBaseTestCase
 
 
@@ -34,3 +36,29 @@ class TestWishModelUpdate(SimpleWishlistBaseTestCase):
 
         with self.assertRaisesRegex(ValidationError, "Name can not be null"):
             self.pydantic_model(**data)
+
+
+class TestWebhookPayloadModel(SimpleWishlistBaseTestCase):
+    pydantic_model = WebhookPayloadModel
+
+    def test_batch_operations_validate(self):
+        """A batch needs between one and BATCH_MAX_OPERATIONS operations"""
+        operation = {"type": "create_wish", "currentUser": str(self.user.id), "post_values": {"name": "Wish"}}
+        data = {"type": "batch", "currentUser": str(self.user.id)}
+
+        with self.assertRaisesRegex(ValidationError, "at least one operation"):
+            self.pydantic_model(**data, operations=[])
+
+        with self.assertRaisesRegex(ValidationError, "more than 100 operations"):
+            self.pydantic_model(**data, operations=[operation] * (BATCH_MAX_OPERATIONS + 1))
+
+        payload = self.pydantic_model(**data, operations=[operation] * BATCH_MAX_OPERATIONS)
+        self.assertEqual(len(payload.operations), BATCH_MAX_OPERATIONS)
+
+    def test_ids_version_4_and_7(self):
+        """The ids created before UUIDv7 became the default are still valid"""
+        for user_id in [self.user.id, uuid4()]:
+            self.assertEqual(self.pydantic_model(type="create_wish", currentUser=str(user_id)).currentUser, user_id)
+
+        with self.assertRaisesRegex(ValidationError, "UUID version 4 or 7 expected"):
+            self.pydantic_model(type="create_wish", currentUser=str(uuid1()))
@@ -0,0 +1,82 @@
+from collections import Counter
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from api.rate_limiting import FORGET_IDLE_BUCKETS_INTERVAL, RateLimiter, get_message_costs, get_over_burst
+
+LIMITS = {
+    "create_wish": {"rate": 1, "burst": 2},
+    "default": {"rate": 10, "burst": 5},
+}
+
+
+class TestRateLimiter(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch("api.rate_limiting.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rate_limiter = RateLimiter()
+
+    def acquire(self, message_type: str, operation_types: list[str] = None, key: str = "connection") -> float:
+        return self.rate_limiter.acquire(key, get_message_costs(message_type, operation_types), LIMITS)
+
+    def test_burst_then_rate(self):
+        self.assertEqual([self.acquire("create_wish") for _ in range(2)], [0, 0])
+        self.assertEqual(self.acquire("create_wish"), 1)
+
+        self.now += 0.5
+        self.assertEqual(self.acquire("create_wish"), 0.5)
+        self.now += 0.5
+        self.assertEqual(self.acquire("create_wish"), 0)
+
+    def test_budgets_by_message_type(self):
+        """Test that each type has its own budget, the "default" one for the types without one."""
+        self.acquire("create_wish")
+        self.acquire("create_wish")
+
+        self.assertEqual([self.acquire("update_wish") for _ in range(5)], [0] * 5)
+        self.assertGreater(self.acquire("update_wish"), 0)
+        # The other keys are not limited
+        self.assertEqual(self.acquire("create_wish", key="other connection"), 0)
+
+    def test_batch_costs_its_operations(self):
+        """Test that a batch takes the tokens of all its operations, or none of them."""
+        self.assertEqual(self.acquire("batch", ["create_wish", "update_wish", "update_wish"]), 0)
+        self.assertEqual(self.acquire("batch", ["create_wish", "create_wish", "update_wish"]), 1)
+
+        # The update tokens were not taken by the refused batch
+        self.assertEqual([self.acquire("update_wish") for _ in range(3)], [0] * 3)
+        self.assertGreater(self.acquire("update_wish"), 0)
+
+    def test_message_bigger_than_the_burst(self):
+        """Test that a batch costing more than the burst never passes."""
+        self.assertGreater(self.acquire("batch", ["create_wish"] * 10), 0)
+        self.now += 3600
+        self.assertGreater(self.acquire("batch", ["create_wish"] * 10), 0)
+
+    def test_get_over_burst(self):
+        """Test that the smallest burst of the limits counts."""
+        other_limits = {"create_wish": {"rate": 1, "burst": 5}, "default": {"rate": 10, "burst": 3}}
+        costs = get_message_costs("batch", ["create_wish"] * 3 + ["update_wish"] * 4)
+
+        self.assertEqual(get_over_burst(costs, LIMITS), {"create_wish": 2})
+        self.assertEqual(get_over_burst(costs, LIMITS, other_limits), {"create_wish": 2, "update_wish": 3})
+        self.assertEqual(get_over_burst(get_message_costs("create_wish"), LIMITS, other_limits), {})
+
+    def test_idle_buckets_are_forgotten(self):
+        self.acquire("create_wish")
+        self.acquire("update_wish", key="other connection")
+
+        self.now += FORGET_IDLE_BUCKETS_INTERVAL
+        self.acquire("create_wish")
+
+        self.assertEqual(list(self.rate_limiter.buckets), [("connection", "create_wish")])
+
+    def test_get_message_costs(self):
+        self.assertEqual(get_message_costs("update_wish"), Counter({"update_wish": 1}))
+        self.assertEqual(
+            get_message_costs("batch", ["create_wish", "update_wish", "create_wish"]),
+            Counter({"create_wish": 2, "update_wish": 1}),
+        )
@@ -1,9 +1,10 @@
 # REDIS CACHE TESTS
-import json
+from collections import Counter
 
 from django.core.cache import cache
 
 from api.RedisForWishList import RedisForWishList
+from api.utils import build_wishlist_data
 from api.tests.utils import SimpleWishlistBaseTestCase
 
 
@@ -27,53 +28,200 @@ class TestRedisForWishList(SimpleWishlistBaseTestCase):
 
         self.assertEqual(result, [self.user.name])
 
-        # Check that the cache variable was set
-        self.assertEqual(json.loads(cache.get(room_group_name)), [self.user.name])
+        # Check that the room was created
+        self.assertTrue(cache.has_key(self.redis_for_wishlist.connected_users_key(room_group_name)))
 
     def test_room_exists_adds_user(self):
         """Test that the WishlistConsumer adds the user to the room if it is not already in it."""
         # A user is already in the room, so the consumer should add the second user
         current_user = self.second_user
         room_group_name = "test_room"
-        cache.set("test_room", json.dumps([self.user.name]))
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.user)
 
         result = self.redis_for_wishlist.get_currently_connected_users(room_group_name, current_user)
 
         self.assertEqual(result, [self.user.name, self.second_user.name])
-        self.assertEqual(json.loads(cache.get(room_group_name)), [self.user.name, self.second_user.name])
 
     def test_room_exists_user_already_in_the_room(self):
         """Test that the WishlistConsumer does not add the user to the room if it is already in it."""
-        cache.set("test_room", json.dumps([self.user.name]))
-        current_user = self.user
         room_group_name = "test_room"
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.user)
+        current_user = self.user
 
         result = self.redis_for_wishlist.get_currently_connected_users(room_group_name, current_user)
 
         self.assertEqual(result, [self.user.name])
-        self.assertEqual(json.loads(cache.get(room_group_name)), [self.user.name])
 
     def test_remove_user_from_room(self):
         """Test that the WishlistConsumer removes the user from the room."""
-        cache.set("test_room", json.dumps([self.user.name]))
-        current_user = self.user
         room_group_name = "test_room"
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.user)
+        current_user = self.user
 
         result = self.redis_for_wishlist.remove_user_from_connected_users(room_group_name, current_user)
 
         self.assertEqual(result, [])
-        self.assertIsNone(cache.get(room_group_name))
+        self.assertFalse(cache.has_key(self.redis_for_wishlist.connected_users_key(room_group_name)))
+        self.assertFalse(cache.has_key(self.redis_for_wishlist.connected_users_order_key(room_group_name)))
 
     def test_remove_user_but_keep_cache_if_other_users(self):
         """
         Test that the WishlistConsumer removes the user from the room but keeps the cache variable
         if other users are still connected.
         """
-        cache.set("test_room", json.dumps([self.user.name, self.second_user.name]))
-        current_user = self.user
         room_group_name = "test_room"
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.user)
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.second_user)
+        current_user = self.user
 
         result = self.redis_for_wishlist.remove_user_from_connected_users(room_group_name, current_user)
 
         self.assertEqual(result, [self.second_user.name])
-        self.assertEqual(json.loads(cache.get(room_group_name)), [self.second_user.name])
+        self.assertEqual(
+            self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.second_user),
+            [self.second_user.name],
+        )
+
+    def test_user_stays_connected_until_last_connection_is_closed(self):
+        """Test that a user connected from two tabs stays in the room until both tabs are closed."""
+        room_group_name = "test_room"
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.user)
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.second_user)
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.user)
+
+        result = self.redis_for_wishlist.remove_user_from_connected_users(room_group_name, self.user)
+        self.assertEqual(result, [self.user.name, self.second_user.name])
+
+        result = self.redis_for_wishlist.remove_user_from_connected_users(room_group_name, self.user)
+        self.assertEqual(result, [self.second_user.name])
+
+    def test_remove_user_not_in_room(self):
+        """Test that removing a user who is not connected does not fail."""
+        room_group_name = "test_room"
+
+        self.assertEqual(self.redis_for_wishlist.remove_user_from_connected_users(room_group_name, self.user), [])
+
+        self.redis_for_wishlist.get_currently_connected_users(room_group_name, self.second_user)
+        self.assertEqual(
+            self.redis_for_wishlist.remove_user_from_connected_users(room_group_name, self.user),
+            [self.second_user.name],
+        )
+
+    def test_get_wishlist_version_creates_version(self):
+        """Test that the version of a wishlist is created on first access and then stays the same."""
+        version = self.redis_for_wishlist.get_wishlist_version(self.wishlist.id)
+
+        self.assertIsNotNone(version)
+        self.assertEqual(self.redis_for_wishlist.get_wishlist_version(self.wishlist.id), version)
+
+    def test_wishlist_snapshot_is_stored_per_version_and_user(self):
+        """Test that a snapshot is only returned for the version and the user it was built for."""
+        version = self.redis_for_wishlist.get_wishlist_version(self.wishlist.id)
+        snapshot = build_wishlist_data(self.user)
+
+        self.redis_for_wishlist.set_wishlist_snapshot(self.wishlist.id, version, self.user.id, snapshot)
+
+        self.assertEqual(
+            self.redis_for_wishlist.get_wishlist_snapshot(self.wishlist.id, version, self.user.id), snapshot
+        )
+        self.assertIsNone(self.redis_for_wishlist.get_wishlist_snapshot(self.wishlist.id, version + 1, self.user.id))
+        self.assertIsNone(self.redis_for_wishlist.get_wishlist_snapshot(self.wishlist.id, version, self.second_user.id))
+
+    def test_record_wishlist_change_bumps_version(self):
+        """Test that recording a change gives it the next version of the wishlist."""
+        version = self.redis_for_wishlist.get_wishlist_version(self.wishlist.id)
+
+        change_version = self.redis_for_wishlist.record_wishlist_change(
+            self.wishlist.id, "create_wish", {"user": "Bob"}
+        )
+
+        self.assertEqual(change_version, version + 1)
+        self.assertEqual(self.redis_for_wishlist.get_wishlist_version(self.wishlist.id), change_version)
+
+    def test_record_wishlist_change_never_goes_backwards(self):
+        """Test that a lost version restarts above the previous one."""
+        version = self.redis_for_wishlist.get_wishlist_version(self.wishlist.id)
+        cache.delete(self.redis_for_wishlist.wishlist_version_key(self.wishlist.id))
+
+        change_version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "resync", None)
+
+        self.assertGreater(change_version, version)
+
+    def test_get_wishlist_changes_since_version(self):
+        """Test that only the changes recorded after the given version are returned, in order."""
+        first_version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "create_wish", {"n": 1})
+        second_version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "update_wish", {"n": 2})
+        third_version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "delete_wish", {"n": 3})
+
+        changes = self.redis_for_wishlist.get_wishlist_changes(self.wishlist.id, since=first_version)
+
+        self.assertEqual(
+            changes,
+            [
+                {"version": second_version, "action": "update_wish", "data": {"n": 2}},
+                {"version": third_version, "action": "delete_wish", "data": {"n": 3}},
+            ],
+        )
+        self.assertEqual(self.redis_for_wishlist.get_wishlist_changes(self.wishlist.id, since=third_version), [])
+
+    def test_get_wishlist_changes_compacted(self):
+        """Test that no changes are returned when the log does not go back to the given version."""
+        self.redis_for_wishlist.changes_max_length = 2
+        first_version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "create_wish", {"n": 1})
+        # The log starts with the first change
+        self.assertEqual(
+            len(self.redis_for_wishlist.get_wishlist_changes(self.wishlist.id, since=first_version - 1)), 1
+        )
+        self.assertIsNone(self.redis_for_wishlist.get_wishlist_changes(self.wishlist.id, since=first_version - 2))
+
+        second_version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "update_wish", {"n": 2})
+        self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "update_wish", {"n": 3})
+
+        # The first change was compacted
+        self.assertIsNone(self.redis_for_wishlist.get_wishlist_changes(self.wishlist.id, since=first_version - 1))
+        self.assertEqual(len(self.redis_for_wishlist.get_wishlist_changes(self.wishlist.id, since=first_version)), 2)
+        self.assertEqual(len(self.redis_for_wishlist.get_wishlist_changes(self.wishlist.id, since=second_version)), 1)
+
+    def test_get_replayable_wishlist_changes(self):
+        """Test that the changes are only replayable when none of them requires loading the wishlist again."""
+        since = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "create_wish", {"n": 1})
+        version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "update_wish", {"n": 2})
+
+        self.assertEqual(
+            self.redis_for_wishlist.get_replayable_wishlist_changes(self.wishlist.id, since=since),
+            (version, [{"version": version, "action": "update_wish", "data": {"n": 2}}]),
+        )
+        # A version the server never gave
+        self.assertEqual(
+            self.redis_for_wishlist.get_replayable_wishlist_changes(self.wishlist.id, since=version + 1),
+            (version, None),
+        )
+
+        resync_version = self.redis_for_wishlist.record_wishlist_change(self.wishlist.id, "resync")
+        self.assertEqual(
+            self.redis_for_wishlist.get_replayable_wishlist_changes(self.wishlist.id, since=since),
+            (resync_version, None),
+        )
+
+    def test_acquire_rate_limit_tokens(self):
+        """Test that the tokens of all the buckets of the message are taken, or none of them."""
+        limits = {"create_wish": {"rate": 0.01, "burst": 2}, "default": {"rate": 0.01, "burst": 3}}
+        key = str(self.wishlist.id)
+
+        self.assertEqual(
+            self.redis_for_wishlist.acquire_rate_limit_tokens(key, Counter(create_wish=1, update_wish=1), limits), 0
+        )
+        # Only one create_wish token left
+        retry_after = self.redis_for_wishlist.acquire_rate_limit_tokens(
+            key, Counter(create_wish=2, update_wish=1), limits
+        )
+        self.assertAlmostEqual(retry_after, 100, delta=1)
+
+        self.assertEqual(self.redis_for_wishlist.acquire_rate_limit_tokens(key, Counter(update_wish=2), limits), 0)
+        self.assertGreater(self.redis_for_wishlist.acquire_rate_limit_tokens(key, Counter(update_wish=1), limits), 0)
+        # Each key has its own buckets
+        self.assertEqual(self.redis_for_wishlist.acquire_rate_limit_tokens("other", Counter(update_wish=1), limits), 0)
+        # More than the burst never passes
+        self.assertGreater(
+            self.redis_for_wishlist.acquire_rate_limit_tokens("other", Counter(create_wish=3), limits), 0
+        )
@@ -0,0 +1,68 @@
+import json
+from decimal import Decimal
+from uuid import uuid4
+
+from django.test import RequestFactory
+from django.utils.translation import gettext_lazy
+from ninja.renderers import JSONRenderer
+
+from api.pydantic_models import WishListModel, WishListUserModel, WishListWishModel
+from api.tests.utils import SimpleWishlistBaseTestCase
+from simplewishlist.renderers import ORJSONRenderer, ORJSONParser
+
+
+class TestORJSONRenderer(SimpleWishlistBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().get("/api/v1/wishlist")
+
+    def render(self, renderer, data) -> dict:
+        return json.loads(renderer.render(self.request, data, response_status=200))
+
+    def test_same_output_as_stdlib_renderer(self):
+        """Test that the wishlist is rendered like with the default renderer, camelCase aliases included."""
+        wishlist = WishListModel(
+            wishlist_id=self.wishlist.id,
+            name=self.wishlist.wishlist_name,
+            surprise_mode_enabled=False,
+            allow_see_assigned=True,
+            current_user=self.user.name,
+            user_wishes=[
+                WishListUserModel(
+                    user=self.user.name,
+                    wishes=[
+                        WishListWishModel(
+                            name="Book", deleted=False, price="10", url="https://example.com/book", id=uuid4()
+                        )
+                    ],
+                )
+            ],
+        )
+        # Ninja dumps the response model with the aliases before rendering it
+        data = wishlist.model_dump(by_alias=True)
+
+        rendered = self.render(ORJSONRenderer(), data)
+
+        self.assertEqual(rendered, self.render(JSONRenderer(), data))
+        self.assertEqual(rendered["wishlistId"], str(self.wishlist.id))
+        self.assertEqual(rendered["userWishes"][0]["wishes"][0]["url"], "https://example.com/book")
+
+    def test_types_handled_by_ninja_encoder(self):
+        """Test that the types orjson does not know are serialized like with the default renderer."""
+        data = {
+            "id": uuid4(),
+            "price": Decimal("10.50"),
+            "message": gettext_lazy("Not found"),
+            "wish": WishListWishModel(name="Book", deleted=False, url="https://example.com/book"),
+        }
+
+        self.assertEqual(self.render(ORJSONRenderer(), data), self.render(JSONRenderer(), data))
+
+    def test_parse_body(self):
+        """Test that the request body is parsed, and that invalid bodies raise a JSONDecodeError."""
+        request = RequestFactory().post("/", data={"name": "Bob"}, content_type="application/json")
+        self.assertEqual(ORJSONParser().parse_body(request), {"name": "Bob"})
+
+        request = RequestFactory().post("/", data="{not json", content_type="application/json")
+        with self.assertRaises(json.JSONDecodeError):
+            ORJSONParser().parse_body(request)
@@ -1,7 +1,8 @@
 from django.test import TestCase
 
 from api.tests.factories import WishListFactory, WishListUserFactory, WishFactory
-from api.utils import get_all_users_wishes
+from api.utils import get_all_users_wishes, get_wishlist_data
+from core.models import Wish, WishListUser
 
 
 class TestGetAllUsersWishes(TestCase):
@@ -170,3 +171,52 @@ class TestGetAllUsersWishes(TestCase):
         self.assertIsNotNone(alice_wishes)
         self.assertEqual(len(alice_wishes), 1)
         self.assertEqual(alice_wishes[0].suggested_by, "Bob")
+
+
+class TestGetWishlistDataQueries(TestCase):
+    """The wishlist snapshot must be built with a fixed number of queries whatever the size of the wishlist"""
+
+    def setUp(self):
+        self.wishlist = WishListFactory(wishlist_name="Big family wishlist")
+        self.users = [WishListUserFactory(name=f"User {i}", wishlist=self.wishlist) for i in range(10)]
+
+    def create_wishes(self, wishes_count: int):
+        """Spread the wishes among the users, with assigned and suggested wishes"""
+        wishes = []
+        for i in range(wishes_count):
+            owner = self.users[i % len(self.users)]
+            other_user = self.users[(i + 1) % len(self.users)]
+            wishes.append(
+                Wish(
+                    name=f"Wish {i}",
+                    wishlist_user=owner,
+                    wishlist=self.wishlist,
+                    assigned_user=other_user if i % 3 == 0 else None,
+                    suggested_by=other_user if i % 5 == 0 else None,
+                )
+            )
+        Wish.objects.bulk_create(wishes)
+
+    def assert_snapshot_queries(self, wishes_count: int):
+        self.create_wishes(wishes_count)
+        # Fresh instance so that the wishlist is not already cached on the user
+        current_user = WishListUser.objects.get(pk=self.users[0].pk)
+
+        # 1 query for the wishlist, 1 for the active users and 1 for all their wishes
+        with self.assertNumQueries(3):
+            data = get_wishlist_data(current_user)
+
+        # Suggested wishes of the current user are hidden from them
+        hidden_wishes_count = Wish.objects.filter(wishlist_user=current_user, suggested_by__isnull=False).count()
+        self.assertEqual(
+            sum(len(user_wishes.wishes) for user_wishes in data.user_wishes), wishes_count - hidden_wishes_count
+        )
+
+    def test_snapshot_queries_10_wishes(self):
+        self.assert_snapshot_queries(10)
+
+    def test_snapshot_queries_100_wishes(self):
+        self.assert_snapshot_queries(100)
+
+    def test_snapshot_queries_1000_wishes(self):
+        self.assert_snapshot_queries(1000)
@@ -1,10 +1,13 @@
 import json
 import random
-from uuid import UUID
+from unittest.mock import patch
+from uuid import UUID, uuid4
 
+from django.db import DatabaseError
 from django.test.client import Client
 from django.urls import reverse
 
+from api.RedisForWishList import RedisForWishList
 from api.tests.factories import WishFactory
 from api.tests.utils import SimpleWishlistBaseTestCase
 from core.models import WishList, WishListUser
@@ -36,6 +39,143 @@ class TestWishListView(SimpleWishlistBaseTestCase):
 
         self.assertEqual(response.json(), expected_data)
 
+    def test_get_wishlist_is_cached_until_the_wishlist_changes(self):
+        """Test that the wishlist data is served from the cache as long as the wishlist version does not change"""
+        WishFactory.create(name="A big Teddy Bear", wishlist_user=self.second_user)
+        url = reverse("api-1.0.0:get_wishlist")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user_wishes["user"] for user_wishes in response.json()["userWishes"]], ["Bob", "Alice"])
+
+        # The authenticated user and the wishlist data come from the cache
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(cached_response.json(), response.json())
+
+        # Deactivating a user bumps the version of the wishlist
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("api-1.0.0:deactivate_user", kwargs={"user_id": str(self.second_user.id)}))
+
+        response = self.client.get(url)
+        self.assertEqual([user_wishes["user"] for user_wishes in response.json()["userWishes"]], ["Bob"])
+
+    def test_get_wishlist_not_modified(self):
+        """Test that the wishlist is not sent again as long as the ETag is matching the wishlist version"""
+        url = reverse("api-1.0.0:get_wishlist")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+
+        # The authenticated user comes from the cache, no query is run
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        # Another user has another ETag for the same wishlist
+        client = Client(headers={"Authorization": f"bearer {str(self.second_user.id)}"})
+        response = client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+        # Any change to the wishlist changes the ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("api-1.0.0:update_user_in_wishlist", kwargs={"user_id": str(self.second_user.id)}),
+                data=json.dumps({"name": "Alicia"}),
+                content_type="application/json",
+            )
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_wishlist_settings_and_users_not_modified(self):
+        """Test that every wishlist GET route answers conditional requests"""
+        for url in [reverse("api-1.0.0:get_wishlist_settings"), reverse("api-1.0.0:get_wishlist_users")]:
+            etag = self.client.get(url).headers["ETag"]
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+
+    def test_get_wishlist_users_for_selection_not_modified(self):
+        """Test that the unauthenticated route uses the version of the wishlist in the path"""
+        # Access the wishlist once to create its version
+        self.client.get(reverse("api-1.0.0:get_wishlist"))
+
+        client = Client()
+        url = reverse("api-1.0.0:get_wishlist_users_for_selection", kwargs={"wishlist_id": str(self.wishlist.id)})
+        etag = client.get(url).headers["ETag"]
+        response = client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        # No ETag for a wishlist that does not exist
+        fake_uuid = UUID(int=random.getrandbits(128), version=4)
+        url = reverse("api-1.0.0:get_wishlist_users_for_selection", kwargs={"wishlist_id": str(fake_uuid)})
+        response = client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response.headers)
+
+    def test_get_wishlist_changes(self):
+        """Test that the wish changes after the given version are returned"""
+        redis = RedisForWishList()
+        wish = WishFactory.create(name="A big Teddy Bear", wishlist_user=self.user)
+        since = redis.get_wishlist_version(self.wishlist.id)
+        wish_data = {
+            "user": "Bob",
+            "wish": {"name": wish.name, "deleted": False, "id": str(wish.id)},
+        }
+        version = redis.record_wishlist_change(self.wishlist.id, "create_wish", wish_data)
+
+        response = self.client.get(reverse("api-1.0.0:get_wishlist_changes_since"), {"since": since})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "version": version,
+                "changes": [
+                    {
+                        "version": version,
+                        "action": "create_wish",
+                        "data": {
+                            "user": "Bob",
+                            "wish": {
+                                "name": wish.name,
+                                "deleted": False,
+                                "price": None,
+                                "url": None,
+                                "description": None,
+                                "id": str(wish.id),
+                                "assignedUser": None,
+                                "suggestedBy": None,
+                            },
+                        },
+                    }
+                ],
+                "snapshot": None,
+            },
+        )
+
+    def test_get_wishlist_changes_falls_back_to_snapshot(self):
+        """Test that the whole wishlist is sent when the changes can not be replayed"""
+        redis = RedisForWishList()
+        since = redis.get_wishlist_version(self.wishlist.id)
+        url = reverse("api-1.0.0:get_wishlist_changes_since")
+
+        # The log does not go back to this version
+        response = self.client.get(url, {"since": since})
+        self.assertEqual(response.json()["changes"], [])
+        self.assertEqual(response.json()["snapshot"]["wishlistId"], str(self.wishlist.id))
+
+        # Users changes can not be replayed
+        since = redis.record_wishlist_change(self.wishlist.id, "delete_wish", {"user": "Bob", "wishId": str(uuid4())})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("api-1.0.0:deactivate_user", kwargs={"user_id": str(self.second_user.id)}))
+
+        response = self.client.get(url, {"since": since})
+        self.assertEqual(response.json()["changes"], [])
+        self.assertEqual([user_wishes["user"] for user_wishes in response.json()["snapshot"]["userWishes"]], ["Bob"])
+
     def test_put_wishlist(self):
         """Test that we can create the wishlist"""
         client = Client()  # only api call that does not need Authorization header
@@ -76,6 +216,43 @@ class TestWishListView(SimpleWishlistBaseTestCase):
         ]
         self.assertEqual(response.json(), expected_response)
 
+    def test_put_wishlist_with_many_users(self):
+        """Test that the users are created at once, whatever their number"""
+        client = Client()
+        data = {
+            "wishlist_name": "Secret Santa",
+            "allow_see_assigned": False,
+            "surprise_mode_enabled": True,
+            "other_users_names": [f"Colleague {i}" for i in range(200)],
+        }
+        url = reverse("api-1.0.0:create_wishlist")
+
+        # Savepoint, wishlist insert, users insert, savepoint release
+        with self.assertNumQueries(4):
+            response = client.put(url, json.dumps(data))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user["name"] for user in response.json()], data["other_users_names"])
+        wishlist = WishList.objects.get(wishlist_name="Secret Santa")
+        self.assertEqual(wishlist.wishlist_users.count(), 200)
+
+    def test_put_wishlist_failure_does_not_leave_a_wishlist(self):
+        """Test that the wishlist is not created when its users can not be created"""
+        client = Client(raise_request_exception=False)
+        data = {
+            "wishlist_name": "Half built wishlist",
+            "allow_see_assigned": False,
+            "surprise_mode_enabled": True,
+            "other_users_names": ["Peter", "Michelle"],
+        }
+        url = reverse("api-1.0.0:create_wishlist")
+
+        with patch.object(WishListUser.objects, "bulk_create", side_effect=DatabaseError):
+            response = client.put(url, json.dumps(data))
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(WishList.objects.filter(wishlist_name="Half built wishlist").exists())
+
     def test_put_wishlist_duplicated_names(self):
         """Test that we cannot create a wishlist with duplicated names"""
         client = Client()
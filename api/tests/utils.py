@@ -1,8 +1,21 @@
+import os
+
+from django.conf import settings
 from django.test import TestCase
 from django.test.client import Client
 
 from api.tests.factories import WishListFactory, WishListUserFactory
 
+# The tests flushing the Redis cache use a database of their own, not the one of the development server
+TEST_REDIS_CACHES = {
+    "default": {
+        **settings.CACHES["default"],
+        "LOCATION": (
+            f"redis://{os.environ['REDIS_HOST']}:{os.environ['REDIS_PORT']}/{os.environ.get('REDIS_TEST_DB', '15')}"
+        ),
+    }
+}
+
 
 class SimpleWishlistBaseTestCase(TestCase):
     def setUp(self):
@@ -1,6 +1,16 @@
+from collections import defaultdict
+
 from django.shortcuts import get_object_or_404
 
-from api.pydantic_models import WishModelUpdate, WishListUserModel, WishListModel
+from api.RedisForWishList import RedisForWishList
+from api.pydantic_models import (
+    WishModelUpdate,
+    WishModelUpdateAssignUser,
+    WishListUserModel,
+    WishListModel,
+    WishListWishModel,
+    WishlistChangesModel,
+)
 from core.models import Wish, WishListUser, WishList
 
 
@@ -23,42 +33,65 @@ def do_update_wish(
     return instance
 
 
-def get_all_users_wishes(wishlist: WishList, current_user: WishListUser) -> list[WishListUserModel]:
-    """Return all the wishes of all the users in the wishlist"""
-    from api.pydantic_models import WishListWishModel
+def do_assign_wish(current_user: WishListUser, wish_id: int, payload: WishModelUpdateAssignUser) -> Wish:
+    """
+    Assign a wish to the current user, or de-assign it, if no one else changed the assigned user first
+
+    Args:
+        current_user (WishListUser): The current user
+        wish_id (int): The wish id
+        payload (WishModelUpdateAssignUser): The payload with the new assigned user (None to de-assign)
+    """
+    return Wish.set_assigned_user(
+        wish_id, candidate_assigned_user_id=payload.assigned_user, current_user_id=current_user.id
+    )
+
 
+def build_wish_model(wish: Wish) -> WishListWishModel:
+    """
+    Convert a wish into its pydantic representation
+    assigned_user and suggested_by should be loaded with select_related to avoid extra queries
+    """
+    return WishListWishModel(
+        name=wish.name,
+        price=wish.price or None,
+        description=wish.description or None,
+        url=wish.url or None,
+        id=wish.id,
+        assigned_user=wish.assigned_user.name if wish.assigned_user else None,
+        deleted=wish.deleted,
+        suggested_by=wish.suggested_by.name if wish.suggested_by else None,
+    )
+
+
+def get_all_users_wishes(wishlist: WishList, current_user: WishListUser) -> list[WishListUserModel]:
+    """
+    Return all the wishes of all the users in the wishlist
+    The number of queries is fixed (one for the users, one for all their wishes) whatever the size of the wishlist
+    """
     users = wishlist.get_active_users()
+    # All the wishes of the wishlist at once, with its index on the wishlist
+    wishes_by_user = defaultdict(list)
+    for wish in Wish.objects.filter(wishlist=wishlist).select_related("assigned_user", "suggested_by"):
+        wishes_by_user[wish.wishlist_user_id].append(wish)
+
     users_wishes = []
     for user in users:
-        # Get all wishes for this user
-        wishes_queryset = user.wishes.all()
+        is_current_user = user.id == current_user.id
 
-        # Filter out suggested wishes if the current user is viewing their own wishes
-        if user == current_user:
-            wishes_queryset = wishes_queryset.exclude(suggested_by__isnull=False)
-
-        # Convert to pydantic models
         wishes = []
-        for wish in wishes_queryset:
-            wishes.append(
-                WishListWishModel(
-                    name=wish.name,
-                    price=wish.price or None,
-                    description=wish.description or None,
-                    url=wish.url or None,
-                    id=wish.id,
-                    assigned_user=wish.assigned_user.name if wish.assigned_user else None,
-                    deleted=wish.deleted,
-                    suggested_by=wish.suggested_by.name if wish.suggested_by else None,
-                )
-            )
+        for wish in wishes_by_user[user.id]:
+            # Filter out suggested wishes if the current user is viewing their own wishes
+            if is_current_user and wish.suggested_by_id is not None:
+                continue
+            wishes.append(build_wish_model(wish))
 
         wish_schema = WishListUserModel(
             user=user.name,
             wishes=wishes,
         )
 
-        if user == current_user:
+        if is_current_user:
             # The current user should be the first one
             users_wishes.insert(0, wish_schema)
         else:
@@ -67,8 +100,8 @@ def get_all_users_wishes(wishlist: WishList, current_user: WishListUser) -> list
     return users_wishes
 
 
-def get_wishlist_data(user: WishListUser) -> WishListModel:
-    """Get the wishlist users and corresponding wishes"""
+def build_wishlist_data(user: WishListUser) -> WishListModel:
+    """Build the wishlist users and corresponding wishes from the database"""
     wishlist = user.wishlist
     # For each user, we need to collect their wishes
     users_wishes = get_all_users_wishes(wishlist, user)
@@ -81,3 +114,43 @@ def get_wishlist_data(user: WishListUser) -> WishListModel:
         current_user=user.name,
         user_wishes=users_wishes,
     )
+
+
+def get_wishlist_data(user: WishListUser) -> WishListModel:
+    """
+    Get the wishlist users and corresponding wishes
+    The data is cached for the current version of the wishlist, any change to the wishlist bumps the version
+    """
+    _, data = get_wishlist_data_and_version(user)
+    return data
+
+
+def get_wishlist_data_and_version(user: WishListUser) -> tuple[int | None, WishListModel]:
+    """
+    Get the wishlist users and corresponding wishes, and the version of the wishlist they reflect
+    The data includes at least the changes up to this version, it may include changes being recorded
+    """
+    redis = RedisForWishList()
+    version = redis.get_wishlist_version(user.wishlist_id)
+    if version is None:
+        return None, build_wishlist_data(user)
+
+    data = redis.get_wishlist_snapshot(user.wishlist_id, version, user.id)
+    if data is None:
+        data = build_wishlist_data(user)
+        redis.set_wishlist_snapshot(user.wishlist_id, version, user.id, data)
+
+    return version, data
+
+
+def get_wishlist_changes(user: WishListUser, since: int) -> WishlistChangesModel:
+    """
+    Get the wish changes of the wishlist recorded after the given version
+    Fall back to the whole wishlist when these changes can not be replayed (compacted log, users or settings changes)
+    """
+    version, changes = RedisForWishList().get_replayable_wishlist_changes(user.wishlist_id, since)
+
+    if changes is None:
+        return WishlistChangesModel(version=version, snapshot=get_wishlist_data(user))
+
+    return WishlistChangesModel(version=version, changes=changes)
@@ -0,0 +1,79 @@
+"""
+Fan-out latency of a group message with the LocalChannelLayer and the Redis channel layer, per room size
+
+Every member of the room waits on receive() like a consumer does; the latency is the time from group_send until the
+last member received the message. The Redis layer uses REDIS_HOST / REDIS_PORT, like the settings.
+
+    python -m benchmarks.bench_channel_layers --room-sizes 5 30 100 300
+"""
+
+import asyncio
+import os
+import time
+
+from benchmarks.utils import base_argument_parser, latency_summary, setup_django, write_results
+
+
+def get_message() -> dict:
+    """An updated_wish message, as sent by the WishlistConsumer with pre-encoded broadcasts"""
+    return {"type": "updated_wish", "text": '{"type":"updated_wish","data":{"user":"Bob"}}' * 10}
+
+
+async def fan_out(layer, room_size: int, repeats: int) -> list[float]:
+    """Latency in seconds of each group message, until all the members received it"""
+    group = f"wishlist_benchmark_{room_size}"
+    channels = [await layer.new_channel() for _ in range(room_size)]
+    for channel in channels:
+        await layer.group_add(group, channel)
+
+    latencies = []
+    for _ in range(repeats):
+        receivers = [asyncio.ensure_future(layer.receive(channel)) for channel in channels]
+        # Let the receivers wait on their channel
+        await asyncio.sleep(0.01)
+
+        start = time.perf_counter()
+        await layer.group_send(group, get_message())
+        await asyncio.gather(*receivers)
+        latencies.append(time.perf_counter() - start)
+
+    for channel in channels:
+        await layer.group_discard(group, channel)
+    return latencies
+
+
+async def run(room_sizes: list[int], repeats: int) -> list[dict]:
+    from channels_redis.core import RedisChannelLayer
+
+    from simplewishlist.channel_layers import LocalChannelLayer
+
+    layers = {
+        "local": LocalChannelLayer,
+        "redis": lambda: RedisChannelLayer(hosts=[(os.environ["REDIS_HOST"], os.environ["REDIS_PORT"])]),
+    }
+
+    results = []
+    for name, create_layer in layers.items():
+        for room_size in room_sizes:
+            layer = create_layer()
+            latencies = await fan_out(layer, room_size, repeats)
+            await layer.flush()
+            if name == "redis":
+                await layer.close_pools()
+            results.append({"layer": name, "room_size": room_size, **latency_summary(latencies)})
+    return results
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument("--room-sizes", type=int, nargs="+", default=[5, 30, 100, 300], help="Members per room")
+    parser.add_argument("--repeats", type=int, default=200, help="Group messages sent per room size")
+    args = parser.parse_args()
+
+    setup_django()
+
+    write_results("channel_layers", asyncio.run(run(args.room_sizes, args.repeats)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Compare the asyncio WishlistConsumer with the previous thread based (sync) implementation
+
+For each consumer, N members of a wishlist connect, then one of them creates wishes:
+we measure how fast the connections are accepted by one worker and how long a broadcast takes to reach every member.
+
+    python -m benchmarks.bench_consumers --members 200 --broadcasts 50
+"""
+
+import asyncio
+import contextlib
+import time
+
+from benchmarks.utils import (
+    base_argument_parser,
+    benchmark_database,
+    drain,
+    latency_summary,
+    setup_django,
+    write_results,
+)
+
+
+def get_sync_consumer_class():
+    """The thread based consumer, as it was before WishlistConsumer moved to asyncio"""
+    from asgiref.sync import async_to_sync
+    from channels.generic.websocket import JsonWebsocketConsumer
+
+    from api.consumers import WishlistConsumer
+    from api.pydantic_models import WebhookPayloadModel
+    from core.models import WishListUser
+
+    class SyncWishlistConsumer(JsonWebsocketConsumer):
+        current_user = None
+        wishlist = None
+        room_group_name = None
+        redis = WishlistConsumer.redis
+
+        # The database work is the same, only the concurrency model changes
+        _create_wish = WishlistConsumer._create_wish
+        _prepare_updated_wish = WishlistConsumer._prepare_updated_wish
+
+        def connect(self):
+            self.current_user = WishListUser.objects.get(pk=self.scope["url_route"]["kwargs"]["wishlist_user"])
+            self.wishlist = self.current_user.wishlist
+            self.room_group_name = f"wishlist_{self.wishlist.id}"
+            async_to_sync(self.channel_layer.group_add)(self.room_group_name, self.channel_name)
+            self.accept("authorization")
+            room_connected_users = self.redis.get_currently_connected_users(self.room_group_name, self.current_user)
+            self.send_group_message("new_group_member_connection", "new_group_member_connection", room_connected_users)
+
+        def disconnect(self, close_code):
+            self.redis.remove_user_from_connected_users(self.room_group_name, self.current_user)
+            async_to_sync(self.channel_layer.group_discard)(self.room_group_name, self.channel_name)
+
+        def receive_json(self, content: dict, **kwargs):
+            payload = WebhookPayloadModel.model_validate(content)
+            change = self._create_wish(payload)
+            # The same message as WishlistConsumer.send_group_message, encoded by every member
+            self.send_group_message("updated_wish", change["action"], change["data"], seq=change["seq"])
+
+        def send_group_message(self, type: str, action: str, data, seq: int = None):
+            message = {"type": type, "data": data, "userToken": self.current_user.name, "action": action}
+            if seq is not None:
+                message["seq"] = seq
+            async_to_sync(self.channel_layer.group_send)(self.room_group_name, message)
+
+        def updated_wish(self, content: dict):
+            self.send_json(content)
+
+        def new_group_member_connection(self, content: dict):
+            self.send_json(content)
+
+    return SyncWishlistConsumer
+
+
+def create_members(name: str, members: int) -> list:
+    from api.tests.factories import WishListFactory, WishListUserFactory
+
+    wishlist = WishListFactory(wishlist_name=f"Benchmark {name}")
+    return [WishListUserFactory(name=f"Member {i}", wishlist=wishlist) for i in range(members)]
+
+
+async def run_consumer(consumer_class, users: list, broadcasts: int, batch_size: int) -> dict:
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+    from django.urls import path
+
+    application = URLRouter([path("ws/wishlist/<uuid:wishlist_user>/", consumer_class.as_asgi())])
+    members = len(users)
+
+    # Connections, by batches so that the join notifications do not overflow the channel layer
+    communicators = []
+    connect_latencies = []
+    connect_start = time.perf_counter()
+    for batch_start in range(0, members, batch_size):
+
+        async def connect(user):
+            communicator = WebsocketCommunicator(application, f"/ws/wishlist/{user.id}/")
+            start = time.perf_counter()
+            connected, _ = await communicator.connect(timeout=30)
+            connect_latencies.append(time.perf_counter() - start)
+            if not connected:
+                raise RuntimeError(f"{user.name} could not connect")
+            return communicator
+
+        batch = await asyncio.gather(*(connect(user) for user in users[batch_start : batch_start + batch_size]))
+        communicators.extend(batch)
+        await drain(communicators)
+    connect_seconds = time.perf_counter() - connect_start
+
+    # Broadcasts from the first member to everyone
+    sender = communicators[0]
+    broadcast_latencies = []
+    broadcast_start = time.perf_counter()
+    for i in range(broadcasts):
+        start = time.perf_counter()
+        await sender.send_json_to(
+            {"type": "create_wish", "currentUser": str(users[0].id), "post_values": {"name": f"Wish {i}"}}
+        )
+
+        async def receive(communicator):
+            await communicator.receive_json_from(timeout=30)
+            broadcast_latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(receive(communicator) for communicator in communicators))
+    broadcast_seconds = time.perf_counter() - broadcast_start
+
+    for communicator in communicators:
+        # The presence bookkeeping of concurrent connections is not part of the measure
+        with contextlib.suppress(Exception):
+            await communicator.disconnect()
+
+    return {
+        "members": members,
+        "connect_seconds": round(connect_seconds, 3),
+        "connections_per_second": round(members / connect_seconds, 1),
+        "connect_latency": latency_summary(connect_latencies),
+        "broadcasts": broadcasts,
+        "broadcasts_per_second": round(broadcasts / broadcast_seconds, 1),
+        "broadcast_latency": latency_summary(broadcast_latencies),
+    }
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument("--members", type=int, default=100, help="Members connected to the wishlist")
+    parser.add_argument("--broadcasts", type=int, default=20, help="Wishes created by one member")
+    parser.add_argument("--batch-size", type=int, default=50, help="Members connecting at the same time")
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+
+    # The wishes are created much faster than a member would, the limits would throttle the sender
+    settings.WEBSOCKET_RATE_LIMITING = False
+
+    from api.consumers import WishlistConsumer
+
+    results = {}
+    with benchmark_database():
+        for name, consumer_class in [("sync", get_sync_consumer_class()), ("async", WishlistConsumer)]:
+            users = create_members(name, args.members)
+            results[name] = asyncio.run(run_consumer(consumer_class, users, args.broadcasts, args.batch_size))
+
+    write_results("consumers", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+CPU cost of fanning out one group message of the WishlistConsumer, per room size
+
+The message goes through the real send_group_message and updated_wish handlers and the serializer of
+channels_redis, without Redis nor sockets: we compare encoding the message once at the sender
+(WEBSOCKET_PRE_ENCODED_BROADCASTS) with encoding it in every member of the room.
+
+    python -m benchmarks.bench_fanout --room-sizes 5 30 100 300
+"""
+
+import asyncio
+import time
+import uuid
+from types import SimpleNamespace
+
+from benchmarks.utils import base_argument_parser, setup_django, write_results
+
+
+def get_user_wish_data() -> dict:
+    """A wish update as sent to the group"""
+    return {
+        "user": "Bob",
+        "wish": {
+            "name": "A nice book about distributed systems",
+            "price": "34.90",
+            "url": "https://example.com/books/distributed-systems?ref=wishlist",
+            "description": "Hardcover if possible, any edition after the third one is fine. " * 3,
+            "id": str(uuid.uuid4()),
+            "deleted": False,
+            "assignedUser": "Alice",
+            "suggestedBy": None,
+        },
+    }
+
+
+class CapturingChannelLayer:
+    """Keep the message instead of sending it"""
+
+    message = None
+
+    async def group_send(self, group, message):
+        self.message = message
+
+
+async def fan_out(room_size: int, repeats: int) -> float:
+    """CPU seconds to deliver one group message to every member of the room"""
+    from channels_redis.core import RedisChannelLayer
+
+    from api.consumers import WishlistConsumer
+
+    serializer_layer = RedisChannelLayer()
+    channel_layer = CapturingChannelLayer()
+
+    sender = WishlistConsumer()
+    sender.channel_layer = channel_layer
+    sender.room_group_name = "wishlist_benchmark"
+    sender.current_user = SimpleNamespace(name="Bob")
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    members = []
+    for _ in range(room_size):
+        member = WishlistConsumer()
+        member.base_send = send
+        members.append(member)
+
+    data = get_user_wish_data()
+    start = time.process_time()
+    for _ in range(repeats):
+        sent.clear()
+        await sender.send_group_message("updated_wish", "update_wish", data)
+        # channels_redis serializes the message for the layer and every receiving consumer deserializes it
+        for member in members:
+            content = serializer_layer.deserialize(serializer_layer.serialize(channel_layer.message))
+            await member.updated_wish(content)
+        # The frames are queued, the writer task of every member sends them
+        while len(sent) < room_size:
+            await asyncio.sleep(0)
+    if len(sent) != room_size:
+        raise RuntimeError(f"{len(sent)} members received the message instead of {room_size}")
+    return (time.process_time() - start) / repeats
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument("--room-sizes", type=int, nargs="+", default=[5, 30, 100, 300], help="Members per room")
+    parser.add_argument("--repeats", type=int, default=200, help="Messages sent per room size and mode")
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import override_settings
+
+    results = []
+    for room_size in args.room_sizes:
+        result = {"room_size": room_size}
+        for name, pre_encoded in [("per_member_encoding", False), ("pre_encoded", True)]:
+            with override_settings(WEBSOCKET_PRE_ENCODED_BROADCASTS=pre_encoded):
+                cpu_seconds = asyncio.run(fan_out(room_size, args.repeats))
+            result[f"{name}_cpu_us"] = round(cpu_seconds * 1_000_000, 1)
+        result["speedup"] = round(result["per_member_encoding_cpu_us"] / result["pre_encoded_cpu_us"], 2)
+        results.append(result)
+
+    write_results("fanout", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare the stdlib and the orjson renderers (and parsers) of the API on wishlist payloads
+
+The payload is a WishListModel dumped the way Ninja does it before rendering (by_alias=True),
+no database is needed.
+
+    python -m benchmarks.bench_renderers --wishes 100 1000 10000
+"""
+
+import time
+import uuid
+
+from benchmarks.utils import base_argument_parser, latency_summary, setup_django, write_results
+
+
+def get_wishlist_payload(wishes: int, users: int = 10) -> dict:
+    from api.pydantic_models import WishListModel, WishListUserModel, WishListWishModel
+
+    user_wishes = [
+        WishListUserModel(
+            user=f"User {user}",
+            wishes=[
+                WishListWishModel(
+                    name=f"Wish {wish} of user {user}",
+                    deleted=False,
+                    price="19.99",
+                    url=f"https://example.com/products/{wish}?ref=wishlist",
+                    description="Any color but green, the bigger size if possible.",
+                    id=uuid.uuid4(),
+                    assigned_user="User 0" if wish % 3 == 0 else None,
+                )
+                for wish in range(wishes // users)
+            ],
+        )
+        for user in range(users)
+    ]
+    wishlist = WishListModel(
+        wishlist_id=uuid.uuid4(),
+        name="Benchmark",
+        surprise_mode_enabled=True,
+        allow_see_assigned=False,
+        current_user="User 0",
+        user_wishes=user_wishes,
+    )
+    return wishlist.model_dump(by_alias=True)
+
+
+def measure(func, repeats: int) -> list[float]:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument("--wishes", type=int, nargs="+", default=[100, 1000, 10000], help="Wishes in the wishlist")
+    parser.add_argument("--repeats", type=int, default=50, help="Renderings per payload and renderer")
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import RequestFactory, override_settings
+    from ninja.parser import Parser
+    from ninja.renderers import JSONRenderer
+
+    from simplewishlist.renderers import ORJSONParser, ORJSONRenderer
+
+    backends = {"json": (JSONRenderer(), Parser()), "orjson": (ORJSONRenderer(), ORJSONParser())}
+
+    results = []
+    for wishes in args.wishes:
+        payload = get_wishlist_payload(wishes)
+        get_request = RequestFactory().get("/api/v1/wishlist")
+        result = {"wishes": wishes}
+        for name, (renderer, body_parser) in backends.items():
+            content = renderer.render(get_request, payload, response_status=200)
+            post_request = RequestFactory().post("/api/v1/wishlist", data=content, content_type="application/json")
+            # The biggest wishlists are above the default limit of the request bodies, read it once without the limit
+            with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+                post_request.body
+            result[name] = {
+                "bytes": len(content),
+                "render": latency_summary(
+                    measure(lambda: renderer.render(get_request, payload, response_status=200), args.repeats)
+                ),
+                "parse": latency_summary(measure(lambda: body_parser.parse_body(post_request), args.repeats)),
+            }
+        result["render_p50_speedup"] = round(
+            result["json"]["render"]["p50_ms"] / result["orjson"]["render"]["p50_ms"], 2
+        )
+        results.append(result)
+
+    write_results("renderers", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
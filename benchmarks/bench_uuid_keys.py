@@ -0,0 +1,69 @@
+"""
+Compare uuid4 and uuid7 primary keys: insert throughput and size of the primary key index as the table grows
+
+Each kind of key is inserted in its own table (id uuid primary key, name varchar), in batches, in a throwaway
+database. The throughput of the last batches shows how the inserts slow down once the index does not fit in memory.
+
+    python -m benchmarks.bench_uuid_keys --rows 10000000
+"""
+
+import time
+import uuid
+
+from benchmarks.utils import base_argument_parser, benchmark_database, setup_django, write_results
+
+
+def insert_rows(cursor, table: str, generate_id, rows: int, batch_size: int) -> list[float]:
+    """Insert the rows in batches, return the duration of each batch"""
+    durations = []
+    for start in range(0, rows, batch_size):
+        ids = [str(generate_id()) for _ in range(min(batch_size, rows - start))]
+        batch_start = time.perf_counter()
+        cursor.execute(f"INSERT INTO {table} (id, name) SELECT unnest(%s::uuid[]), 'Wish'", [ids])
+        durations.append(time.perf_counter() - batch_start)
+    return durations
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Rows inserted per kind of key")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Rows inserted per statement")
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import connection
+
+    from core.utils import uuid7
+
+    results = []
+    with benchmark_database():
+        with connection.cursor() as cursor:
+            for name, generate_id in [("uuid4", uuid.uuid4), ("uuid7", uuid7)]:
+                table = f"bench_{name}_keys"
+                cursor.execute(f"CREATE TABLE {table} (id uuid PRIMARY KEY, name varchar(255) NOT NULL)")
+
+                durations = insert_rows(cursor, table, generate_id, args.rows, args.batch_size)
+                # The last tenth of the batches, inserted into the biggest index
+                last_durations = durations[-max(1, len(durations) // 10) :]
+                last_rows = min(args.rows, len(last_durations) * args.batch_size)
+
+                cursor.execute("SELECT pg_relation_size(%s), pg_relation_size(%s)", [table, f"{table}_pkey"])
+                table_bytes, index_bytes = cursor.fetchone()
+                results.append(
+                    {
+                        "key": name,
+                        "rows": args.rows,
+                        "rows_per_second": round(args.rows / sum(durations)),
+                        "last_rows_per_second": round(last_rows / sum(last_durations)),
+                        "table_mb": round(table_bytes / 2**20, 1),
+                        "index_mb": round(index_bytes / 2**20, 1),
+                    }
+                )
+                cursor.execute(f"DROP TABLE {table}")
+
+    write_results("uuid_keys", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Load test of the websockets: members of several wishlists connected to the ASGI application of simplewishlist/asgi.py
+
+The application runs in this process, the members are WebsocketCommunicators (no sockets, no server): the measures
+include the whole consumer stack, the configured channel layer (CHANNEL_LAYER), Redis and the database.
+The members connect by batches, then every wishlist receives a mix of create/update/assign/delete frames sent by
+random members, one frame at a time per wishlist and all the wishlists at once. We measure the connect latency,
+the fan-out latency (from the frame being sent until each member of the wishlist received the change), the frames
+and messages per second, and the memory per connection (both ends of the connection are in this process).
+
+    python -m benchmarks.bench_websocket_load --members 1000 --wishlists 50 --frames 2000 --mix create=2,update=1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import os
+import random
+import resource
+import time
+from collections import Counter, defaultdict
+
+from benchmarks.utils import (
+    base_argument_parser,
+    benchmark_database,
+    drain,
+    latency_summary,
+    setup_django,
+    write_results,
+)
+
+FRAME_TYPES = ("create", "update", "assign", "delete")
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """Weights of the frame types, as create=4,update=3,assign=2,delete=1"""
+    mix = {}
+    for item in value.split(","):
+        frame_type, _, weight = item.partition("=")
+        if frame_type not in FRAME_TYPES or not weight.isdigit():
+            raise argparse.ArgumentTypeError(f"Invalid frame weight {item!r}, expected one of {FRAME_TYPES}=<weight>")
+        mix[frame_type] = int(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("At least one frame type needs a weight")
+    return mix
+
+
+def get_rss_bytes() -> int:
+    """Resident memory of the process, the peak one when the current one is not available (not Linux)"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_origin() -> bytes:
+    """
+    An origin accepted by the AllowedHostsOriginValidator of the application
+    Should be called before the application is imported, the validator reads ALLOWED_HOSTS when it is created
+    """
+    from django.conf import settings
+
+    host = next((host.lstrip(".") for host in settings.ALLOWED_HOSTS if host not in ("", "*")), None)
+    if host is None:
+        host = "localhost"
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, host]
+    return f"http://{host}".encode()
+
+
+class Room:
+    """A wishlist, its members and the wishes they can send frames about"""
+
+    def __init__(self, users: list, wishes: list):
+        self.users = users
+        self.communicators = {}
+        # wish id: (owner id, assigned user id)
+        self.wishes = {str(wish.id): (wish.wishlist_user_id, None) for wish in wishes}
+        self.created = 0
+
+    def next_frame(self, rng: random.Random, mix: dict[str, int]) -> tuple[str, object, dict]:
+        """Type, sender and content of a random frame, a create when there is no wish to update/assign/delete"""
+        frame_type = rng.choices(list(mix), weights=list(mix.values()))[0]
+        sender = rng.choice(self.users)
+        own_wishes = [wish_id for wish_id, (owner_id, _) in self.wishes.items() if owner_id == sender.id]
+        free_wishes = [
+            wish_id
+            for wish_id, (owner_id, assigned_user_id) in self.wishes.items()
+            if owner_id != sender.id and assigned_user_id is None
+        ]
+        content = {"currentUser": str(sender.id)}
+
+        if frame_type == "update" and own_wishes:
+            content.update(type="update_wish", objectId=rng.choice(own_wishes), post_values={"name": "Updated wish"})
+        elif frame_type == "assign" and free_wishes:
+            content.update(
+                type="update_wish",
+                objectId=rng.choice(free_wishes),
+                post_values={"assignedUser": content["currentUser"]},
+            )
+        elif frame_type == "delete" and own_wishes:
+            content.update(type="delete_wish", objectId=rng.choice(own_wishes))
+        else:
+            frame_type = "create"
+            self.created += 1
+            content.update(type="create_wish", post_values={"name": f"Wish {self.created}"})
+        return frame_type, sender, content
+
+    def apply(self, frame_type: str, sender, content: dict, response: dict):
+        """Keep track of the wishes once the change is received"""
+        match frame_type:
+            case "create":
+                self.wishes[response["data"]["wish"]["id"]] = (sender.id, None)
+            case "assign":
+                owner_id, _ = self.wishes[content["objectId"]]
+                self.wishes[content["objectId"]] = (owner_id, sender.id)
+            case "delete":
+                del self.wishes[content["objectId"]]
+
+
+def create_rooms(members: int, wishlists: int, wishes_per_member: int) -> list[Room]:
+    """The members spread over the wishlists, each with its wishes"""
+    from core.models import Wish, WishList, WishListUser
+
+    rooms = []
+    for i in range(wishlists):
+        wishlist = WishList.objects.create(wishlist_name=f"Load test {i}")
+        room_size = members // wishlists + (1 if i < members % wishlists else 0)
+        users = WishListUser.objects.bulk_create(
+            [WishListUser(name=f"Member {j}", wishlist=wishlist) for j in range(room_size)]
+        )
+        wishes = Wish.objects.bulk_create(
+            [
+                Wish(name=f"Wish {k} of {user.name}", wishlist_user=user, wishlist=wishlist)
+                for user in users
+                for k in range(wishes_per_member)
+            ]
+        )
+        rooms.append(Room(users, wishes))
+    return rooms
+
+
+async def connect_members(application, origin: bytes, rooms: list[Room], batch_size: int) -> list[float]:
+    """Connect every member, by batches so that the join notifications do not overflow the channel layer"""
+    from channels.testing import WebsocketCommunicator
+
+    members = [(room, user) for room in rooms for user in room.users]
+    latencies = []
+
+    async def connect(room: Room, user):
+        communicator = WebsocketCommunicator(application, f"/ws/wishlist/{user.id}/", headers=[(b"origin", origin)])
+        start = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=30)
+        latencies.append(time.perf_counter() - start)
+        if not connected:
+            raise RuntimeError(f"{user.name} could not connect")
+        room.communicators[user.id] = communicator
+        return communicator
+
+    for batch_start in range(0, len(members), batch_size):
+        batch = await asyncio.gather(*(connect(*member) for member in members[batch_start : batch_start + batch_size]))
+        await drain(batch)
+    await drain([communicator for room in rooms for communicator in room.communicators.values()])
+    return latencies
+
+
+async def drive_room(room: Room, frames: int, mix: dict[str, int], rng: random.Random, measures: dict):
+    """Send the frames one at a time, each one once every member of the room received the previous one"""
+
+    async def receive(communicator) -> tuple[dict, float]:
+        response = await communicator.receive_json_from(timeout=30)
+        return response, time.perf_counter()
+
+    for _ in range(frames):
+        frame_type, sender, content = room.next_frame(rng, mix)
+        receivers = {
+            user_id: asyncio.ensure_future(receive(communicator))
+            for user_id, communicator in room.communicators.items()
+        }
+        start = time.perf_counter()
+        await room.communicators[sender.id].send_json_to(content)
+
+        # The sender gets the error, or the change through the group like everybody
+        response, _ = await receivers[sender.id]
+        if response["type"] == "error_message":
+            for receiver in receivers.values():
+                receiver.cancel()
+            measures["errors"][frame_type] += 1
+            continue
+
+        received_at = [at for _, at in await asyncio.gather(*receivers.values())]
+        room.apply(frame_type, sender, content, response)
+        measures["fan_out"].extend(at - start for at in received_at)
+        measures["complete"][frame_type].append(max(received_at) - start)
+
+
+async def run(rooms: list[Room], args) -> dict:
+    from django.conf import settings
+
+    origin = get_origin()
+    from simplewishlist.asgi import application
+
+    gc.collect()
+    rss_before = get_rss_bytes()
+    connect_start = time.perf_counter()
+    connect_latencies = await connect_members(application, origin, rooms, args.batch_size)
+    connect_seconds = time.perf_counter() - connect_start
+    gc.collect()
+    rss_per_connection = (get_rss_bytes() - rss_before) / args.members
+
+    # Seeded so that the runs send the same frames, nothing depends on them being unpredictable
+    rng = random.Random(args.seed)  # nosec B311
+    measures = {"errors": Counter(), "fan_out": [], "complete": defaultdict(list)}
+    frames_per_room = [
+        args.frames // len(rooms) + (1 if i < args.frames % len(rooms) else 0) for i in range(len(rooms))
+    ]
+    drive_start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            drive_room(room, frames, args.mix, random.Random(rng.random()), measures)  # nosec B311
+            for room, frames in zip(rooms, frames_per_room)
+        )
+    )
+    drive_seconds = time.perf_counter() - drive_start
+
+    for room in rooms:
+        for communicator in room.communicators.values():
+            # The presence bookkeeping of the disconnections is not part of the measure
+            with contextlib.suppress(Exception):
+                await communicator.disconnect()
+
+    delivered_frames = sum(len(latencies) for latencies in measures["complete"].values())
+    return {
+        "channel_layer": settings.CHANNEL_LAYERS["default"]["BACKEND"],
+        "members": args.members,
+        "wishlists": len(rooms),
+        "connect_seconds": round(connect_seconds, 3),
+        "connections_per_second": round(args.members / connect_seconds, 1),
+        "connect_latency": latency_summary(connect_latencies),
+        "memory_per_connection_kb": round(rss_per_connection / 1024, 1),
+        "frames": args.frames,
+        "frames_per_second": round(args.frames / drive_seconds, 1),
+        "messages_delivered": len(measures["fan_out"]),
+        "messages_per_second": round(len(measures["fan_out"]) / drive_seconds, 1),
+        # From the frame being sent until one member received the change, and until all the members received it
+        "fan_out_latency": latency_summary(measures["fan_out"]),
+        "fan_out_complete_latency": latency_summary(
+            [latency for latencies in measures["complete"].values() for latency in latencies]
+        ),
+        "frame_types": {
+            frame_type: {
+                "delivered": len(measures["complete"][frame_type]),
+                "errors": measures["errors"][frame_type],
+                "fan_out_complete_latency": latency_summary(measures["complete"][frame_type]),
+            }
+            for frame_type in FRAME_TYPES
+        },
+        "errors": sum(measures["errors"].values()),
+        "delivered_frames": delivered_frames,
+    }
+
+
+def main():
+    parser = base_argument_parser(__doc__)
+    parser.add_argument("--members", type=int, default=200, help="Members connected, spread over the wishlists")
+    parser.add_argument("--wishlists", type=int, default=10, help="Wishlists the members belong to")
+    parser.add_argument("--frames", type=int, default=500, help="Frames sent, spread over the wishlists")
+    parser.add_argument(
+        "--mix", type=parse_mix, default="create=4,update=3,assign=2,delete=1", help="Weights of the frame types"
+    )
+    parser.add_argument("--wishes-per-member", type=int, default=3, help="Wishes of each member before the test")
+    parser.add_argument("--batch-size", type=int, default=50, help="Members connecting at the same time")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random frames")
+    parser.add_argument(
+        "--rate-limiting", action="store_true", help="Keep the rate limits of the websockets (off by default)"
+    )
+    args = parser.parse_args()
+    if args.wishlists > args.members:
+        parser.error("Every wishlist needs at least one member")
+
+    setup_django()
+
+    from django.conf import settings
+
+    # The frames of the test are sent much faster than the clients would
+    settings.WEBSOCKET_RATE_LIMITING = args.rate_limiting
+
+    with benchmark_database():
+        rooms = create_rooms(args.members, args.wishlists, args.wishes_per_member)
+        results = asyncio.run(run(rooms, args))
+
+    write_results("websocket_load", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Helpers shared by the benchmarks, which are run as modules: python -m benchmarks.<name>
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+from contextlib import contextmanager
+
+
+def setup_django():
+    """Configure Django the same way as manage.py"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "simplewishlist.settings")
+
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def benchmark_database():
+    """Run the benchmark against a throwaway test database, like the test runner does"""
+    from django.db import connection
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        # The consumers may leave connections open in their worker threads
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()",
+                [connection.settings_dict["NAME"]],
+            )
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+async def drain(communicators):
+    """Read every pending message of the communicators"""
+
+    async def drain_one(communicator):
+        while not await communicator.receive_nothing(timeout=0.05):
+            await communicator.receive_output()
+
+    await asyncio.gather(*(drain_one(communicator) for communicator in communicators))
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of the values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    """Summary of latencies given in seconds, reported in milliseconds"""
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0) * 1000, 3),
+    }
+
+
+def base_argument_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    return parser
+
+
+def write_results(name: str, results: dict, output: str | None = None):
+    """Write the results as JSON, so that they can be compared across releases"""
+    content = json.dumps({"benchmark": name, "results": results}, indent=2)
+    if output:
+        with open(output, "w") as file:
+            file.write(content + "\n")
+    else:
+        sys.stdout.write(content + "\n")
@@ -1,18 +1,62 @@
 from django.contrib import admin
 
+from api.authentication_cache import authentication_cache
+from api.RedisForWishList import RedisForWishList
 from core.models import Wish, WishList, WishListUser
 
 
 @admin.register(Wish)
 class WishAdmin(admin.ModelAdmin):
-    pass
+    # The wishes changed outside of the websocket can not be replayed, the members load the wishlist again
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        RedisForWishList().record_wishlist_resync(obj.wishlist_id)
+
+    def delete_model(self, request, obj):
+        RedisForWishList().record_wishlist_resync(obj.wishlist_id)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for wishlist_id in queryset.values_list("wishlist_id", flat=True).distinct():
+            RedisForWishList().record_wishlist_resync(wishlist_id)
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(WishList)
 class WishListAdmin(admin.ModelAdmin):
-    pass
+    # The users are cached with their wishlist, and the settings are part of the wishlist the members load
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        authentication_cache.invalidate_wishlist_users(obj.id)
+        RedisForWishList().record_wishlist_resync(obj.id)
+
+    def delete_model(self, request, obj):
+        authentication_cache.invalidate_wishlist_users(obj.id)
+        RedisForWishList().record_wishlist_resync(obj.id)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for wishlist_id in queryset.values_list("id", flat=True):
+            authentication_cache.invalidate_wishlist_users(wishlist_id)
+            RedisForWishList().record_wishlist_resync(wishlist_id)
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(WishListUser)
 class WishListUserAdmin(admin.ModelAdmin):
-    pass
+    # The users are part of the wishlist the members load
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        authentication_cache.invalidate_users([obj.id])
+        RedisForWishList().record_wishlist_resync(obj.wishlist_id)
+
+    def delete_model(self, request, obj):
+        authentication_cache.invalidate_users([obj.id])
+        RedisForWishList().record_wishlist_resync(obj.wishlist_id)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        authentication_cache.invalidate_users(list(queryset.values_list("id", flat=True)))
+        for wishlist_id in queryset.values_list("wishlist_id", flat=True).distinct():
+            RedisForWishList().record_wishlist_resync(wishlist_id)
+        super().delete_queryset(request, queryset)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_add_suggested_by_field'),
+    ]
+
+    operations = [
+        # The new indexes are created before the foreign key indexes they replace are dropped
+        # The index of WishListUser.wishlist is replaced by the unique constraint of 0012
+        migrations.AddIndex(
+            model_name='wish',
+            index=models.Index(condition=models.Q(('suggested_by__isnull', True)), fields=['wishlist_user'], name='wish_own_wishes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wish',
+            index=models.Index(condition=models.Q(('assigned_user__isnull', False)), fields=['assigned_user'], name='wish_assigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wishlistuser',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['wishlist', 'name'], name='wishlistuser_active_idx'),
+        ),
+        migrations.AlterField(
+            model_name='wish',
+            name='assigned_user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_wishes', to='core.wishlistuser'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+import logging
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+
+def check_duplicated_users(apps, schema_editor):
+    """
+    Refuse to migrate while users share their name with another user of the same wishlist, before the names become
+    unique, and list them so that they are renamed first
+    With RENAME_DUPLICATED_WISHLIST_USERS, one of the users keeps the name and the others are renamed
+    "<name> (2)", "<name> (3)"...
+    """
+    WishListUser = apps.get_model("core", "WishListUser")
+
+    duplicates = list(
+        WishListUser.objects.values("wishlist_id", "name").annotate(count=Count("id")).filter(count__gt=1)
+    )
+    if not duplicates:
+        return
+
+    if not settings.RENAME_DUPLICATED_WISHLIST_USERS:
+        listed = "\n".join(
+            f"  Wishlist {duplicate['wishlist_id']}: {duplicate['count']} users named {duplicate['name']!r}"
+            for duplicate in duplicates
+        )
+        raise RuntimeError(
+            "The user names become unique in each wishlist, rename these users first "
+            f"(or migrate with RENAME_DUPLICATED_WISHLIST_USERS=True to rename them automatically):\n{listed}"
+        )
+
+    max_length = WishListUser._meta.get_field("name").max_length
+    for duplicate in duplicates:
+        wishlist_users = WishListUser.objects.filter(wishlist_id=duplicate["wishlist_id"])
+        names = set(wishlist_users.values_list("name", flat=True))
+        users = wishlist_users.filter(name=duplicate["name"]).order_by("pk")
+
+        # The user keeping the name is arbitrary, but always the same
+        for user in users[1:]:
+            suffix = 2
+            while (new_name := f"{user.name[: max_length - len(f' ({suffix})')]} ({suffix})") in names:
+                suffix += 1
+            logger.warning(
+                "Wishlist %s: user %s renamed from %r to %r", duplicate["wishlist_id"], user.pk, user.name, new_name
+            )
+            names.add(new_name)
+            user.name = new_name
+            user.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_wish_and_wishlistuser_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicated_users, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_rename_duplicated_wishlist_users'),
+    ]
+
+    operations = [
+        # The unique index starts with the wishlist: it replaces the index of the foreign key, dropped once it exists
+        migrations.AddConstraint(
+            model_name='wishlistuser',
+            constraint=models.UniqueConstraint(fields=('wishlist', 'name'), name='wishlistuser_unique_name'),
+        ),
+        migrations.AlterField(
+            model_name='wishlistuser',
+            name='wishlist',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='wishlist_users', to='core.wishlist'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_wishlistuser_unique_name"),
+    ]
+
+    operations = [
+        # Nullable until the existing wishes are backfilled (0014)
+        migrations.AddField(
+            model_name="wish",
+            name="wishlist",
+            field=models.ForeignKey(
+                editable=False,
+                help_text="The wishlist of wishlist_user, kept in sync so that the wishes of a wishlist are read without join",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="wishes",
+                to="core.wishlist",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def backfill_wishlist(apps, schema_editor):
+    """Copy the wishlist of the owner to the wishes, one transaction per batch so the table is never locked long"""
+    Wish = apps.get_model("core", "Wish")
+    WishListUser = apps.get_model("core", "WishListUser")
+    owner_wishlist = WishListUser.objects.filter(pk=OuterRef("wishlist_user_id")).values("wishlist_id")[:1]
+
+    while True:
+        with transaction.atomic():
+            batch = list(Wish.objects.filter(wishlist__isnull=True).values_list("pk", flat=True)[:BATCH_SIZE])
+            if not batch:
+                return
+            Wish.objects.filter(pk__in=batch).update(wishlist_id=Subquery(owner_wishlist))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("core", "0013_wish_wishlist"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_wishlist, reverse_code=migrations.RunPython.noop),
+    ]
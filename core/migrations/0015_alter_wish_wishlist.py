@@ -0,0 +1,23 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_backfill_wish_wishlist"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="wish",
+            name="wishlist",
+            field=models.ForeignKey(
+                editable=False,
+                help_text="The wishlist of wishlist_user, kept in sync so that the wishes of a wishlist are read without join",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="wishes",
+                to="core.wishlist",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:19
+
+import core.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_alter_wish_wishlist'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wish',
+            name='id',
+            field=models.UUIDField(default=core.utils.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='wishlist',
+            name='id',
+            field=models.UUIDField(default=core.utils.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='wishlistuser',
+            name='id',
+            field=models.UUIDField(default=core.utils.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -1,12 +1,14 @@
 import uuid
 
 from django.db import models
+from django.shortcuts import get_object_or_404
 
 from api.exceptions import SimpleWishlistValidationError
+from core.utils import uuid7
 
 
 class Wish(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=255)
     price = models.CharField(max_length=15, blank=True, null=True)
     url = models.URLField(blank=True, null=True)
@@ -17,6 +19,8 @@ class Wish(models.Model):
         blank=True,
         null=True,
         related_name="assigned_wishes",
+        # Most wishes are not assigned, only the assigned ones are indexed (see Meta.indexes)
+        db_index=False,
     )
     wishlist_user = models.ForeignKey(
         "WishListUser",
@@ -24,6 +28,13 @@ class Wish(models.Model):
         related_name="wishes",
         help_text="The wish belongs to this user",
     )
+    wishlist = models.ForeignKey(
+        "WishList",
+        on_delete=models.CASCADE,
+        related_name="wishes",
+        editable=False,
+        help_text="The wishlist of wishlist_user, kept in sync so that the wishes of a wishlist are read without join",
+    )
     suggested_by = models.ForeignKey(
         "WishListUser",
         on_delete=models.SET_NULL,
@@ -39,6 +50,15 @@ class Wish(models.Model):
     def __str__(self):
         return f"Wish de {self.wishlist_user}"
 
+    def save(self, *args, **kwargs):
+        """Keep the wishlist of the wish in sync with the wishlist of its user"""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"wishlist_user", "wishlist_user_id"} & set(update_fields):
+            self.wishlist_id = self.wishlist_user.wishlist_id
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "wishlist"}
+        super().save(*args, **kwargs)
+
     def validate_assigned_user(self, candidate_assigned_user_id: str | None, current_user_id: uuid.UUID) -> bool:
         """Validate the candidate_assigned_user change conditions"""
         currently_assigned_user = self.assigned_user
@@ -77,6 +97,9 @@ class Wish(models.Model):
         """
         from core.models import WishListUser
 
+        # Only the changed columns are written
+        updated_fields = []
+
         # Dynamic update of the instance fields
         for attr, value in update_data.items():
             if attr == "assigned_user":
@@ -127,7 +150,68 @@ class Wish(models.Model):
 
                 setattr(self, attr, value)
 
-        self.save()
+            updated_fields.append(self._meta.get_field(attr).attname)
+
+        self.save(update_fields=updated_fields)
+
+    @classmethod
+    def set_assigned_user(
+        cls, wish_id: uuid.UUID, candidate_assigned_user_id: str | None, current_user_id: uuid.UUID
+    ) -> "Wish":
+        """
+        Assign the wish to the current user, or de-assign it, with a conditional UPDATE:
+        the conditions of validate_assigned_user are checked by the database at the time of the write,
+        so when two users claim the same wish at once, only the first one gets it and the other one gets an error.
+        A deleted wish is deleted for good once de-assigned.
+
+        Returns:
+            Wish: The wish as written, with its users loaded.
+            A wish that was deleted for good is returned with deleted=True and no assigned user.
+        """
+        # Compare UUID with UUID
+        if candidate_assigned_user_id is not None:
+            candidate_assigned_user_id = uuid.UUID(str(candidate_assigned_user_id))
+            # Only the current user can assign himself
+            if candidate_assigned_user_id != current_user_id:
+                raise SimpleWishlistValidationError(
+                    model="Wish",
+                    field="assigned_user",
+                    message="Modifying assigned user unauthorized",
+                )
+            # Nobody took the wish yet, and it is not the wish of the user
+            updated = (
+                cls.objects.filter(pk=wish_id, assigned_user__isnull=True)
+                .exclude(wishlist_user_id=current_user_id)
+                .update(assigned_user_id=current_user_id)
+            )
+        else:
+            # One can de-assign oneself but no one else can
+            updated = cls.objects.filter(pk=wish_id, assigned_user_id=current_user_id, deleted=False).update(
+                assigned_user_id=None
+            )
+
+        wish = get_object_or_404(
+            cls.objects.select_related("wishlist_user", "assigned_user", "suggested_by"), pk=wish_id
+        )
+
+        if not updated:
+            if candidate_assigned_user_id is None and wish.deleted and wish.assigned_user_id == current_user_id:
+                # Nobody needs to see the deleted wish anymore
+                updated, _ = cls.objects.filter(pk=wish_id, assigned_user_id=current_user_id, deleted=True).delete()
+                wish.assigned_user = None
+            elif candidate_assigned_user_id is None and wish.assigned_user_id is None:
+                # We are not trying to change anything
+                return wish
+
+            if not updated:
+                # The conditions were not met, or someone else changed the assigned user first
+                raise SimpleWishlistValidationError(
+                    model="Wish",
+                    field="assigned_user",
+                    message="Modifying assigned user unauthorized",
+                )
+
+        return wish
 
     def mark_deleted(self):
         """
@@ -160,3 +244,13 @@ class Wish(models.Model):
 
     class Meta:
         verbose_name_plural = "wishes"
+        indexes = [
+            # The wishes of a user without the wishes suggested by the others
+            models.Index(
+                fields=["wishlist_user"], condition=models.Q(suggested_by__isnull=True), name="wish_own_wishes_idx"
+            ),
+            # The wishes assigned to a user (assigned_wishes)
+            models.Index(
+                fields=["assigned_user"], condition=models.Q(assigned_user__isnull=False), name="wish_assigned_idx"
+            ),
+        ]
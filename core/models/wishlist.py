@@ -1,10 +1,10 @@
-import uuid
-
 from django.db import models
 
+from core.utils import uuid7
+
 
 class WishList(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     wishlist_name = models.CharField(max_length=100)
     is_surprise_mode_enabled = models.BooleanField(default=True)
     show_users = models.BooleanField(default=False)
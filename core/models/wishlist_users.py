@@ -1,17 +1,36 @@
-import uuid
-
 from django.db import models
 
+from core.utils import uuid7
+
 
 class WishListUser(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True, help_text="Is the user allowed to participate in the wishlist?")
-    wishlist = models.ForeignKey("WishList", on_delete=models.CASCADE, related_name="wishlist_users")
+    # Indexed by the unique constraint and the index below, which start with the wishlist
+    wishlist = models.ForeignKey("WishList", on_delete=models.CASCADE, related_name="wishlist_users", db_index=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """The wishes of a user moved to another wishlist move with them"""
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if not adding and (update_fields is None or {"wishlist", "wishlist_id"} & set(update_fields)):
+            self.wishes.exclude(wishlist_id=self.wishlist_id).update(wishlist_id=self.wishlist_id)
+
     class Meta:
         verbose_name = "Wishlist user"
         verbose_name_plural = "Wishlist users"
+        constraints = [
+            # The users are told apart by their name, its index also serves WishList.get_users
+            models.UniqueConstraint(fields=["wishlist", "name"], name="wishlistuser_unique_name"),
+        ]
+        indexes = [
+            # WishList.get_active_users
+            models.Index(
+                fields=["wishlist", "name"], condition=models.Q(is_active=True), name="wishlistuser_active_idx"
+            ),
+        ]
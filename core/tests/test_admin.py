@@ -0,0 +1,56 @@
+from django.contrib import admin
+from django.test import RequestFactory
+
+from api.RedisForWishList import RedisForWishList
+from api.tests.factories import WishListUserFactory
+from api.tests.utils import SimpleWishlistBaseTestCase
+from core.models import WishList, WishListUser
+
+
+class TestAdminResync(SimpleWishlistBaseTestCase):
+    """The changes made in the admin can not be replayed: the members of the wishlist load it again"""
+
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().post("/")
+        self.redis_for_wishlist = RedisForWishList()
+        self.version = self.redis_for_wishlist.get_wishlist_version(self.wishlist.id)
+
+    def assertResyncRecorded(self, wishlist_id=None):
+        wishlist_id = wishlist_id or self.wishlist.id
+        changes = self.redis_for_wishlist.get_wishlist_changes(wishlist_id, since=self.version)
+        self.assertEqual([change["action"] for change in changes], ["resync"])
+
+    def test_save_wishlist(self):
+        self.wishlist.show_users = not self.wishlist.show_users
+
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site.get_model_admin(WishList).save_model(self.request, self.wishlist, None, True)
+
+        self.assertResyncRecorded()
+
+    def test_save_user(self):
+        user = WishListUser.objects.get(id=self.second_user.id)
+        user.is_active = False
+
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site.get_model_admin(WishListUser).save_model(self.request, user, None, True)
+
+        self.assertResyncRecorded()
+
+    def test_delete_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site.get_model_admin(WishListUser).delete_model(self.request, self.second_user)
+
+        self.assertResyncRecorded()
+
+    def test_delete_users(self):
+        """Test that one resync is recorded by wishlist."""
+        WishListUserFactory(name="Carol", wishlist=self.wishlist)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site.get_model_admin(WishListUser).delete_queryset(
+                self.request, WishListUser.objects.filter(wishlist=self.wishlist).exclude(id=self.user.id)
+            )
+
+        self.assertResyncRecorded()
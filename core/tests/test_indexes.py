@@ -0,0 +1,85 @@
+import json
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+
+from core.models import Wish, WishList, WishListUser
+
+# Same order of magnitude as the benchmarks
+WISHLISTS = 500
+USERS_PER_WISHLIST = 10
+WISHES_PER_USER = 5
+
+
+def get_scanned_tables(plan: dict, scan_type: str) -> list[str]:
+    """Tables read with this type of scan anywhere in the EXPLAIN (FORMAT JSON) plan"""
+    tables = [plan["Relation Name"]] if plan["Node Type"] == scan_type else []
+    for subplan in plan.get("Plans", []):
+        tables += get_scanned_tables(subplan, scan_type)
+    return tables
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "The query plans are checked on PostgreSQL")
+class TestHotQueriesUseIndexes(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        wishlists = WishList.objects.bulk_create(WishList(wishlist_name=f"Wishlist {i}") for i in range(WISHLISTS))
+        users = WishListUser.objects.bulk_create(
+            WishListUser(name=f"User {i}", wishlist=wishlist, is_active=i != USERS_PER_WISHLIST - 1)
+            for wishlist in wishlists
+            for i in range(USERS_PER_WISHLIST)
+        )
+        wishes = []
+        for index, user in enumerate(users):
+            # The other users of the same wishlist
+            first_user = index - index % USERS_PER_WISHLIST
+            others = [other for other in users[first_user : first_user + USERS_PER_WISHLIST] if other != user]
+            for i in range(WISHES_PER_USER):
+                # 3 wishes out of 10 assigned, 1 out of 10 suggested, by various users
+                position = index * WISHES_PER_USER + i
+                wishes.append(
+                    Wish(
+                        name=f"Wish {i}",
+                        wishlist_user=user,
+                        wishlist_id=user.wishlist_id,
+                        assigned_user=others[position % len(others)] if position % 10 < 3 else None,
+                        suggested_by=others[(position // 10) % len(others)] if position % 10 == 9 else None,
+                    )
+                )
+        Wish.objects.bulk_create(wishes, batch_size=5000)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {WishList._meta.db_table}, {WishListUser._meta.db_table}, {Wish._meta.db_table}")
+
+        cls.wishlist = wishlists[WISHLISTS // 2]
+        cls.user = users[len(users) // 2]
+
+    def assertNoSequentialScan(self, queryset, tables: list[str] = None):
+        """The tables default to the table of the queryset and the tables joined"""
+        plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+        scanned_tables = get_scanned_tables(plan, "Seq Scan")
+        if tables is not None:
+            scanned_tables = [table for table in scanned_tables if table in tables]
+        self.assertEqual(scanned_tables, [], queryset.explain())
+
+    def test_get_active_users(self):
+        self.assertNoSequentialScan(self.wishlist.get_active_users())
+
+    def test_get_users(self):
+        self.assertNoSequentialScan(self.wishlist.get_users())
+        self.assertNoSequentialScan(self.wishlist.get_users(exclude_users_ids=[self.user.id]))
+
+    def test_own_wishes(self):
+        self.assertNoSequentialScan(self.user.wishes.exclude(suggested_by__isnull=False))
+
+    def test_assigned_wishes(self):
+        self.assertNoSequentialScan(self.user.assigned_wishes.all())
+
+    def test_wishlist_wishes(self):
+        """The wishes loaded with the users of the wishlist (get_all_users_wishes)"""
+        # The users joined by primary key may be hashed whole, the wishes are the ones to find
+        self.assertNoSequentialScan(
+            Wish.objects.select_related("assigned_user", "suggested_by").filter(wishlist=self.wishlist),
+            tables=[Wish._meta.db_table],
+        )
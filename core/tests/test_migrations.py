@@ -0,0 +1,48 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+
+BEFORE_UNIQUE_NAMES = [("core", "0010_wish_and_wishlistuser_indexes")]
+UNIQUE_NAMES = [("core", "0011_rename_duplicated_wishlist_users")]
+
+
+class TestUniqueNamesMigration(TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        executor = MigrationExecutor(connection)
+        executor.migrate(BEFORE_UNIQUE_NAMES)
+        apps = executor.loader.project_state(BEFORE_UNIQUE_NAMES).apps
+        WishList, WishListUser = apps.get_model("core", "WishList"), apps.get_model("core", "WishListUser")
+
+        self.WishList = WishList
+        self.wishlist = WishList.objects.create(wishlist_name="Wishlist")
+        for name in ["Bob", "Bob", "Bob (2)", "Alice"]:
+            WishListUser.objects.create(name=name, wishlist=self.wishlist)
+
+    def tearDown(self):
+        # The duplicated users would stop the migrations
+        self.WishList.objects.all().delete()
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(UNIQUE_NAMES)
+        return executor.loader.project_state(UNIQUE_NAMES).apps.get_model("core", "WishListUser")
+
+    def test_duplicated_names_are_reported(self):
+        """Test that the migration fails and lists the users sharing their name."""
+        with self.assertRaisesMessage(RuntimeError, f"Wishlist {self.wishlist.id}: 2 users named 'Bob'"):
+            self.migrate()
+
+    @override_settings(RENAME_DUPLICATED_WISHLIST_USERS=True)
+    def test_duplicated_names_are_renamed(self):
+        with self.assertLogs("core.migrations.0011_rename_duplicated_wishlist_users", level="WARNING"):
+            WishListUser = self.migrate()
+
+        self.assertEqual(
+            sorted(WishListUser.objects.filter(wishlist_id=self.wishlist.id).values_list("name", flat=True)),
+            ["Alice", "Bob", "Bob (2)", "Bob (3)"],
+        )
@@ -2,9 +2,13 @@ import random
 from unittest.mock import patch
 from uuid import UUID
 
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+
 from api.exceptions import SimpleWishlistValidationError
 from api.pydantic_models import WishModelUpdate
-from api.tests.factories import WishFactory, WishListUserFactory
+from api.tests.factories import WishFactory, WishListFactory, WishListUserFactory
 from api.tests.utils import SimpleWishlistBaseTestCase
 from core.models import Wish, WishListUser
 
@@ -22,9 +26,17 @@ class TestWishListUser(SimpleWishlistBaseTestCase):
         )
 
     def test_wishlist_user_creation(self):
-        user = WishListUser.objects.create(name="Bob", wishlist=self.wishlist)
+        user = WishListUser.objects.create(name="Paul", wishlist=self.wishlist)
         self.assertTrue(isinstance(user, WishListUser))
 
+    def test_wishlist_user_names_are_unique_in_a_wishlist(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            WishListUser.objects.create(name=self.user.name, wishlist=self.wishlist)
+
+        # The same name can be used in another wishlist
+        other_user = WishListUserFactory.create(name=self.user.name)
+        self.assertNotEqual(other_user.wishlist_id, self.wishlist.id)
+
 
 class TestWish(SimpleWishlistBaseTestCase):
     def setUp(self):
@@ -54,6 +66,27 @@ class TestWish(SimpleWishlistBaseTestCase):
     def test_wish_creation(self):
         wish = Wish.objects.create(name="Wish Test", price="12€", wishlist_user=self.user)
         self.assertTrue(isinstance(wish, Wish))
+        # The wishlist of the owner is copied to the wish
+        self.assertEqual(wish.wishlist_id, self.wishlist.id)
+
+    def test_wishes_follow_their_user_to_another_wishlist(self):
+        other_wishlist = WishListFactory.create()
+
+        self.user.wishlist = other_wishlist
+        self.user.save()
+
+        self.assertEqual(
+            set(Wish.objects.filter(wishlist_user=self.user).values_list("wishlist_id", flat=True)), {other_wishlist.id}
+        )
+
+    def test_wish_given_to_another_user(self):
+        other_user = WishListUserFactory.create(name="Elsewhere")
+
+        self.unassigned_wish.wishlist_user = other_user
+        self.unassigned_wish.save(update_fields=["wishlist_user"])
+
+        self.unassigned_wish.refresh_from_db()
+        self.assertEqual(self.unassigned_wish.wishlist_id, other_user.wishlist_id)
 
     def test_validate_assigned_user_only_current_assigned_can_update(self):
         """Test that assigned user conditions"""
@@ -164,6 +197,75 @@ class TestWish(SimpleWishlistBaseTestCase):
         self.unassigned_wish.update(current_user_id=self.second_user.id, update_data=update_data)
         self.assertEqual(self.unassigned_wish.assigned_user, None)
 
+    @patch.object(Wish, "validate_assigned_user", return_value=True)  # already tested
+    def test_update_writes_only_changed_columns(self, validate_user_mock):
+        update_data = WishModelUpdate(name="Another Name").dict(exclude_unset=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.unassigned_wish.update(current_user_id=self.user.id, update_data=update_data)
+
+        update_query = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")][0]
+        self.assertIn('"name"', update_query)
+        self.assertNotIn('"price"', update_query)
+
+    def test_set_assigned_user(self):
+        # The check and the write are one query, the wish is then loaded with its users
+        with self.assertNumQueries(2):
+            wish = Wish.set_assigned_user(self.unassigned_wish.id, str(self.second_user.id), self.second_user.id)
+
+        self.assertEqual(wish.assigned_user, self.second_user)
+        self.unassigned_wish.refresh_from_db()
+        self.assertEqual(self.unassigned_wish.assigned_user, self.second_user)
+
+    def test_set_assigned_user_already_assigned(self):
+        # Someone else took the wish first
+        with self.assertRaisesRegex(SimpleWishlistValidationError, "Modifying assigned user unauthorized"):
+            Wish.set_assigned_user(self.assigned_wish.id, str(self.wrong_user.id), self.wrong_user.id)
+
+        self.assigned_wish.refresh_from_db()
+        self.assertEqual(self.assigned_wish.assigned_user, self.second_user)
+
+    def test_set_assigned_user_unauthorized(self):
+        # The owner of the wish can not take it
+        with self.assertRaisesRegex(SimpleWishlistValidationError, "Modifying assigned user unauthorized"):
+            Wish.set_assigned_user(self.unassigned_wish.id, str(self.user.id), self.user.id)
+        # Nobody can assign someone else, without querying the database
+        with self.assertNumQueries(0):
+            with self.assertRaisesRegex(SimpleWishlistValidationError, "Modifying assigned user unauthorized"):
+                Wish.set_assigned_user(self.unassigned_wish.id, str(self.second_user.id), self.wrong_user.id)
+
+        self.unassigned_wish.refresh_from_db()
+        self.assertIsNone(self.unassigned_wish.assigned_user)
+
+    def test_set_assigned_user_de_assign(self):
+        # Only the assigned user can de-assign himself
+        with self.assertRaisesRegex(SimpleWishlistValidationError, "Modifying assigned user unauthorized"):
+            Wish.set_assigned_user(self.assigned_wish.id, None, self.wrong_user.id)
+
+        wish = Wish.set_assigned_user(self.assigned_wish.id, None, self.second_user.id)
+        self.assertIsNone(wish.assigned_user)
+        self.assigned_wish.refresh_from_db()
+        self.assertIsNone(self.assigned_wish.assigned_user)
+
+        # Nothing to change
+        wish = Wish.set_assigned_user(self.assigned_wish.id, None, self.second_user.id)
+        self.assertIsNone(wish.assigned_user)
+
+    def test_set_assigned_user_de_assign_deleted_wish(self):
+        # Once de-assigned, a deleted wish is deleted for good
+        self.assigned_wish.mark_deleted()
+
+        wish = Wish.set_assigned_user(self.assigned_wish.id, None, self.second_user.id)
+
+        self.assertTrue(wish.deleted)
+        self.assertIsNone(wish.assigned_user)
+        self.assertFalse(Wish.objects.filter(id=self.assigned_wish.id).exists())
+
+    def test_set_assigned_user_does_not_exist(self):
+        fake_uuid = UUID(int=random.getrandbits(128), version=4)
+        with self.assertRaises(Http404):
+            Wish.set_assigned_user(fake_uuid, str(self.second_user.id), self.second_user.id)
+
 
 class TestWishList(SimpleWishlistBaseTestCase):
     def setUp(self):
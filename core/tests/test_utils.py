@@ -0,0 +1,27 @@
+import time
+import uuid
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.utils import uuid7
+
+
+class TestUUID7(SimpleTestCase):
+    def test_version_and_time(self):
+        before_ms = time.time_ns() // 1_000_000
+        value = uuid7()
+
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+        self.assertGreaterEqual(value.int >> 80, before_ms)
+
+    def test_ids_keep_increasing(self):
+        ids = [uuid7() for _ in range(10000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_ids_keep_increasing_when_the_clock_goes_backwards(self):
+        first = uuid7()
+        with patch("core.utils.time.time_ns", return_value=0):
+            self.assertGreater(uuid7(), first)
@@ -0,0 +1,37 @@
+import os
+import threading
+import time
+import uuid
+
+_uuid7_lock = threading.Lock()
+_uuid7_last_timestamp_ms = 0
+_uuid7_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Time-ordered UUID (RFC 9562 version 7), used as default primary key
+    48 bits of Unix time in milliseconds, then a 12 bits counter and 62 random bits.
+    New rows are inserted at the end of the primary key indexes instead of anywhere, as with uuid4.
+    The counter keeps the ids created by the process in the same millisecond increasing.
+    """
+    global _uuid7_last_timestamp_ms, _uuid7_counter
+
+    with _uuid7_lock:
+        timestamp_ms = time.time_ns() // 1_000_000
+        if timestamp_ms > _uuid7_last_timestamp_ms:
+            # Random start, so that the ids of different processes are not likely to collide on the counter
+            _uuid7_counter = int.from_bytes(os.urandom(2)) & 0x7FF
+        else:
+            # Same millisecond, or the clock went backwards: keep increasing
+            timestamp_ms = _uuid7_last_timestamp_ms
+            _uuid7_counter += 1
+            if _uuid7_counter > 0xFFF:
+                timestamp_ms += 1
+                _uuid7_counter = 0
+        _uuid7_last_timestamp_ms = timestamp_ms
+        counter = _uuid7_counter
+
+    random_bits = int.from_bytes(os.urandom(8)) & 0x3FFF_FFFF_FFFF_FFFF
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | random_bits
+    return uuid.UUID(int=value)
@@ -1,23 +1,103 @@
+import hashlib
+from functools import wraps
 from uuid import UUID
 
-from django.shortcuts import get_object_or_404
-from ninja import NinjaAPI
+from django.http import HttpRequest, HttpResponseNotModified
+from django.utils.http import parse_etags
+from ninja import NinjaAPI, Router
+from ninja.parser import Parser
+from ninja.renderers import JSONRenderer
 from ninja.security import HttpBearer
 
+from api.RedisForWishList import RedisForWishList
 from api.api import router as api_router
-from core.models import WishListUser
+from api.authentication_cache import authentication_cache
 from django.conf import settings
+from simplewishlist.renderers import ORJSONRenderer, ORJSONParser
 
 
 class AuthBearer(HttpBearer):
     def authenticate(self, request, token):
         try:
-            return get_object_or_404(WishListUser, id=UUID(token))
+            # The user comes with its wishlist, from the cache when possible
+            return authentication_cache.get_user(UUID(token))
         except ValueError:
             # ValueError if the token is not uuid
             return None
 
 
-api = NinjaAPI(auth=AuthBearer(), docs_url="/docs" if settings.DEBUG else None)
+def get_wishlist_etag(request: HttpRequest, wishlist_id: UUID | str | None) -> str | None:
+    """
+    Strong ETag of a GET response, derived from the version of the wishlist
+    The response also depends on the path and on who is asking (e.g. the current user is the first one)
+    """
+    if wishlist_id is None:
+        return None
+
+    # Only authenticated users ensure the wishlist exists, do not create versions for any wishlist id
+    current_user = getattr(request, "auth", None)
+    version = RedisForWishList().get_wishlist_version(wishlist_id, create=current_user is not None)
+    if version is None:
+        return None
+
+    current_user_id = current_user.id if current_user else ""
+    digest = hashlib.sha256(f"{request.get_full_path()}:{version}:{current_user_id}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def conditional_on_wishlist_version(view_func):
+    """
+    Answer 304 Not Modified without running the view when the If-None-Match header matches the current ETag
+    The wishlist is the one of the current user, or the one given in the path for unauthenticated routes
+    """
+
+    @wraps(view_func)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        current_user = getattr(request, "auth", None)
+        wishlist_id = current_user.wishlist_id if current_user else kwargs.get("wishlist_id")
+        etag = get_wishlist_etag(request, wishlist_id)
+
+        if etag:
+            if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+            # If-None-Match uses the weak comparison
+            if "*" in if_none_match or etag in [tag.removeprefix("W/") for tag in if_none_match]:
+                response = HttpResponseNotModified()
+                response.headers["ETag"] = etag
+                return response
+
+            # Set on the response by SimpleWishlistAPI.create_response
+            request.wishlist_etag = etag
+
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+class SimpleWishlistAPI(NinjaAPI):
+    """NinjaAPI where every GET route answers conditional requests based on the wishlist version"""
+
+    def add_router(self, prefix: str, router: Router, **kwargs) -> None:
+        super().add_router(prefix, router, **kwargs)
+        for path_view in router.path_operations.values():
+            for operation in path_view.operations:
+                if "GET" in operation.methods:
+                    operation.view_func = conditional_on_wishlist_version(operation.view_func)
+
+    def create_response(self, request: HttpRequest, data, *, status=None, temporal_response=None):
+        response = super().create_response(request, data, status=status, temporal_response=temporal_response)
+        etag = getattr(request, "wishlist_etag", None)
+        if etag and response.status_code == 200:
+            response.headers["ETag"] = etag
+        return response
+
+
+if settings.API_JSON_BACKEND == "orjson":
+    renderer, parser = ORJSONRenderer(), ORJSONParser()
+else:
+    renderer, parser = JSONRenderer(), Parser()
+
+api = SimpleWishlistAPI(
+    auth=AuthBearer(), docs_url="/docs" if settings.DEBUG else None, renderer=renderer, parser=parser
+)
 
 api.add_router("/v1/", api_router)
@@ -0,0 +1,165 @@
+# Channel layer keeping the messages in the process, for the deployments running a single process
+import asyncio
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    """
+    Channel layer delivering the messages between the consumers of this process, without Redis nor serialization
+
+    Unlike channels' InMemoryChannelLayer, which is meant for the tests:
+    - group_send costs one queue insertion per member of the group, the expired messages and memberships are cleaned
+      at most once every expiry seconds instead of on every message of every channel
+    - the queues are bounded by capacity (and channel_capacity): a member whose queue is full misses the group
+      message, send raises ChannelFull
+    - the messages are not deep copied, each receiver gets a shallow copy
+    The members of a group in another process do not receive anything: only for a single process.
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.group_expiry = group_expiry
+        # channel: queue of (expires_at, message)
+        self.channels: dict[str, asyncio.Queue] = {}
+        # group: {channel: joined_at}, and the other way around
+        self.groups: dict[str, dict[str, float]] = {}
+        self.channel_groups: dict[str, set[str]] = defaultdict(set)
+        self.next_clean_at = time.monotonic() + self.expiry
+        # sent, dropped (full queue), expired
+        self.metrics = Counter()
+
+    # Channel layer API
+
+    async def send(self, channel: str, message: dict):
+        """Send a message onto a channel, raise ChannelFull when its queue is full"""
+        if not isinstance(message, dict):
+            raise TypeError("message is not a dict")
+        self.valid_channel_name(channel)
+        self._clean_expired()
+        self._put(channel, message)
+
+    def _put(self, channel: str, message: dict):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        try:
+            queue.put_nowait((time.monotonic() + self.expiry, dict(message)))
+        except asyncio.QueueFull:
+            self.metrics["dropped"] += 1
+            raise ChannelFull(channel)
+        self.metrics["sent"] += 1
+
+    async def receive(self, channel: str) -> dict:
+        """Receive the next message of the channel that has not expired"""
+        self.valid_channel_name(channel)
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+
+        try:
+            while True:
+                expires_at, message = await queue.get()
+                if expires_at >= time.monotonic():
+                    return message
+                self.metrics["expired"] += 1
+        finally:
+            # Nothing left for a channel nobody listens to anymore
+            if queue.empty() and self.channels.get(channel) is queue:
+                del self.channels[channel]
+
+    async def new_channel(self, prefix: str = "specific.") -> str:
+        return f"{prefix}.local!{uuid.uuid4().hex}"
+
+    # Groups extension
+
+    async def group_add(self, group: str, channel: str):
+        self.valid_group_name(group)
+        self.valid_channel_name(channel)
+        self.groups.setdefault(group, {})[channel] = time.monotonic()
+        self.channel_groups[channel].add(group)
+
+    async def group_discard(self, group: str, channel: str):
+        self.valid_group_name(group)
+        self.valid_channel_name(channel)
+        self._discard(group, channel)
+
+    def _discard(self, group: str, channel: str):
+        members = self.groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del self.groups[group]
+        channel_groups = self.channel_groups.get(channel)
+        if channel_groups is not None:
+            channel_groups.discard(group)
+            if not channel_groups:
+                del self.channel_groups[channel]
+
+    async def group_send(self, group: str, message: dict):
+        """Send the message to every member of the group, skipping the members whose queue is full"""
+        if not isinstance(message, dict):
+            raise TypeError("message is not a dict")
+        self.valid_group_name(group)
+        self._clean_expired()
+        for channel in list(self.groups.get(group, ())):
+            try:
+                self._put(channel, message)
+            except ChannelFull:
+                pass
+
+    # Flush extension
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+        self.channel_groups = defaultdict(set)
+
+    async def close(self):
+        pass
+
+    # Expiry
+
+    def _clean_expired(self):
+        """
+        At most once every expiry seconds: drop the expired messages, and the queues left empty by them,
+        and end the group memberships older than group_expiry
+        A channel keeps its groups: its consumer may only have been slower than expiry for a while
+        """
+        now = time.monotonic()
+        if now < self.next_clean_at:
+            return
+        self.next_clean_at = now + self.expiry
+
+        for channel, queue in list(self.channels.items()):
+            # The messages expire in the order they were queued, an empty queue may have a receiver waiting on it
+            if queue.empty() or queue._queue[0][0] >= now:
+                continue
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+                self.metrics["expired"] += 1
+            if queue.empty():
+                del self.channels[channel]
+
+        joined_before = now - self.group_expiry
+        for group, members in list(self.groups.items()):
+            for channel, joined_at in list(members.items()):
+                if joined_at < joined_before:
+                    self._discard(group, channel)
+
+    def get_metrics(self) -> dict:
+        """Messages sent, dropped because of full queues and expired, channels and groups in memory"""
+        return {
+            "sent": self.metrics["sent"],
+            "dropped": self.metrics["dropped"],
+            "expired": self.metrics["expired"],
+            "channels": len(self.channels),
+            "groups": len(self.groups),
+        }
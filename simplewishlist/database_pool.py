@@ -0,0 +1,32 @@
+# Metrics of the database connection pool of the process (DATABASE_POOL)
+from django.db import connections
+
+
+def get_database_pool_metrics(alias: str = "default") -> dict | None:
+    """
+    Size, saturation and wait times of the connection pool, None when the connections are not pooled
+    The counters (requests, waits, timeouts) count since the process started
+    """
+    # Only the PostgreSQL backend has a pool, None when it is not configured
+    pool = getattr(connections[alias], "pool", None)
+    if pool is None:
+        return None
+
+    stats = pool.get_stats()
+    in_use = stats["pool_size"] - stats["pool_available"]
+    queued = stats.get("requests_queued", 0)
+    return {
+        "size": stats["pool_size"],
+        "max_size": stats["pool_max"],
+        "in_use": in_use,
+        # 1 when every connection the pool may open is used
+        "saturation": round(in_use / stats["pool_max"], 3),
+        "waiting": stats.get("requests_waiting", 0),
+        "requests": stats.get("requests_num", 0),
+        # Requests that had to wait for a connection, and for how long in total
+        "queued_requests": queued,
+        "wait_ms": stats.get("requests_wait_ms", 0),
+        "average_wait_ms": round(stats.get("requests_wait_ms", 0) / queued, 3) if queued else 0,
+        "timeouts": stats.get("requests_errors", 0),
+        "connection_errors": stats.get("connections_errors", 0),
+    }
@@ -0,0 +1,83 @@
+# Routing of the reads of the read-only endpoints to the optional replica database
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+REPLICA_DATABASE = "replica"
+
+# Set while a read-only endpoint runs, everything else (writes, consumers, authentication...) uses the primary
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+def replica_is_configured() -> bool:
+    return REPLICA_DATABASE in settings.DATABASES
+
+
+def replica_pin_key(wishlist_id) -> str:
+    return f"replica_pin_{wishlist_id}"
+
+
+def pin_wishlist_to_primary(wishlist_id) -> None:
+    """
+    The wishlist just changed: its reads go to the primary for DATABASE_REPLICA_STICKY_SECONDS, until the replica has
+    the change. Should be called before the change is visible to others (new version of the wishlist...)
+    """
+    if replica_is_configured():
+        cache.set(replica_pin_key(wishlist_id), True, timeout=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+@contextmanager
+def read_from_replica(wishlist_id):
+    """Send the reads to the replica, unless the wishlist changed recently"""
+    if not replica_is_configured() or cache.get(replica_pin_key(wishlist_id)):
+        yield
+        return
+
+    token = _read_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def replica_reads(get_wishlist_id: Callable) -> Callable:
+    """
+    Decorator of the read-only views: their reads go to the replica
+    get_wishlist_id(request, **kwargs) returns the wishlist read by the view
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with read_from_replica(get_wishlist_id(request, **kwargs)):
+                return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ReplicaRouter:
+    """Read from the replica inside read_from_replica, from the primary ("default") otherwise"""
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get():
+            return REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both databases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets the schema from the primary
+        if db == REPLICA_DATABASE:
+            return False
+        return None
@@ -0,0 +1,34 @@
+# Metrics of the process serving the request, for the operators (staff users of the admin)
+import os
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from api.coalescing import broadcast_coalescer
+from api.consumers import get_outbound_metrics
+from api.rate_limiting import get_rate_limit_metrics
+from simplewishlist.database_pool import get_database_pool_metrics
+
+
+def get_process_metrics() -> dict:
+    """Metrics of this process: each worker has its own, the counters count since it started"""
+    channel_layer = get_channel_layer()
+    return {
+        "pid": os.getpid(),
+        # The databases with a connection pool
+        "database_pools": {
+            alias: metrics for alias in settings.DATABASES if (metrics := get_database_pool_metrics(alias)) is not None
+        },
+        # Only the channel layers of this repository count their messages
+        "channel_layer": channel_layer.get_metrics() if hasattr(channel_layer, "get_metrics") else None,
+        "websocket_coalescing": broadcast_coalescer.get_metrics(),
+        "websocket_outbound": get_outbound_metrics(),
+        "websocket_rate_limits": get_rate_limit_metrics(),
+    }
+
+
+@staff_member_required
+def metrics_view(request):
+    return JsonResponse(get_process_metrics())
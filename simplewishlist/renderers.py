@@ -0,0 +1,45 @@
+import datetime
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest
+from ninja.parser import Parser
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+from ninja.types import DictStrAny
+from pydantic import BaseModel
+
+# Types orjson does not serialize, or not the way the stdlib renderer does (e.g. the precision of the datetimes)
+# are left to NinjaJSONEncoder so that both renderers give the same responses
+NINJA_JSON_ENCODER = NinjaJSONEncoder()
+
+
+def orjson_default(o: Any) -> Any:
+    if isinstance(o, BaseModel):
+        return o.model_dump()
+    if isinstance(o, (Decimal, datetime.datetime, datetime.date, datetime.time)):
+        return DjangoJSONEncoder.default(NINJA_JSON_ENCODER, o)
+    return NINJA_JSON_ENCODER.default(o)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON renderer based on orjson
+    UUIDs are serialized natively, AnyUrl and the other types through NinjaJSONEncoder
+    The camelCase aliases of BaseSchema are applied by Ninja before the rendering (by_alias=True)
+    """
+
+    media_type = "application/json"
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> bytes:
+        return orjson.dumps(data, default=orjson_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+class ORJSONParser(Parser):
+    """JSON parser based on orjson"""
+
+    def parse_body(self, request: HttpRequest) -> DictStrAny:
+        # orjson.JSONDecodeError is a json.JSONDecodeError, invalid bodies are handled as with the default parser
+        return orjson.loads(request.body)
@@ -82,14 +82,61 @@ TEMPLATES = [
 WSGI_APPLICATION = "simplewishlist.wsgi.application"
 ASGI_APPLICATION = "simplewishlist.asgi.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [(os.environ["REDIS_HOST"], os.environ["REDIS_PORT"])],
+# JSON library used to render the responses and parse the requests of the API: "orjson" or "json" (stdlib)
+API_JSON_BACKEND = os.environ.get("API_JSON_BACKEND", "orjson")
+
+# Channel layer of the websockets: "redis", or "local" for the deployments running a single process (no Redis round trip)
+CHANNEL_LAYER = os.environ.get("CHANNEL_LAYER", "redis")
+if CHANNEL_LAYER == "local":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "simplewishlist.channel_layers.LocalChannelLayer",
+            "CONFIG": {
+                # Messages waiting per consumer, seconds before a message or a group membership expires
+                "capacity": int(os.environ.get("CHANNEL_LAYER_CAPACITY", "100")),
+                "expiry": int(os.environ.get("CHANNEL_LAYER_EXPIRY", "60")),
+                "group_expiry": int(os.environ.get("CHANNEL_LAYER_GROUP_EXPIRY", str(24 * 60 * 60))),
+            },
         },
-    },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [(os.environ["REDIS_HOST"], os.environ["REDIS_PORT"])],
+            },
+        },
+    }
+
+# Number of threads running the database queries of the websocket consumers, per process
+WEBSOCKET_DB_THREADS = int(os.environ.get("WEBSOCKET_DB_THREADS", "10"))
+# Encode the group broadcasts to JSON once at the sender instead of once per receiving consumer
+WEBSOCKET_PRE_ENCODED_BROADCASTS = os.environ.get("WEBSOCKET_PRE_ENCODED_BROADCASTS", "True") == "True"
+# Merge the wish updates sent to a room within this window (0 disables it), but never delay an update more than the max
+WEBSOCKET_COALESCING_WINDOW_MS = int(os.environ.get("WEBSOCKET_COALESCING_WINDOW_MS", "0"))
+WEBSOCKET_COALESCING_MAX_DELAY_MS = int(os.environ.get("WEBSOCKET_COALESCING_MAX_DELAY_MS", "250"))
+# Messages waiting to be written to a websocket before its client is considered too slow and disconnected to resync
+WEBSOCKET_OUTBOUND_QUEUE_SIZE = int(os.environ.get("WEBSOCKET_OUTBOUND_QUEUE_SIZE", "64"))
+# Limit the messages the websocket clients send, the throttled ones get an error_message
+WEBSOCKET_RATE_LIMITING = os.environ.get("WEBSOCKET_RATE_LIMITING", "True") == "True"
+# Messages each connection may send by type ("default" for the other types): tokens refilled per second, and burst
+# A batch costs its operations, a batch bigger than the burst is refused
+WEBSOCKET_CONNECTION_RATE_LIMITS = {
+    "create_wish": {"rate": 1, "burst": 10},
+    "update_wish": {"rate": 5, "burst": 20},
+    "delete_wish": {"rate": 1, "burst": 10},
+    "default": {"rate": 5, "burst": 20},
+}
+# The same for all the connections of a wishlist together
+WEBSOCKET_WISHLIST_RATE_LIMITS = {
+    "create_wish": {"rate": 5, "burst": 30},
+    "update_wish": {"rate": 20, "burst": 60},
+    "delete_wish": {"rate": 5, "burst": 30},
+    "default": {"rate": 20, "burst": 60},
 }
+# Count the messages of the wishlists in Redis, across all the processes, instead of in each process
+WEBSOCKET_GLOBAL_RATE_LIMITS = os.environ.get("WEBSOCKET_GLOBAL_RATE_LIMITS", "False") == "True"
 
 CACHES = {
     "default": {
@@ -100,12 +147,33 @@ CACHES = {
         },
     }
 }
+# Rename the users sharing their name in a wishlist when migrating to unique names (core 0011), instead of failing
+RENAME_DUPLICATED_WISHLIST_USERS = os.environ.get("RENAME_DUPLICATED_WISHLIST_USERS", "False") == "True"
+# Cache of the users authenticated by the API, in Redis and in each process (seconds)
+AUTH_CACHE_TIMEOUT = int(os.environ.get("AUTH_CACHE_TIMEOUT", str(60 * 60)))
+AUTH_CACHE_LOCAL_TIMEOUT = float(os.environ.get("AUTH_CACHE_LOCAL_TIMEOUT", "5"))
+AUTH_CACHE_LOCAL_MAX_SIZE = int(os.environ.get("AUTH_CACHE_LOCAL_MAX_SIZE", "10000"))
+
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Threads of the sync_to_async executor running the sync views (same default as asgiref)
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+# Pool of database connections of each process (psycopg 3), the connections are reused instead of opened per request
+# Each gunicorn worker has its own pool: workers * DATABASE_POOL_MAX_SIZE must stay below the max_connections of Postgres
+DATABASE_POOL = os.environ.get("DATABASE_POOL", "True") == "True"
+DATABASE_POOL_MIN_SIZE = int(os.environ.get("DATABASE_POOL_MIN_SIZE", "2"))
+# Every thread running queries may hold a connection: the websocket consumers' threads and the views' threads
+DATABASE_POOL_MAX_SIZE = int(os.environ.get("DATABASE_POOL_MAX_SIZE", str(WEBSOCKET_DB_THREADS + ASGI_THREADS)))
+# Seconds waiting for a connection before failing, an idle connection is closed, a connection is replaced
+DATABASE_POOL_TIMEOUT = float(os.environ.get("DATABASE_POOL_TIMEOUT", "10"))
+DATABASE_POOL_MAX_IDLE = float(os.environ.get("DATABASE_POOL_MAX_IDLE", str(10 * 60)))
+DATABASE_POOL_MAX_LIFETIME = float(os.environ.get("DATABASE_POOL_MAX_LIFETIME", str(60 * 60)))
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -114,9 +182,37 @@ DATABASES = {
         "PASSWORD": os.environ["POSTGRES_PASSWORD"],
         "HOST": os.environ["POSTGRES_HOST"],
         "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        # Check the connections before using them: a connection closed by the server is replaced
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": DATABASE_POOL
+            and {
+                "name": "default",
+                "min_size": DATABASE_POOL_MIN_SIZE,
+                "max_size": DATABASE_POOL_MAX_SIZE,
+                "timeout": DATABASE_POOL_TIMEOUT,
+                "max_idle": DATABASE_POOL_MAX_IDLE,
+                "max_lifetime": DATABASE_POOL_MAX_LIFETIME,
+            },
+        },
     }
 }
 
+# Optional read replica: the read-only endpoints of a wishlist read from it (simplewishlist.db_router)
+if os.environ.get("POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get("POSTGRES_REPLICA_DB", DATABASES["default"]["NAME"]),
+        "HOST": os.environ["POSTGRES_REPLICA_HOST"],
+        "PORT": os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "OPTIONS": {"pool": DATABASE_POOL and {**DATABASES["default"]["OPTIONS"]["pool"], "name": "replica"}},
+        # The tests read the replica data from the primary
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["simplewishlist.db_router.ReplicaRouter"]
+# After a change of a wishlist, its reads stay on the primary for this long (seconds), more than the replication lag
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", "5"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
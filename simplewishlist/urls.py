@@ -20,8 +20,10 @@ from django.urls import path, include
 
 from django.conf import settings
 from .api import api
+from .metrics import metrics_view
 
 urlpatterns = [
+    path(f"{settings.ADMIN_URL}/metrics/", metrics_view, name="metrics"),
     path(f"{settings.ADMIN_URL}/", admin.site.urls),
     path("api/", api.urls),
     path("oidc/", include("django_oidc_admin.urls")),